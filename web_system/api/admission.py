@@ -0,0 +1,183 @@
+"""
+Admission control for iRembo Backend API
+
+Uploads, AI processing and certificate generation decode images and run
+models, so a burst of them at once exhausts memory and slows every request.
+Each of these endpoints holds a slot of a named ``AdmissionLimiter`` while
+it runs: up to ``concurrency`` requests run, up to ``queue_size`` more wait
+in FIFO order for at most ``ADMISSION_QUEUE_TIMEOUT_SECONDS``, and the rest
+are turned away with ``Retry-After``:
+
+- ``429`` when one account already holds ``per_account`` running or
+  waiting requests on that endpoint
+- ``503`` when the wait queue is full or the wait timed out
+
+Requests are attributed to the ``X-Account-ID`` header or the ``account_id``
+query or form field. Anonymous requests are bounded by the concurrency and
+queue limits only: the client address would put every citizen behind one NAT
+or reverse proxy under a single account's cap. Limits apply per API process.
+"""
+
+import asyncio
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, Optional
+
+from fastapi import HTTPException, Request
+
+from config import settings
+from metrics import metrics
+
+# Weight of the latest request in the service-time average behind Retry-After
+SERVICE_TIME_SMOOTHING = 0.2
+
+
+class AdmissionLimiter:
+    """Concurrency limit with a bounded FIFO wait queue and a per-account cap"""
+
+    def __init__(self, name: str, concurrency: int, queue_size: int, per_account: int, queue_timeout: float):
+        self.name = name
+        self.concurrency = max(1, concurrency)
+        self.queue_size = max(0, queue_size)
+        self.per_account = per_account
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._accounts: Dict[str, int] = {}
+        self._service_time = 1.0
+
+    def retry_after(self) -> int:
+        """Seconds until the current backlog should have drained"""
+        backlog = len(self._waiters) + self.active
+        return max(1, math.ceil(self._service_time * backlog / self.concurrency))
+
+    def _reject(self, status_code: int, reason: str, detail: str):
+        metrics.inc("admission_rejected", endpoint=self.name, reason=reason)
+        raise HTTPException(status_code=status_code, detail=detail,
+                            headers={"Retry-After": str(self.retry_after())})
+
+    def _report(self):
+        metrics.set("admission_active", self.active, endpoint=self.name)
+        metrics.set("admission_queued", len(self._waiters), endpoint=self.name)
+
+    def _release(self):
+        # Hand the slot straight to the oldest live waiter
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                self._report()
+                return
+        self.active -= 1
+        self._report()
+
+    async def _wait(self):
+        if len(self._waiters) >= self.queue_size:
+            self._reject(503, "queue_full", f"Too many {self.name} requests in progress; try again later")
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self._report()
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(waiter, self.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled():
+                # Granted a slot just as the wait ended; pass it on
+                self._release()
+            elif waiter in self._waiters:
+                self._waiters.remove(waiter)
+                self._report()
+            if isinstance(e, asyncio.TimeoutError):
+                self._reject(503, "timeout", f"Timed out waiting for a {self.name} slot; try again later")
+            raise
+        finally:
+            metrics.observe("admission_wait_seconds", time.monotonic() - started, endpoint=self.name)
+
+    @asynccontextmanager
+    async def admit(self, account: Optional[str] = None):
+        """Hold a slot for the duration of the block, or raise 429/503"""
+        if account and self.per_account > 0 and self._accounts.get(account, 0) >= self.per_account:
+            self._reject(429, "account", f"Too many concurrent {self.name} requests for this account")
+
+        if account:
+            self._accounts[account] = self._accounts.get(account, 0) + 1
+        try:
+            if self.active < self.concurrency and not self._waiters:
+                self.active += 1
+                self._report()
+            else:
+                await self._wait()
+
+            metrics.inc("admission_admitted", endpoint=self.name)
+            started = time.monotonic()
+            try:
+                yield
+            finally:
+                elapsed = time.monotonic() - started
+                self._service_time += SERVICE_TIME_SMOOTHING * (elapsed - self._service_time)
+                metrics.observe("admission_service_seconds", elapsed, endpoint=self.name)
+                self._release()
+        finally:
+            if account:
+                remaining = self._accounts.get(account, 1) - 1
+                if remaining > 0:
+                    self._accounts[account] = remaining
+                else:
+                    self._accounts.pop(account, None)
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "concurrency": self.concurrency,
+            "queue_size": self.queue_size,
+            "per_account": self.per_account,
+            "active": self.active,
+            "queued": len(self._waiters),
+            "admitted": metrics.counter("admission_admitted", endpoint=self.name),
+            "rejected": sum(
+                metrics.counter("admission_rejected", endpoint=self.name, reason=reason)
+                for reason in ("account", "queue_full", "timeout")
+            ),
+            "avg_service_seconds": round(self._service_time, 3),
+        }
+
+
+limiters = {
+    "upload": AdmissionLimiter(
+        "upload", settings.admission_upload_concurrency, settings.admission_upload_queue,
+        settings.admission_upload_per_account, settings.admission_queue_timeout_seconds
+    ),
+    "ai-process": AdmissionLimiter(
+        "ai-process", settings.admission_ai_process_concurrency, settings.admission_ai_process_queue,
+        settings.admission_ai_process_per_account, settings.admission_queue_timeout_seconds
+    ),
+    "certificate": AdmissionLimiter(
+        "certificate", settings.admission_certificate_concurrency, settings.admission_certificate_queue,
+        settings.admission_certificate_per_account, settings.admission_queue_timeout_seconds
+    ),
+}
+
+
+async def _account_key(request: Request) -> Optional[str]:
+    account = request.headers.get("x-account-id") or request.query_params.get("account_id")
+    if not account and request.headers.get("content-type", "").startswith(("multipart/form-data",
+                                                                        "application/x-www-form-urlencoded")):
+        # Already parsed for the endpoint's Form parameters; Starlette caches it
+        account = (await request.form()).get("account_id")
+    return account if isinstance(account, str) else None
+
+
+def admission(name: str):
+    """FastAPI dependency that holds a slot of the named limiter for the request"""
+    limiter = limiters[name]
+
+    async def dependency(request: Request):
+        async with limiter.admit(await _account_key(request)):
+            yield
+
+    return dependency
+
+
+def admission_stats() -> Dict[str, Dict[str, float]]:
+    return {name: limiter.stats() for name, limiter in limiters.items()}
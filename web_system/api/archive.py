@@ -0,0 +1,348 @@
+"""
+Cold storage for finalized applications
+
+Applications in a final status (``ARCHIVE_STATUSES``) that have not changed
+for ``ARCHIVE_AFTER_DAYS`` are moved out of the ``applications`` table,
+together with their base64 document payloads, into append-only segment files
+under ``ARCHIVE_DIR``. Each application is written as its own compressed
+frame (gzip, or zstd when ``ARCHIVE_COMPRESSION=zstd`` and ``zstandard`` is
+installed) holding one JSON line, so a segment is also a valid
+``.jsonl.gz`` / ``.jsonl.zst`` stream:
+
+    zcat archive/applications-000001.jsonl.gz | head
+
+The ``archived_applications`` table is the offset index: segment, byte
+offset and length of every archived application, plus the columns needed to
+find it. The detail, document and download endpoints fall back to it when an
+application is no longer in the hot table. Archived applications leave the
+list endpoints, and delta sync clients get a tombstone for them.
+
+A batch is written and fsynced before its rows are deleted, and a row that
+changed in the meantime is kept, so an interrupted run never loses data; at
+worst a segment holds unreferenced frames. JSON columns are archived as JSON
+text (never SQLite's binary JSONB), and a row is only deleted once its frame
+reads back with the same documents and AI results. After archiving, the freed space
+is reclaimed with ``VACUUM``.
+
+Usage (from web_system/api):
+    python archive.py
+    python archive.py --older-than-days 180 --no-vacuum
+
+Verification workers also run it every ``ARCHIVE_INTERVAL_HOURS`` when that
+is set. Segments live on the local disk of the host that archives, so the
+API must run on that host (or share ``ARCHIVE_DIR``).
+"""
+
+import argparse
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from config import settings
+from database import DB_PATH, get_db_connection, get_db_cursor, format_query, using_postgres, execute_write_sync
+from events import application_archival
+from json_columns import JSON_COLUMNS, json_select, decode_json
+from metrics import metrics
+from utils import logger
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+SEGMENT_PREFIX = "applications-"
+EXTENSIONS = {"gzip": ".jsonl.gz", "zstd": ".jsonl.zst"}
+_SEGMENT_NAME = re.compile(r"^applications-(\d{6})\.jsonl\.(gz|zst)$")
+
+
+def create_archive_tables(cursor):
+    """Create the archive offset index (same DDL on both backends)"""
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS archived_applications (
+        application_id TEXT PRIMARY KEY,
+        account_id TEXT,
+        citizen_id TEXT,
+        document_type TEXT,
+        status TEXT,
+        created_at TEXT,
+        archived_at TEXT,
+        segment TEXT,
+        byte_offset BIGINT,
+        byte_length INTEGER
+    )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_archived_applications_account ON archived_applications (account_id)")
+
+
+# ==================== SEGMENTS ====================
+
+def _codec() -> str:
+    if settings.archive_compression == "zstd" and zstandard is not None:
+        return "zstd"
+    return "gzip"
+
+
+def _compress(data: bytes, codec: str) -> bytes:
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=settings.archive_compression_level).compress(data)
+    # wbits 31: a complete gzip member, so members concatenate into a valid .gz file
+    compressor = zlib.compressobj(settings.archive_compression_level, zlib.DEFLATED, 31)
+    return compressor.compress(data) + compressor.flush()
+
+
+def _decompress(frame: bytes, segment: str) -> bytes:
+    if segment.endswith(".zst"):
+        if zstandard is None:
+            raise RuntimeError(f"zstandard is required to read {segment}")
+        return zstandard.ZstdDecompressor().decompress(frame)
+    return zlib.decompress(frame, 31)
+
+
+class SegmentWriter:
+    """Appends compressed frames to the newest segment, starting a new one when it is full"""
+
+    def __init__(self, directory: str, max_bytes: int, codec: str):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.codec = codec
+        os.makedirs(directory, exist_ok=True)
+
+    def _current(self) -> Tuple[str, int]:
+        existing = {}
+        for name in os.listdir(self.directory):
+            match = _SEGMENT_NAME.match(name)
+            if match:
+                existing[int(match.group(1))] = name
+        number = max(existing, default=1)
+        name = f"{SEGMENT_PREFIX}{number:06d}{EXTENSIONS[self.codec]}"
+        if number in existing and (
+            existing[number] != name
+            or os.path.getsize(os.path.join(self.directory, existing[number])) >= self.max_bytes
+        ):
+            # Full, or written with another codec: start the next segment
+            number += 1
+            name = f"{SEGMENT_PREFIX}{number:06d}{EXTENSIONS[self.codec]}"
+        path = os.path.join(self.directory, name)
+        return name, os.path.getsize(path) if os.path.exists(path) else 0
+
+    def append(self, records: List[Dict]) -> List[Tuple[str, int, int]]:
+        """Write records (one frame each) and fsync; returns (segment, offset, length) per record"""
+        name, offset = self._current()
+        locations = []
+        with open(os.path.join(self.directory, name), "ab") as f:
+            for record in records:
+                frame = _compress(json.dumps(record, default=str).encode() + b"\n", self.codec)
+                f.write(frame)
+                locations.append((name, offset, len(frame)))
+                offset += len(frame)
+            f.flush()
+            os.fsync(f.fileno())
+        return locations
+
+
+def read_frame(segment: str, offset: int, length: int) -> Dict:
+    """Decode one archived record"""
+    if not _SEGMENT_NAME.match(segment):
+        raise ValueError(f"Invalid segment name {segment!r}")
+    with open(os.path.join(settings.archive_dir, segment), "rb") as f:
+        f.seek(offset)
+        frame = f.read(length)
+    return json.loads(_decompress(frame, segment))
+
+
+# ==================== LOOKUP ====================
+
+def archived_application(application_id: str) -> Optional[Dict]:
+    """Full row of an archived application (JSON columns still encoded), or None"""
+    conn = get_db_connection()
+    cursor = get_db_cursor(conn)
+    cursor.execute(format_query(
+        "SELECT segment, byte_offset, byte_length FROM archived_applications WHERE application_id = ?"
+    ), (application_id,))
+    row = cursor.fetchone()
+    conn.close()
+    if not row:
+        return None
+    metrics.inc("archive_reads")
+    return read_frame(row["segment"], row["byte_offset"], row["byte_length"])
+
+
+# ==================== ARCHIVAL ====================
+
+_local_lock = threading.Lock()
+
+
+@contextmanager
+def _archive_lock():
+    """One archiver per host, across processes where fcntl is available"""
+    os.makedirs(settings.archive_dir, exist_ok=True)
+    with _local_lock, open(os.path.join(settings.archive_dir, ".lock"), "w") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        yield
+
+
+def _candidates(cutoff: str, statuses: List[str], limit: int, after: str = "") -> List[Dict]:
+    placeholders = ", ".join("?" for _ in statuses)
+    conn = get_db_connection()
+    cursor = get_db_cursor(conn)
+    # Every column, with the JSON ones as text (they may be stored as binary JSONB)
+    cursor.execute("SELECT * FROM applications LIMIT 0")
+    columns = ", ".join(
+        json_select(column[0]) if column[0] in JSON_COLUMNS else column[0] for column in cursor.description
+    )
+    cursor.execute(format_query(
+        f"SELECT {columns} FROM applications WHERE status IN ({placeholders}) "
+        "AND COALESCE(updated_at, created_at) < ? AND application_id > ? ORDER BY application_id LIMIT ?"
+    ), (*statuses, cutoff, after, limit))
+    rows = [dict(row) for row in cursor.fetchall()]
+    conn.close()
+    return rows
+
+
+def _frame_matches(row: Dict, location: Tuple[str, int, int]) -> bool:
+    """Whether the written frame decodes back to the row's JSON columns"""
+    try:
+        archived = read_frame(*location)
+        for column in JSON_COLUMNS:
+            original = decode_json(row.get(column))
+            if (row.get(column) is not None and original is None) or decode_json(archived.get(column)) != original:
+                raise ValueError(f"{column} does not round-trip")
+    except Exception as e:
+        logger.error("Archive frame of %s at %s failed verification, keeping the row: %s",
+                     row["application_id"], location, e)
+        return False
+    return True
+
+
+def _archive_statements(row: Dict, location: Tuple[str, int, int], archived_at: str) -> List[Tuple[str, tuple]]:
+    segment, offset, length = location
+    application_id = row["application_id"]
+    version = row.get("updated_at") or row.get("created_at")
+    # Every statement is guarded by the version that was archived; a row
+    # updated since then stays in the hot table (its frame goes unreferenced)
+    unchanged = "application_id = ? AND COALESCE(updated_at, created_at) = ?"
+    tombstone_query, tombstone_params = application_archival(application_id)
+    return [
+        (
+            "INSERT INTO archived_applications (application_id, account_id, citizen_id, document_type, status, "
+            "created_at, archived_at, segment, byte_offset, byte_length) "
+            f"SELECT application_id, account_id, citizen_id, document_type, status, created_at, ?, ?, ?, ? "
+            f"FROM applications WHERE {unchanged}",
+            (archived_at, segment, offset, length, application_id, version)
+        ),
+        (f"{tombstone_query} AND COALESCE(updated_at, created_at) = ?", (*tombstone_params, version)),
+        (
+            "DELETE FROM verification_jobs WHERE application_id IN "
+            f"(SELECT application_id FROM applications WHERE {unchanged})",
+            (application_id, version)
+        ),
+        (f"DELETE FROM applications WHERE {unchanged}", (application_id, version)),
+    ]
+
+
+def _count_archived(archived_at: str) -> int:
+    conn = get_db_connection()
+    cursor = get_db_cursor(conn)
+    cursor.execute(format_query("SELECT COUNT(*) AS n FROM archived_applications WHERE archived_at = ?"), (archived_at,))
+    count = cursor.fetchone()["n"]
+    conn.close()
+    return count
+
+
+def archive_applications(older_than_days: float = None, batch_size: int = None,
+                         max_batches: Optional[int] = None) -> Dict:
+    """Move old finalized applications to cold storage; returns a report"""
+    older_than_days = settings.archive_after_days if older_than_days is None else older_than_days
+    batch_size = max(1, batch_size or settings.archive_batch_size)
+    statuses = [s.strip() for s in settings.archive_statuses.split(",") if s.strip()]
+    cutoff = (datetime.utcnow() - timedelta(days=older_than_days)).isoformat()
+    writer = SegmentWriter(settings.archive_dir, settings.archive_segment_max_bytes, _codec())
+    report = {"archived": 0, "bytes_written": 0, "batches": 0}
+    started = time.perf_counter()
+    after = ""
+
+    with _archive_lock():
+        while max_batches is None or report["batches"] < max_batches:
+            # Keyset order, so rows kept back by a failed check are not picked again
+            rows = _candidates(cutoff, statuses, batch_size, after)
+            if not rows:
+                break
+            after = rows[-1]["application_id"]
+            archived_at = datetime.utcnow().isoformat()
+            locations = writer.append(rows)
+            statements = []
+            for row, location in zip(rows, locations):
+                if _frame_matches(row, location):
+                    statements.extend(_archive_statements(row, location, archived_at))
+                else:
+                    metrics.inc("archive_verify_errors")
+            # The batch's index rows, tombstones and deletes commit together
+            execute_write_sync(statements)
+            report["archived"] += _count_archived(archived_at)
+            report["bytes_written"] += sum(length for _, _, length in locations)
+            report["batches"] += 1
+            if len(rows) < batch_size:
+                break
+
+    report["seconds"] = round(time.perf_counter() - started, 3)
+    metrics.inc("archive_applications", report["archived"])
+    logger.info("Archived %d applications (%d bytes) in %.1fs",
+                report["archived"], report["bytes_written"], report["seconds"])
+    return report
+
+
+def reclaim_space():
+    """Return space freed by archival: VACUUM on SQLite, VACUUM ANALYZE on PostgreSQL"""
+    if using_postgres():
+        conn = get_db_connection()
+        try:
+            conn.autocommit = True
+            conn.cursor().execute("VACUUM ANALYZE applications")
+        finally:
+            conn.close()
+        return
+    # VACUUM cannot run inside a transaction or on the pooled production connection
+    conn = sqlite3.connect(DB_PATH, isolation_level=None, timeout=settings.sqlite_busy_timeout / 1000.0)
+    try:
+        conn.execute("VACUUM")
+    finally:
+        conn.close()
+
+
+def run_archival() -> Dict:
+    """Archive, then reclaim space when anything was moved"""
+    report = archive_applications()
+    if report["archived"] and settings.archive_vacuum:
+        reclaim_space()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Move old finalized applications to cold storage")
+    parser.add_argument("--older-than-days", type=float, help=f"Minimum age (default {settings.archive_after_days})")
+    parser.add_argument("--batch-size", type=int, help=f"Applications per batch (default {settings.archive_batch_size})")
+    parser.add_argument("--max-batches", type=int, help="Stop after this many batches")
+    parser.add_argument("--no-vacuum", action="store_true", help="Skip VACUUM afterwards")
+    args = parser.parse_args()
+
+    report = archive_applications(args.older_than_days, args.batch_size, args.max_batches)
+    if report["archived"] and not args.no_vacuum:
+        reclaim_space()
+    print(json.dumps(report))
+
+
+if __name__ == "__main__":
+    main()
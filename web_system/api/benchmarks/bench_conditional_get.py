@@ -0,0 +1,99 @@
+"""
+Bytes on the wire and latency of a dashboard list poll: full body vs
+compressed vs conditional GET
+
+Seeds a scratch SQLite database with applications carrying base64 document
+scans, then requests ``GET /api/applications?view=full`` through the app
+with no compression, gzip, brotli and with ``If-None-Match`` (304). Scans
+are random bytes, like real JPEG/PNG data, so compression mostly recovers
+the base64 overhead. The transfer estimate assumes the given link speed.
+
+Usage (from web_system/api):
+    python benchmarks/bench_conditional_get.py --rows 50 --iterations 50 --mbps 10
+"""
+
+import argparse
+import base64
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+os.environ.setdefault("USE_POSTGRESQL", "False")
+os.environ.setdefault("VERIFICATION_WORKER_AUTOSTART", "false")
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, API_DIR)
+os.chdir(tempfile.mkdtemp(prefix="bench_conditional_get_"))  # scratch irembo_verification.db
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+from main import app  # noqa: E402
+from compression import brotli  # noqa: E402
+from database import execute_write_sync  # noqa: E402
+from events import application_change  # noqa: E402
+from json_columns import json_placeholder  # noqa: E402
+
+
+def seed(rows: int, scan_bytes: int):
+    statements = []
+    for i in range(rows):
+        scan = base64.b64encode(os.urandom(scan_bytes)).decode()
+        application_id = f"APP-BENCH-{i:05d}"
+        documents = [{"doc_id": f"DOC-{i}-0", "name": "scan.png", "type": "image/png",
+                      "size": scan_bytes, "data": f"data:image/png;base64,{scan}"}]
+        ai_results = [{"doc_id": f"DOC-{i}-0", "confidence": 91.5, "authenticity": "authentic"}]
+        now = datetime.utcnow().isoformat()
+        statements.append((f'''
+            INSERT INTO applications (
+                application_id, citizen_name, citizen_email, citizen_id, account_id, document_type,
+                status, current_stage, created_at, priority, ai_results, documents, feedback, updated_at
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, {json_placeholder()}, {json_placeholder()}, ?, ?)
+        ''', (application_id, "Jane Citizen", "jane@example.com", f"1199880{i:09d}", "USR-BENCH",
+              "National ID", "pending", "irembo", now, "normal", json.dumps(ai_results),
+              json.dumps(documents), "AI Processing complete", now)))
+        statements.append(application_change(application_id))
+    execute_write_sync(statements)
+
+
+def measure(client: TestClient, params: dict, headers: dict, iterations: int):
+    response = client.get("/api/applications", params=params, headers=headers)
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        response = client.get("/api/applications", params=params, headers=headers)
+        timings.append((time.perf_counter() - start) * 1000)
+    # Body bytes as received, before httpx decodes the content encoding
+    return response.status_code, response.num_bytes_downloaded, statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=50)
+    parser.add_argument("--scan-kb", type=int, default=64, help="Size of each stored document scan")
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--mbps", type=float, default=10.0, help="Link speed for the transfer estimate")
+    args = parser.parse_args()
+
+    with TestClient(app) as client:
+        seed(args.rows, args.scan_kb * 1024)
+        params = {"view": "full", "per_page": min(args.rows, 100)}
+        etag = client.get("/api/applications", params=params).headers["etag"]
+
+        cases = [("identity", {"Accept-Encoding": "identity"}), ("gzip", {"Accept-Encoding": "gzip"})]
+        if brotli is not None:
+            cases.append(("br", {"Accept-Encoding": "br"}))
+        cases.append(("304", {"Accept-Encoding": "br, gzip", "If-None-Match": etag}))
+
+        print(f"rows per page: {params['per_page']}  scan: {args.scan_kb} KiB  link: {args.mbps} Mbit/s")
+        print(f"{'case':>9} {'status':>6} {'wire bytes':>12} {'server ms':>10} {'est. total ms':>14}")
+        for name, headers in cases:
+            status, wire, server_ms = measure(client, params, headers, args.iterations)
+            transfer_ms = wire * 8 / (args.mbps * 1_000_000) * 1000
+            print(f"{name:>9} {status:>6} {wire:>12} {server_ms:>10.2f} {server_ms + transfer_ms:>14.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Serialization cost of a 100-row application page: before vs after
+
+"before" decodes the stored JSON columns, validates a PaginatedResponse and
+encodes it the way FastAPI does for a returned model (jsonable_encoder +
+JSONResponse). "after" passes stored JSON through raw_json, skips
+validation with model_construct and renders with FastJSONResponse.
+
+Usage (from web_system/api):
+    python benchmarks/bench_serialization.py --rows 100 --iterations 200
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+os.environ.setdefault("USE_POSTGRESQL", "False")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from fastapi.responses import JSONResponse  # noqa: E402
+
+from models import PaginatedResponse  # noqa: E402
+from responses import FastJSONResponse, raw_json, orjson, _Fragment  # noqa: E402
+
+
+def make_rows(count: int) -> list:
+    """Rows as they come out of the database, JSON columns still as text"""
+    rows = []
+    for i in range(count):
+        ai_results = [
+            {
+                "doc_id": f"DOC-{i:04d}{d}",
+                "application_id": f"APP-{i:06d}",
+                "filename": f"scan_{d}.jpg",
+                "document_type": "National ID",
+                "confidence": round(random.uniform(60, 99), 2),
+                "authenticity": "authentic",
+                "quality_score": round(random.uniform(50, 99), 2),
+                "similarity_metrics": {"layout": "95%", "logo": "97%", "seal": "91%", "fonts": "90%"},
+                "feedback": ["Standard National ID layout detected.", "Forensic Integrity: 7.41"],
+            }
+            for d in range(3)
+        ]
+        rows.append({
+            "application_id": f"APP-{i:06d}",
+            "citizen_name": "Jane Citizen",
+            "citizen_email": "jane@example.com",
+            "citizen_id": "1199880012345678",
+            "document_type": "National ID",
+            "status": "pending",
+            "created_at": "2026-02-05T14:30:00",
+            "priority": "normal",
+            "ai_confidence": 91.2,
+            "ai_verdict": "authentic",
+            "ai_results": json.dumps(ai_results),
+            "feedback": "AI Processing complete: AUTHENTIC with 91.2% average confidence.",
+            "queue_position": i + 1,
+        })
+    return rows
+
+
+def before(rows: list) -> bytes:
+    data = []
+    for row in rows:
+        app = dict(row)
+        app["ai_results"] = json.loads(app["ai_results"])
+        data.append(app)
+    model = PaginatedResponse(total=len(data), page=1, per_page=len(data), data=data)
+    return JSONResponse(jsonable_encoder(model)).body
+
+
+def after(rows: list) -> bytes:
+    data = []
+    for row in rows:
+        app = dict(row)
+        app["ai_results"] = raw_json(app["ai_results"])
+        data.append(app)
+    model = PaginatedResponse.model_construct(total=len(data), page=1, per_page=len(data), data=data)
+    return FastJSONResponse(model).body
+
+
+def measure(fn, rows: list, iterations: int) -> float:
+    fn(rows)  # warm up
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn(rows)
+    return (time.perf_counter() - start) / iterations * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100)
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows)
+    assert json.loads(before(rows))["data"] == json.loads(after(rows))["data"]
+
+    encoder = "orjson" if orjson is not None else "json"
+    passthrough = "Fragment" if _Fragment is not None else "decode"
+    before_ms = measure(before, rows, args.iterations)
+    after_ms = measure(after, rows, args.iterations)
+    print(f"rows per page: {args.rows}  (encoder: {encoder}, raw JSON: {passthrough})")
+    print(f"before: {before_ms:8.3f} ms/page")
+    print(f" after: {after_ms:8.3f} ms/page")
+    print(f"speedup: {before_ms / after_ms:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Throughput benchmark: default SQLite settings vs the SQLite production profile
+
+Simulates concurrent uploads (INSERT), officer status updates (UPDATE) and
+status polls (SELECT) against a scratch database file.
+
+Usage (from web_system/api):
+    python benchmarks/bench_sqlite_profile.py --threads 8 --ops 200
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+os.environ.setdefault("USE_POSTGRESQL", "False")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+from config import settings  # noqa: E402
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS applications (
+    application_id TEXT PRIMARY KEY,
+    citizen_id TEXT,
+    document_type TEXT,
+    status TEXT,
+    created_at TEXT,
+    ai_results TEXT,
+    documents TEXT
+)
+"""
+INSERT_SQL = """
+INSERT INTO applications (application_id, citizen_id, document_type, status, created_at, ai_results, documents)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+UPDATE_SQL = "UPDATE applications SET status = ? WHERE application_id = ?"
+SELECT_SQL = "SELECT application_id, status FROM applications WHERE citizen_id = ? ORDER BY created_at DESC"
+
+PAYLOAD = json.dumps([{"doc_id": "DOC-1", "data": "x" * 4096}])
+
+
+def _insert_params(worker: int):
+    app_id = f"APP-{uuid.uuid4().hex}"
+    return app_id, (app_id, f"CIT-{worker}", "Passport", "pending", time.time(), "[]", PAYLOAD)
+
+
+def _baseline_worker(worker: int, ops: int, errors: list):
+    for _ in range(ops):
+        try:
+            app_id, params = _insert_params(worker)
+            conn = sqlite3.connect(database.DB_PATH)
+            conn.execute(INSERT_SQL, params)
+            conn.commit()
+            conn.close()
+
+            conn = sqlite3.connect(database.DB_PATH)
+            conn.execute(UPDATE_SQL, ("approved", app_id))
+            conn.commit()
+            conn.close()
+
+            conn = sqlite3.connect(database.DB_PATH)
+            conn.execute(SELECT_SQL, (f"CIT-{worker}",)).fetchall()
+            conn.close()
+        except sqlite3.Error as e:
+            errors.append(str(e))
+
+
+def _tuned_worker(worker: int, ops: int, errors: list):
+    writer = database.get_sqlite_writer()
+    for _ in range(ops):
+        try:
+            app_id, params = _insert_params(worker)
+            writer.submit([(INSERT_SQL, params)]).result()
+            writer.submit([(UPDATE_SQL, ("approved", app_id))]).result()
+
+            conn = database.get_db_connection()
+            conn.execute(SELECT_SQL, (f"CIT-{worker}",)).fetchall()
+            conn.close()
+        except sqlite3.Error as e:
+            errors.append(str(e))
+
+
+def run(label: str, target, threads: int, ops: int) -> dict:
+    errors: list = []
+    workers = [threading.Thread(target=target, args=(i, ops, errors)) for i in range(threads)]
+    start = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    elapsed = time.perf_counter() - start
+    total = threads * ops * 3
+    return {
+        "mode": label,
+        "threads": threads,
+        "operations": total,
+        "seconds": round(elapsed, 3),
+        "ops_per_sec": round(total / elapsed, 1),
+        "errors": len(errors),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--ops", type=int, default=200, help="insert/update/select rounds per thread")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DB_PATH = os.path.join(tmp, "baseline.db")
+        conn = sqlite3.connect(database.DB_PATH)
+        conn.execute(SCHEMA)
+        conn.close()
+        results.append(run("default", _baseline_worker, args.threads, args.ops))
+
+        settings.sqlite_production_mode = True
+        database.DB_PATH = os.path.join(tmp, "tuned.db")
+        conn = database.get_db_connection()
+        conn.execute(SCHEMA)
+        conn.commit()
+        results.append(run("production", _tuned_worker, args.threads, args.ops))
+
+    for r in results:
+        print(f"{r['mode']:>10}: {r['ops_per_sec']:>9} ops/s  ({r['operations']} ops in {r['seconds']}s, {r['errors']} errors)")
+    print(f"   speedup: {results[1]['ops_per_sec'] / results[0]['ops_per_sec']:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
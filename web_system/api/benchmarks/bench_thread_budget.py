@@ -0,0 +1,151 @@
+"""
+Tail latency of document scoring with and without the CPU thread budget
+
+Starts ``--processes`` scoring processes, as many API workers would, each
+scoring synthetic document scans from ``--threads`` threads for
+``--duration`` seconds. It runs twice: "unbounded", with BLAS, OpenCV and
+TensorFlow sizing their pools to every core, and "budget", with
+``apply_thread_budget`` (see thread_budget.py) splitting the cores between
+the processes. ``--pin`` also pins each process to its slice of cores.
+
+Documents go through ``AIService.predict`` when the model files are
+present. Otherwise the features are extracted as usual and a dense
+stand-in model (``--hidden`` units, NumPy/BLAS) replaces TensorFlow.
+
+The effect shows on machines with several cores; on one core both runs are
+the same.
+
+Usage (from web_system/api):
+    python benchmarks/bench_thread_budget.py --processes 4 --threads 2 --duration 20
+    python benchmarks/bench_thread_budget.py --processes 4 --pin
+"""
+
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, List
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(q / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def _scan(np, cv2, seed: int) -> bytes:
+    rng = np.random.default_rng(seed)
+    image = rng.integers(120, 255, (900, 1400, 3), dtype=np.uint8)
+    for _ in range(30):
+        x, y = int(rng.integers(0, 1300)), int(rng.integers(0, 850))
+        cv2.rectangle(image, (x, y), (x + 90, y + 30), (20, 20, 20), -1)
+    return cv2.imencode(".png", image)[1].tobytes()
+
+
+def _scorer(mode: str, processes: int, threads: int, duration: float, hidden: int, pin: bool,
+            start, results):
+    """One scoring process; runs with a fresh interpreter (spawn)"""
+    sys.path.insert(0, API_DIR)
+    from thread_budget import BLAS_THREAD_VARIABLES, apply_thread_budget
+    if mode == "budget":
+        apply_thread_budget(processes=processes, pin=pin)
+    else:
+        for name in BLAS_THREAD_VARIABLES + ("TF_NUM_INTRAOP_THREADS", "TF_NUM_INTEROP_THREADS"):
+            os.environ.pop(name, None)
+
+    import cv2
+    import numpy as np
+    from utils import AIService
+
+    service = AIService()
+    if service.model is not None:
+        score = service.predict
+    else:
+        rng = np.random.default_rng(0)
+        weights = [rng.standard_normal((8, hidden)).astype(np.float32),
+                   rng.standard_normal((hidden, hidden)).astype(np.float32),
+                   rng.standard_normal((hidden, 1)).astype(np.float32)]
+
+        def score(scan):
+            features, _ = service.extract_features(scan)
+            x = np.repeat(features.astype(np.float32), 256, axis=0)
+            for w in weights:
+                x = np.maximum(x @ w, 0)
+            return x
+
+    scans = [_scan(np, cv2, seed) for seed in range(8)]
+    score(scans[0])  # warm up pools and the model
+    latencies: List[float] = []
+
+    def loop(offset: int):
+        deadline = time.perf_counter() + duration
+        i = offset
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            score(scans[i % len(scans)])
+            latencies.append((time.perf_counter() - started) * 1000)
+            i += 1
+
+    start.wait()
+    workers = [threading.Thread(target=loop, args=(i,)) for i in range(threads)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    results.put(latencies)
+
+
+def run(mode: str, args) -> Dict:
+    context = multiprocessing.get_context("spawn")
+    start = context.Barrier(args.processes)
+    results = context.Queue()
+    scorers = [
+        context.Process(target=_scorer, args=(mode, args.processes, args.threads, args.duration, args.hidden,
+                                              args.pin, start, results))
+        for _ in range(args.processes)
+    ]
+    for p in scorers:
+        p.start()
+    latencies = sorted(ms for _ in scorers for ms in results.get())
+    for p in scorers:
+        p.join()
+    return {
+        "mode": mode,
+        "documents": len(latencies),
+        "docs_per_sec": round(len(latencies) / args.duration, 1),
+        "p50_ms": round(_percentile(latencies, 50), 1),
+        "p95_ms": round(_percentile(latencies, 95), 1),
+        "p99_ms": round(_percentile(latencies, 99), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--processes", type=int, default=4, help="Scoring processes (API workers)")
+    parser.add_argument("--threads", type=int, default=2, help="Concurrent documents per process")
+    parser.add_argument("--duration", type=float, default=20, help="Seconds of scoring per run")
+    parser.add_argument("--hidden", type=int, default=1024, help="Units of the stand-in model's layers")
+    parser.add_argument("--pin", action="store_true", help="Pin each process to its slice of cores")
+    args = parser.parse_args()
+
+    # Scratch slot directory so --pin never competes with a running API
+    os.environ["CPU_SLOT_DIR"] = tempfile.mkdtemp(prefix="cpu-slots-")
+    os.environ.setdefault("LOG_LEVEL", "warning")
+    results = [run("unbounded", args), run("budget", args)]
+
+    print(f"{args.processes} processes x {args.threads} threads on {os.cpu_count()} cores")
+    for r in results:
+        print(f"{r['mode']:>10}: {r['docs_per_sec']:>8} docs/s  p50 {r['p50_ms']:>8} ms  "
+              f"p95 {r['p95_ms']:>8} ms  p99 {r['p99_ms']:>8} ms")
+    if results[1]["p99_ms"]:
+        print(f"  p99 ratio: {results[0]['p99_ms'] / results[1]['p99_ms']:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,394 @@
+"""
+HTTP load test for the API with a realistic scenario mix
+
+Starts ``uvicorn main:app --workers N`` on a scratch SQLite database (or
+targets ``--url``), seeds applications, document requests and appeals, then
+runs closed-loop virtual users for ``--duration`` seconds. Each user picks a
+scenario by weight:
+
+    upload        citizen uploads a scan, then polls its verification status
+    poll          citizen dashboard refresh (own applications, conditional GET)
+    officer_list  officer loads the pending queue and document requests
+    officer_update officer updates an application's status
+    download      citizen downloads an approved document
+    appeal        citizen files an appeal and lists their appeals
+    doc_request   citizen requests a document and checks it
+
+Throughput, error rate and p50/p95/p99 latency are reported per endpoint and
+saved as JSON; ``--compare`` prints the change against an earlier run.
+
+Usage (from web_system/api):
+    python benchmarks/load_test.py --workers 4 --users 50 --duration 60
+    python benchmarks/load_test.py --url http://localhost:5000 --users 20
+    python benchmarks/load_test.py --compare benchmarks/results/load_20260101T120000.json
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import logging
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+os.environ.setdefault("USE_POSTGRESQL", "False")
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(API_DIR, "benchmarks", "results")
+
+SCENARIO_WEIGHTS = {
+    "upload": 5,
+    "poll": 40,
+    "officer_list": 20,
+    "officer_update": 8,
+    "download": 7,
+    "appeal": 10,
+    "doc_request": 10,
+}
+DOCUMENT_TYPES = ["National ID", "Passport", "Birth Certificate", "Driving License"]
+
+
+# ==================== SERVER AND DATA ====================
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(workers: int, port: int, data_dir: str, env: Dict[str, str]) -> subprocess.Popen:
+    """uvicorn as described in the README, with its database in ``data_dir``"""
+    # API_WORKERS sizes each worker's CPU thread budget (see thread_budget.py)
+    server_env = dict(os.environ, API_WORKERS=str(workers), **env)
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--app-dir", API_DIR, "--host", "127.0.0.1",
+         "--port", str(port), "--workers", str(workers), "--log-level", "warning"],
+        cwd=data_dir, env=server_env
+    )
+
+
+def wait_until_up(url: str, timeout: float = 120):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"{url}/health", timeout=2).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"Server at {url} did not come up within {timeout}s")
+
+
+def seed(data_dir: str, applications: int, citizens: int) -> Dict[str, List[str]]:
+    """Insert the dataset straight into the server's SQLite file (schema already created)"""
+    os.chdir(data_dir)
+    sys.path.insert(0, API_DIR)
+    from database import execute_write_sync
+    from events import application_change, document_request_change
+    from json_columns import json_placeholder
+
+    scan = "data:image/png;base64," + "iVBORw0KGgo" * 2000
+    start = datetime.utcnow() - timedelta(days=7)
+    statements = []
+    ids = {"approved": [], "pending": [], "citizens": [f"USR-LOAD-{i:04d}" for i in range(citizens)]}
+    for i in range(applications):
+        application_id = f"APP-LOAD-{i:06d}"
+        status = random.choices(["pending", "approved", "rejected"], weights=[6, 3, 1])[0]
+        ids["approved" if status == "approved" else "pending"].append(application_id)
+        created_at = (start + timedelta(seconds=i * 30)).isoformat()
+        documents = [{"doc_id": f"DOC-L{i:06d}", "name": "scan.png", "type": "image/png",
+                      "size": len(scan), "data": scan}]
+        statements.append((f'''
+            INSERT INTO applications (
+                application_id, citizen_name, citizen_email, citizen_id, account_id, document_type,
+                status, current_stage, created_at, priority, ai_confidence, ai_verdict,
+                ai_results, documents, feedback, document_base64, updated_at
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, {json_placeholder()}, {json_placeholder()}, ?, ?, ?)
+        ''', (application_id, f"Citizen {i}", f"citizen{i}@example.com", f"1199880{i:09d}",
+              random.choice(ids["citizens"]), random.choice(DOCUMENT_TYPES), status, "irembo", created_at,
+              "normal", 90.0, "authentic", json.dumps([{"doc_id": f"DOC-L{i:06d}", "confidence": 90.0}]),
+              json.dumps(documents), "Seeded", scan, created_at)))
+        statements.append(application_change(application_id))
+    for i in range(applications // 4):
+        request_id = f"DOCREQ-LOAD-{i:06d}"
+        requested_at = (start + timedelta(seconds=i * 120)).isoformat()
+        statements.append(('''
+            INSERT INTO document_requests (
+                request_id, document_type, citizen_name, citizen_id, account_id,
+                citizen_phone, reason, status, requested_at, updated_at, remarks
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (request_id, random.choice(DOCUMENT_TYPES), f"Citizen {i}", f"1199880{i:09d}",
+              random.choice(ids["citizens"]), "0788000000", "Seeded", "pending", requested_at, requested_at, "")))
+        statements.append(document_request_change(request_id))
+    for offset in range(0, len(statements), 2000):
+        execute_write_sync(statements[offset:offset + 2000])
+    # Importing the API modules configured INFO logging; keep request logs quiet
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    return ids
+
+
+def make_scan(size: int = 256) -> bytes:
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.frombytes("RGB", (size, size), os.urandom(size * size * 3)).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+# ==================== SCENARIOS ====================
+
+class LoadUser:
+    """One virtual user; records (endpoint, status or error name, seconds) samples"""
+
+    def __init__(self, client: httpx.AsyncClient, ids: Dict[str, List[str]], scan: bytes,
+                 samples: List[Tuple[str, object, float]]):
+        self.client = client
+        self.ids = ids
+        self.scan = scan
+        self.samples = samples
+        self.account_id = random.choice(ids["citizens"])
+        self.etag: Optional[str] = None
+
+    async def request(self, method: str, endpoint: str, url: str, **kwargs) -> Optional[httpx.Response]:
+        started = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, **kwargs)
+            status = response.status_code
+        except httpx.HTTPError as e:
+            # Transport failures are counted under the exception name
+            response, status = None, type(e).__name__
+        self.samples.append((f"{method} {endpoint}", status, time.perf_counter() - started))
+        return response
+
+    async def upload(self):
+        response = await self.request(
+            "POST", "/api/upload", "/api/upload",
+            data={"document_type": random.choice(DOCUMENT_TYPES), "citizen_name": "Load Test",
+                  "citizen_email": "load@example.com", "citizen_id": "1199880000000000",
+                  "account_id": self.account_id},
+            files=[("file", ("scan.png", self.scan, "image/png"))]
+        )
+        if response is not None and response.status_code == 200:
+            application_id = response.json()["data"]["application_id"]
+            await self.request("GET", "/api/applications/{id}/verification",
+                               f"/api/applications/{application_id}/verification")
+
+    async def poll(self):
+        headers = {"If-None-Match": self.etag} if self.etag else {}
+        response = await self.request(
+            "GET", "/api/applications?account_id", "/api/applications",
+            params={"account_id": self.account_id, "fields": "application_id,status,queue_position,created_at"},
+            headers=headers
+        )
+        if response is not None and response.status_code == 200:
+            self.etag = response.headers.get("etag")
+
+    async def officer_list(self):
+        await self.request("GET", "/api/applications?status=pending", "/api/applications",
+                           params={"status": "pending", "per_page": 20, "fields": "application_id,status,queue_position,document_type,created_at"})
+        await self.request("GET", "/api/document-requests", "/api/document-requests", params={"per_page": 20})
+
+    async def officer_update(self):
+        if not self.ids["pending"]:
+            return
+        application_id = random.choice(self.ids["pending"])
+        await self.request("PUT", "/api/applications/{id}", f"/api/applications/{application_id}",
+                           json={"status": "pending", "feedback": "Reviewed under load"})
+
+    async def download(self):
+        if not self.ids["approved"]:
+            return
+        application_id = random.choice(self.ids["approved"])
+        await self.request("GET", "/api/applications/{id}/download", f"/api/applications/{application_id}/download")
+
+    async def appeal(self):
+        application_id = random.choice(self.ids["approved"] + self.ids["pending"])
+        await self.request("POST", "/api/appeals", "/api/appeals",
+                           json={"application_id": application_id, "account_id": self.account_id,
+                                 "reason": "Load test appeal"})
+        await self.request("GET", "/api/appeals?account_id", "/api/appeals", params={"account_id": self.account_id})
+
+    async def doc_request(self):
+        response = await self.request(
+            "POST", "/api/document-request", "/api/document-request",
+            json={"document_type": random.choice(DOCUMENT_TYPES), "citizen_name": "Load Test",
+                  "citizen_id": f"1199880{random.randint(0, 10**9):09d}", "account_id": self.account_id,
+                  "citizen_phone": "0788000000"}
+        )
+        if response is not None and response.status_code == 200:
+            request_id = response.json()["data"]["request_id"]
+            await self.request("GET", "/api/document-requests/{id}", f"/api/document-requests/{request_id}")
+
+    async def run(self, deadline: float, think_time: float):
+        names = list(SCENARIO_WEIGHTS)
+        weights = list(SCENARIO_WEIGHTS.values())
+        while time.monotonic() < deadline:
+            await getattr(self, random.choices(names, weights=weights)[0])()
+            if think_time:
+                await asyncio.sleep(random.uniform(0, 2 * think_time))
+
+
+async def run_load(url: str, ids: Dict[str, List[str]], users: int, duration: float,
+                   think_time: float) -> Tuple[List[Tuple[str, object, float]], float]:
+    samples: List[Tuple[str, object, float]] = []
+    scan = make_scan()
+    limits = httpx.Limits(max_connections=users, max_keepalive_connections=users)
+    async with httpx.AsyncClient(base_url=url, timeout=60, limits=limits) as client:
+        started = time.monotonic()
+        deadline = started + duration
+        await asyncio.gather(*[
+            LoadUser(client, ids, scan, samples).run(deadline, think_time) for _ in range(users)
+        ])
+        elapsed = time.monotonic() - started
+    return samples, elapsed
+
+
+# ==================== REPORTING ====================
+
+def _percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(q / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(samples: List[Tuple[str, object, float]], elapsed: float) -> Dict[str, Dict[str, float]]:
+    """Per-endpoint and total request rate, error rate and latency percentiles (ms)"""
+    by_endpoint: Dict[str, List[Tuple[object, float]]] = defaultdict(list)
+    for endpoint, status, seconds in samples:
+        by_endpoint[endpoint].append((status, seconds))
+        by_endpoint["TOTAL"].append((status, seconds))
+
+    summary = {}
+    for endpoint, results in sorted(by_endpoint.items()):
+        latencies = sorted(seconds * 1000 for _, seconds in results)
+        rejected = sum(1 for status, _ in results if status in (429, 503))
+        errors = sum(1 for status, _ in results
+                     if not isinstance(status, int) or (status >= 400 and status not in (429, 503)))
+        statuses = defaultdict(int)
+        for status, _ in results:
+            statuses[str(status)] += 1
+        summary[endpoint] = {
+            "requests": len(results),
+            "rps": round(len(results) / elapsed, 2),
+            "error_rate": round(errors / len(results), 4),
+            "rejected_rate": round(rejected / len(results), 4),
+            "p50_ms": round(_percentile(latencies, 50), 2),
+            "p95_ms": round(_percentile(latencies, 95), 2),
+            "p99_ms": round(_percentile(latencies, 99), 2),
+            "status_counts": dict(sorted(statuses.items())),
+        }
+    return summary
+
+
+def print_summary(summary: Dict[str, Dict[str, float]], baseline: Optional[Dict] = None):
+    print(f"{'endpoint':<44} {'reqs':>7} {'rps':>8} {'err%':>6} {'rej%':>6} {'p50':>8} {'p95':>8} {'p99':>8}")
+    for endpoint, row in summary.items():
+        print(f"{endpoint:<44} {row['requests']:>7} {row['rps']:>8.1f} {row['error_rate'] * 100:>6.1f} "
+              f"{row['rejected_rate'] * 100:>6.1f} {row['p50_ms']:>8.1f} {row['p95_ms']:>8.1f} {row['p99_ms']:>8.1f}")
+        old = (baseline or {}).get(endpoint)
+        if old:
+            deltas = "  ".join(
+                f"{key} {((row[key] - old[key]) / old[key] * 100) if old[key] else 0:+.0f}%"
+                for key in ("rps", "p50_ms", "p95_ms", "p99_ms")
+            )
+            print(f"{'  vs baseline':<44} {deltas}")
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=API_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="Target a running server instead of starting one")
+    parser.add_argument("--workers", type=int, default=4, help="uvicorn workers when starting the server")
+    parser.add_argument("--users", type=int, default=50, help="Concurrent virtual users")
+    parser.add_argument("--duration", type=float, default=60, help="Seconds of load")
+    parser.add_argument("--think-time", type=float, default=0.0, help="Mean pause between scenarios per user")
+    parser.add_argument("--applications", type=int, default=2000, help="Applications to seed")
+    parser.add_argument("--citizens", type=int, default=200, help="Citizen accounts to spread them over")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed for the dataset and scenario mix")
+    parser.add_argument("--sqlite-production-mode", action="store_true", help="Start the server with SQLITE_PRODUCTION_MODE")
+    parser.add_argument("--output", help="Result file (default: benchmarks/results/load_<timestamp>.json)")
+    parser.add_argument("--compare", help="Earlier result file to compare against")
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    server = None
+    data_dir = tempfile.mkdtemp(prefix="irembo_load_")
+    url = args.url
+    try:
+        if url is None:
+            port = _free_port()
+            url = f"http://127.0.0.1:{port}"
+            server = start_server(args.workers, port, data_dir, {
+                "SQLITE_PRODUCTION_MODE": str(args.sqlite_production_mode).lower(),
+            })
+            wait_until_up(url)
+            ids = seed(data_dir, args.applications, args.citizens)
+        else:
+            # An existing server keeps its own data; work with what its API returns
+            listing = httpx.get(f"{url}/api/applications", params={"per_page": 100, "fields": "application_id,status,account_id"}).json()
+            rows = listing.get("data", [])
+            ids = {
+                "approved": [r["application_id"] for r in rows if r.get("status") == "approved"],
+                "pending": [r["application_id"] for r in rows if r.get("status") != "approved"],
+                "citizens": sorted({r["account_id"] for r in rows if r.get("account_id")}) or [f"USR-LOAD-{uuid.uuid4().hex[:6]}"],
+            }
+            if not ids["pending"] and not ids["approved"]:
+                raise SystemExit("The target server has no applications to exercise; seed it or use the local server")
+
+        print(f"Running {args.users} users for {args.duration:.0f}s against {url} ...")
+        samples, elapsed = asyncio.run(run_load(url, ids, args.users, args.duration, args.think_time))
+    finally:
+        if server is not None:
+            server.terminate()
+            try:
+                server.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                server.kill()
+
+    summary = summarize(samples, elapsed)
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)["endpoints"]
+    print_summary(summary, baseline)
+
+    result = {
+        "format": 1,
+        "started_at": datetime.utcnow().isoformat(),
+        "commit": _git_commit(),
+        "config": {
+            "url": args.url, "workers": None if args.url else args.workers, "users": args.users,
+            "duration": args.duration, "think_time": args.think_time, "applications": args.applications,
+            "citizens": args.citizens, "seed": args.seed, "sqlite_production_mode": args.sqlite_production_mode,
+            "mix": SCENARIO_WEIGHTS,
+        },
+        "elapsed_seconds": round(elapsed, 3),
+        "endpoints": summary,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"load_{datetime.utcnow().strftime('%Y%m%dT%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2)
+    print(f"Saved results to {output}")
+
+
+if __name__ == "__main__":
+    main()
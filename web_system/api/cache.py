@@ -0,0 +1,154 @@
+"""
+Read-through caches for iRembo Backend API
+
+``document_templates`` is tiny and rarely changes, so it is loaded whole and
+reloaded when invalidated or older than ``TEMPLATE_CACHE_TTL_SECONDS``.
+``document_registry`` lookups by (citizen_id, document_type) go through a
+bounded LRU that also remembers misses.
+
+Write paths record a ``registry`` change event (``registry_change`` in
+events.py) in the same transaction as the write. Every API process applies
+it from the change bus and verification workers poll for it; both call
+``apply_registry_change``, which drops the stale entries (all of them after
+a bulk load). The TTLs bound staleness should an event be missed.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from config import settings
+from database import get_db_connection, get_db_cursor, format_query
+from metrics import metrics
+
+# Marks a cached "no such record" result
+_MISSING = object()
+
+
+class TemplateCache:
+    """All document templates, keyed by document_type"""
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._templates: Optional[Dict[str, dict]] = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def _load(self) -> Dict[str, dict]:
+        conn = get_db_connection()
+        cursor = get_db_cursor(conn)
+        cursor.execute("SELECT * FROM document_templates")
+        templates: Dict[str, dict] = {}
+        for row in cursor.fetchall():
+            template = dict(row)
+            templates.setdefault(template["document_type"], template)
+        conn.close()
+        metrics.inc("cache_db_roundtrips", cache="templates")
+        return templates
+
+    def get(self, document_type: str) -> Optional[dict]:
+        with self._lock:
+            if self._templates is None or time.monotonic() - self._loaded_at > self.ttl:
+                self._templates = self._load()
+                self._loaded_at = time.monotonic()
+                metrics.inc("cache_misses", cache="templates")
+            else:
+                metrics.inc("cache_hits", cache="templates")
+            template = self._templates.get(document_type)
+        return dict(template) if template else None
+
+    def invalidate(self):
+        with self._lock:
+            self._templates = None
+
+
+class RegistryCache:
+    """LRU of document_registry records by (citizen_id, document_type), with negative caching"""
+
+    def __init__(self, max_size: int, ttl: float, negative_ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[object, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _load(self, citizen_id: str, document_type: str) -> Optional[dict]:
+        conn = get_db_connection()
+        cursor = get_db_cursor(conn)
+        cursor.execute(format_query("SELECT * FROM document_registry WHERE citizen_id = ? AND document_type = ?"),
+                       (citizen_id, document_type))
+        row = cursor.fetchone()
+        conn.close()
+        metrics.inc("cache_db_roundtrips", cache="registry")
+        return dict(row) if row else None
+
+    def get(self, citizen_id: str, document_type: str) -> Optional[dict]:
+        key = (citizen_id, document_type)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[1] > now:
+                self._entries.move_to_end(key)
+                value = entry[0]
+                if value is _MISSING:
+                    metrics.inc("cache_negative_hits", cache="registry")
+                    return None
+                metrics.inc("cache_hits", cache="registry")
+                return dict(value)
+
+        metrics.inc("cache_misses", cache="registry")
+        record = self._load(citizen_id, document_type)
+        expires = now + (self.ttl if record else self.negative_ttl)
+        with self._lock:
+            self._entries[key] = (record if record else _MISSING, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                metrics.inc("cache_evictions", cache="registry")
+            metrics.set("cache_size", len(self._entries), cache="registry")
+        return dict(record) if record else None
+
+    def invalidate(self, citizen_id: str, document_type: str):
+        with self._lock:
+            self._entries.pop((citizen_id, document_type), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def cache_stats() -> Dict[str, Dict[str, float]]:
+    """Hit rate and DB round-trips saved per cache"""
+    stats = {}
+    for name in ("templates", "registry"):
+        hits = metrics.counter("cache_hits", cache=name) + metrics.counter("cache_negative_hits", cache=name)
+        misses = metrics.counter("cache_misses", cache=name)
+        lookups = hits + misses
+        stats[name] = {
+            "lookups": lookups,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "db_roundtrips": metrics.counter("cache_db_roundtrips", cache=name),
+            "db_roundtrips_saved": hits,
+        }
+    return stats
+
+
+template_cache = TemplateCache(settings.template_cache_ttl_seconds)
+registry_cache = RegistryCache(
+    settings.registry_cache_size,
+    settings.registry_cache_ttl_seconds,
+    settings.registry_negative_ttl_seconds,
+)
+
+
+def apply_registry_change(change: Dict):
+    """Drop the cached entries a registry or template write made stale"""
+    if change.get("table") == "document_templates":
+        template_cache.invalidate()
+    elif change.get("citizen_id") and change.get("document_type"):
+        registry_cache.invalidate(change["citizen_id"], change["document_type"])
+    else:
+        registry_cache.clear()
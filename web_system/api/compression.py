@@ -0,0 +1,174 @@
+"""
+Response compression for iRembo Backend API
+
+Responses of at least ``COMPRESSION_MINIMUM_SIZE`` bytes are compressed with
+brotli (when the ``brotli`` package is installed and the client accepts
+``br``) or gzip. Bodies larger than ``COMPRESSION_CHUNK_SIZE`` are compressed
+piece by piece in a worker thread and sent as each piece is ready, so large
+pages do not block the event loop and their first bytes leave early.
+Streaming responses are compressed chunk by chunk; server-sent events and
+already-compressed media are passed through.
+"""
+
+import zlib
+from typing import Dict, Optional
+
+import anyio
+from starlette.datastructures import Headers, MutableHeaders
+
+from config import settings
+from metrics import metrics
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+EXCLUDED_CONTENT_TYPES = ("text/event-stream", "image/", "audio/", "video/", "application/zip", "application/gzip")
+
+
+class _GzipEncoder:
+    encoding = "gzip"
+
+    def __init__(self):
+        self._compressor = zlib.compressobj(settings.compression_gzip_level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+
+class _BrotliEncoder:
+    encoding = "br"
+
+    def __init__(self):
+        self._compressor = brotli.Compressor(quality=settings.compression_brotli_quality)
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        out = self._compressor.process(data)
+        return out + (self._compressor.finish() if final else self._compressor.flush())
+
+
+ENCODERS = {"gzip": _GzipEncoder}
+if brotli is not None:
+    ENCODERS["br"] = _BrotliEncoder
+
+
+def accepted_encoding(accept_encoding: str) -> Optional[str]:
+    """Preferred supported coding (br, then gzip) allowed by an Accept-Encoding header"""
+    qualities: Dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        qualities[coding.strip().lower()] = quality
+    for coding in ("br", "gzip"):
+        if coding in ENCODERS and qualities.get(coding, qualities.get("*", 0.0)) > 0:
+            return coding
+    return None
+
+
+class _CompressingSend:
+    """``send`` wrapper that compresses the response body on its way out"""
+
+    def __init__(self, send, encoding: str, minimum_size: int, chunk_size: int):
+        self.send = send
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.chunk_size = chunk_size
+        self.start: Optional[dict] = None
+        self.encoder = None
+        self.passthrough = False
+        self.raw_bytes = 0
+        self.sent_bytes = 0
+
+    async def __call__(self, message: dict):
+        if message["type"] == "http.response.start":
+            headers = Headers(raw=message["headers"])
+            content_type = headers.get("content-type", "").lower()
+            self.passthrough = (
+                "content-encoding" in headers
+                or message["status"] in (204, 206, 304)
+                or content_type.startswith(EXCLUDED_CONTENT_TYPES)
+            )
+            if self.passthrough:
+                await self.send(message)
+            else:
+                self.start = message
+            return
+        if message["type"] != "http.response.body" or self.passthrough:
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if self.start is not None:
+            start, self.start = self.start, None
+            if not more_body and len(body) < self.minimum_size:
+                self.passthrough = True
+                await self.send(start)
+                await self.send(message)
+                return
+
+            self.encoder = ENCODERS[self.encoding]()
+            headers = MutableHeaders(raw=start["headers"])
+            headers["Content-Encoding"] = self.encoding
+            headers.add_vary_header("Accept-Encoding")
+            if not more_body and len(body) <= self.chunk_size:
+                compressed = self.encoder.compress(body, final=True)
+                headers["Content-Length"] = str(len(compressed))
+                await self.send(start)
+                await self.send({"type": "http.response.body", "body": compressed})
+                self._record(len(body), len(compressed))
+                return
+            if "content-length" in headers:
+                del headers["Content-Length"]
+            await self.send(start)
+
+        await self._send_compressed(body, more_body)
+
+    async def _send_compressed(self, body: bytes, more_body: bool):
+        if len(body) <= self.chunk_size:
+            compressed = self.encoder.compress(body, final=not more_body)
+            await self.send({"type": "http.response.body", "body": compressed, "more_body": more_body})
+            self._record(len(body), len(compressed), done=not more_body)
+            return
+
+        for offset in range(0, len(body), self.chunk_size):
+            final = not more_body and offset + self.chunk_size >= len(body)
+            compressed = await anyio.to_thread.run_sync(
+                self.encoder.compress, body[offset:offset + self.chunk_size], final
+            )
+            await self.send({"type": "http.response.body", "body": compressed, "more_body": not final})
+            self._record(min(self.chunk_size, len(body) - offset), len(compressed), done=final)
+
+    def _record(self, raw: int, sent: int, done: bool = True):
+        self.raw_bytes += raw
+        self.sent_bytes += sent
+        if done:
+            metrics.inc("http_compressed_responses", encoding=self.encoding)
+            metrics.inc("http_compression_bytes_in", self.raw_bytes, encoding=self.encoding)
+            metrics.inc("http_compression_bytes_out", self.sent_bytes, encoding=self.encoding)
+
+
+class CompressionMiddleware:
+    """ASGI middleware compressing responses for clients that accept br or gzip"""
+
+    def __init__(self, app, minimum_size: int = None, chunk_size: int = None):
+        self.app = app
+        self.minimum_size = minimum_size if minimum_size is not None else settings.compression_minimum_size
+        self.chunk_size = max(1, chunk_size or settings.compression_chunk_size)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = accepted_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        await self.app(scope, receive, _CompressingSend(send, encoding, self.minimum_size, self.chunk_size))
@@ -27,6 +27,85 @@ class Settings(BaseSettings):
     db_password: str = os.getenv("DB_PASSWORD", "postgres")
     db_name: str = os.getenv("DB_NAME", "irembo_db")
     use_postgresql: bool = os.getenv("USE_POSTGRESQL", "True").lower() == "true"
+
+    # SQLite production profile (used when PostgreSQL is unavailable)
+    sqlite_production_mode: bool = os.getenv("SQLITE_PRODUCTION_MODE", "False").lower() == "true"
+    sqlite_journal_mode: str = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+    sqlite_synchronous: str = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+    sqlite_mmap_size: int = int(os.getenv("SQLITE_MMAP_SIZE", 268435456))  # 256MB
+    sqlite_cache_size: int = int(os.getenv("SQLITE_CACHE_SIZE", -65536))  # negative = KiB (64MB)
+    sqlite_busy_timeout: int = int(os.getenv("SQLITE_BUSY_TIMEOUT", 5000))  # ms
+    sqlite_cached_statements: int = int(os.getenv("SQLITE_CACHED_STATEMENTS", 256))
+    sqlite_writer_batch_size: int = int(os.getenv("SQLITE_WRITER_BATCH_SIZE", 64))
+
+    # Queue index (rebuilt periodically to pick up writes from other workers; 0 disables)
+    queue_index_refresh_seconds: float = float(os.getenv("QUEUE_INDEX_REFRESH_SECONDS", 30))
+    
+    # Read-through caches for document_templates and document_registry
+    template_cache_ttl_seconds: float = float(os.getenv("TEMPLATE_CACHE_TTL_SECONDS", 300))
+    registry_cache_size: int = int(os.getenv("REGISTRY_CACHE_SIZE", 10000))
+    registry_cache_ttl_seconds: float = float(os.getenv("REGISTRY_CACHE_TTL_SECONDS", 300))
+    registry_negative_ttl_seconds: float = float(os.getenv("REGISTRY_NEGATIVE_TTL_SECONDS", 60))
+    
+    # Verification job queue (see jobs.py / worker.py)
+    job_max_attempts: int = int(os.getenv("JOB_MAX_ATTEMPTS", 3))
+    job_retry_backoff_seconds: float = float(os.getenv("JOB_RETRY_BACKOFF_SECONDS", 5))
+    job_visibility_timeout_seconds: float = float(os.getenv("JOB_VISIBILITY_TIMEOUT_SECONDS", 300))
+    job_poll_interval_seconds: float = float(os.getenv("JOB_POLL_INTERVAL_SECONDS", 0.5))
+    job_worker_concurrency: int = int(os.getenv("JOB_WORKER_CONCURRENCY", 4))
+    verification_worker_autostart: bool = os.getenv("VERIFICATION_WORKER_AUTOSTART", "True").lower() == "true"
+    # Held by the autostarted worker, so uvicorn --workers N starts only one
+    verification_worker_lock_path: str = os.getenv("VERIFICATION_WORKER_LOCK_PATH", "verification_worker.lock")
+    
+    # Change bus and server-sent events (see events.py)
+    change_bus_poll_seconds: float = float(os.getenv("CHANGE_BUS_POLL_SECONDS", 0.5))
+    change_bus_buffer_size: int = int(os.getenv("CHANGE_BUS_BUFFER_SIZE", 1000))
+    change_events_retention_hours: float = float(os.getenv("CHANGE_EVENTS_RETENTION_HOURS", 24))
+    sse_queue_size: int = int(os.getenv("SSE_QUEUE_SIZE", 256))
+    sse_heartbeat_seconds: float = float(os.getenv("SSE_HEARTBEAT_SECONDS", 15))
+    sse_retry_ms: int = int(os.getenv("SSE_RETRY_MS", 3000))
+    
+    # Admission control for upload, AI and certificate endpoints (see admission.py)
+    admission_upload_concurrency: int = int(os.getenv("ADMISSION_UPLOAD_CONCURRENCY", 8))
+    admission_upload_queue: int = int(os.getenv("ADMISSION_UPLOAD_QUEUE", 32))
+    admission_upload_per_account: int = int(os.getenv("ADMISSION_UPLOAD_PER_ACCOUNT", 2))
+    admission_ai_process_concurrency: int = int(os.getenv("ADMISSION_AI_PROCESS_CONCURRENCY", 2))
+    admission_ai_process_queue: int = int(os.getenv("ADMISSION_AI_PROCESS_QUEUE", 8))
+    admission_ai_process_per_account: int = int(os.getenv("ADMISSION_AI_PROCESS_PER_ACCOUNT", 2))
+    admission_certificate_concurrency: int = int(os.getenv("ADMISSION_CERTIFICATE_CONCURRENCY", 4))
+    admission_certificate_queue: int = int(os.getenv("ADMISSION_CERTIFICATE_QUEUE", 16))
+    admission_certificate_per_account: int = int(os.getenv("ADMISSION_CERTIFICATE_PER_ACCOUNT", 2))
+    admission_queue_timeout_seconds: float = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_SECONDS", 10))
+    
+    # Response compression (see compression.py)
+    compression_minimum_size: int = int(os.getenv("COMPRESSION_MINIMUM_SIZE", 1024))
+    compression_gzip_level: int = int(os.getenv("COMPRESSION_GZIP_LEVEL", 6))
+    compression_brotli_quality: int = int(os.getenv("COMPRESSION_BROTLI_QUALITY", 4))
+    compression_chunk_size: int = int(os.getenv("COMPRESSION_CHUNK_SIZE", 256 * 1024))
+    
+    # On-demand request profiling (see profiling.py); off unless a token or sample rate is set
+    profile_token: str = os.getenv("PROFILE_TOKEN", "")
+    profile_sample_rate: float = float(os.getenv("PROFILE_SAMPLE_RATE", 0))
+    profile_interval_ms: float = float(os.getenv("PROFILE_INTERVAL_MS", 5))
+    profile_dir: str = os.getenv("PROFILE_DIR", "profiles")
+    profile_max_files: int = int(os.getenv("PROFILE_MAX_FILES", 200))
+    
+    # SQL query instrumentation (see query_stats.py); budget 0 disables the per-request cap
+    db_query_stats: bool = os.getenv("DB_QUERY_STATS", "True").lower() == "true"
+    db_slow_query_ms: float = float(os.getenv("DB_SLOW_QUERY_MS", 200))
+    db_query_budget: int = int(os.getenv("DB_QUERY_BUDGET", 0))
+    db_query_budget_mode: str = os.getenv("DB_QUERY_BUDGET_MODE", "warn")  # warn or fail
+    
+    # Cold storage for old finalized applications (see archive.py); interval 0 = run archive.py yourself
+    archive_dir: str = os.getenv("ARCHIVE_DIR", "archive")
+    archive_after_days: float = float(os.getenv("ARCHIVE_AFTER_DAYS", 365))
+    archive_statuses: str = os.getenv("ARCHIVE_STATUSES", "approved,rejected")
+    archive_interval_hours: float = float(os.getenv("ARCHIVE_INTERVAL_HOURS", 0))
+    archive_batch_size: int = int(os.getenv("ARCHIVE_BATCH_SIZE", 500))
+    archive_segment_max_bytes: int = int(os.getenv("ARCHIVE_SEGMENT_MAX_BYTES", 256 * 1024 * 1024))
+    archive_compression: str = os.getenv("ARCHIVE_COMPRESSION", "gzip")  # gzip or zstd
+    archive_compression_level: int = int(os.getenv("ARCHIVE_COMPRESSION_LEVEL", 6))
+    archive_vacuum: bool = os.getenv("ARCHIVE_VACUUM", "True").lower() == "true"
     
     # Security
     secret_key: str = os.getenv("SECRET_KEY", "change-me-in-production")
@@ -46,6 +125,52 @@ class Settings(BaseSettings):
     poly_path: str = os.getenv("POLY_PATH", "../../output/models/feature_poly.pkl")
     scaler_path: str = os.getenv("SCALER_PATH", "../../output/models/feature_scaler.pkl")
     confidence_threshold: float = float(os.getenv("CONFIDENCE_THRESHOLD", 0.84))
+    model_version: str = os.getenv("MODEL_VERSION", "")  # defaults to the model file name
+    # Per-document-type model bundles, loaded on demand into an LRU (see model_router.py)
+    model_bundle_dir: str = os.getenv("MODEL_BUNDLE_DIR", "../../output/models/by_type")
+    model_memory_budget_mb: float = float(os.getenv("MODEL_MEMORY_BUDGET_MB", 512))
+    # Candidate bundle scored on a sample of live traffic (see shadow.py); empty = off
+    shadow_model_dir: str = os.getenv("SHADOW_MODEL_DIR", "")
+    shadow_sample_rate: float = float(os.getenv("SHADOW_SAMPLE_RATE", 0.1))
+    shadow_queue_size: int = int(os.getenv("SHADOW_QUEUE_SIZE", 256))
+    shadow_batch_size: int = int(os.getenv("SHADOW_BATCH_SIZE", 32))
+    shadow_confidence_threshold: float = float(os.getenv("SHADOW_CONFIDENCE_THRESHOLD", os.getenv("CONFIDENCE_THRESHOLD", 0.84)))
+    
+    # Shared inference server (see inference_server.py); "local" loads the model in every process
+    ai_service_mode: str = os.getenv("AI_SERVICE_MODE", "local")  # local or remote
+    inference_socket_path: str = os.getenv("INFERENCE_SOCKET_PATH", "/tmp/irembo-inference.sock")
+    inference_autostart: bool = os.getenv("INFERENCE_AUTOSTART", "True").lower() == "true"
+    inference_max_batch: int = int(os.getenv("INFERENCE_MAX_BATCH", 16))
+    inference_batch_wait_ms: float = float(os.getenv("INFERENCE_BATCH_WAIT_MS", 5))
+    inference_timeout_seconds: float = float(os.getenv("INFERENCE_TIMEOUT_SECONDS", 30))
+    inference_start_timeout_seconds: float = float(os.getenv("INFERENCE_START_TIMEOUT_SECONDS", 60))
+    inference_health_interval_seconds: float = float(os.getenv("INFERENCE_HEALTH_INTERVAL_SECONDS", 10))
+    
+    # CPU threads of BLAS, OpenCV and TensorFlow per process (see thread_budget.py); 0 = derived
+    cpu_cores: str = os.getenv("CPU_CORES", "")  # e.g. "0-7"; default: the cores the process may run on
+    api_workers: int = int(os.getenv("API_WORKERS", os.getenv("WEB_CONCURRENCY", 1)))
+    cpu_processes: int = int(os.getenv("CPU_PROCESSES", 0))
+    cpu_threads_per_process: int = int(os.getenv("CPU_THREADS_PER_PROCESS", 0))
+    cpu_affinity: bool = os.getenv("CPU_AFFINITY", "False").lower() == "true"
+    cpu_slot_dir: str = os.getenv("CPU_SLOT_DIR", "/tmp/irembo-cpu-slots")
+    
+    # Columnar store of the features of every scored document (see feature_store.py)
+    feature_store_enabled: bool = os.getenv("FEATURE_STORE_ENABLED", "True").lower() == "true"
+    feature_store_dir: str = os.getenv("FEATURE_STORE_DIR", "feature_store")
+    feature_store_batch_size: int = int(os.getenv("FEATURE_STORE_BATCH_SIZE", 256))
+    feature_store_flush_seconds: float = float(os.getenv("FEATURE_STORE_FLUSH_SECONDS", 5))
+    
+    # Drift of live features and confidence against a stored baseline (see drift.py)
+    drift_enabled: bool = os.getenv("DRIFT_ENABLED", "True").lower() == "true"
+    drift_baseline_path: str = os.getenv("DRIFT_BASELINE_PATH", "drift_baseline.json")
+    drift_state_dir: str = os.getenv("DRIFT_STATE_DIR", "drift_state")
+    drift_bins: int = int(os.getenv("DRIFT_BINS", 10))
+    drift_half_life: float = float(os.getenv("DRIFT_HALF_LIFE", 2000))  # documents
+    drift_min_observations: int = int(os.getenv("DRIFT_MIN_OBSERVATIONS", 100))
+    drift_psi_warn: float = float(os.getenv("DRIFT_PSI_WARN", 0.1))
+    drift_psi_alert: float = float(os.getenv("DRIFT_PSI_ALERT", 0.25))
+    drift_persist_seconds: float = float(os.getenv("DRIFT_PERSIST_SECONDS", 15))
+    drift_state_max_age_seconds: float = float(os.getenv("DRIFT_STATE_MAX_AGE_SECONDS", 600))
     
     # File Upload
     max_file_size: int = int(os.getenv("MAX_FILE_SIZE", 10485760))  # 10MB
@@ -53,6 +178,9 @@ class Settings(BaseSettings):
     
     # Logging
     log_level: str = os.getenv("LOG_LEVEL", "info")
+    log_format: str = os.getenv("LOG_FORMAT", "json")  # json or text
+    log_queue_size: int = int(os.getenv("LOG_QUEUE_SIZE", 10000))
+    log_debug_sample_rate: float = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", 0.1))
     
     class Config:
         env_file = ".env"
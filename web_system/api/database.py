@@ -0,0 +1,266 @@
+"""
+Database connection helpers for iRembo Backend API
+
+PostgreSQL is used when configured and reachable, otherwise the API falls back
+to the local SQLite file. When ``SQLITE_PRODUCTION_MODE`` is enabled SQLite runs
+with WAL journaling, long-lived per-thread connections and a single writer
+thread that group-commits queued writes.
+"""
+
+import asyncio
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, List, Optional, Sequence, Tuple
+
+import psycopg2
+from psycopg2.extras import RealDictCursor
+
+from config import settings
+from query_stats import instrument, record_query, check_budget, charge_request
+
+logger = logging.getLogger(__name__)
+
+DB_PATH = "irembo_verification.db"
+# This flag tracks if we are actually using PostgreSQL (dynamic fallback support)
+_actually_use_postgres = settings.use_postgresql
+
+# A write is a list of (query, params) pairs that must commit together
+WriteStatements = Sequence[Tuple[str, Sequence[Any]]]
+
+
+def using_postgres() -> bool:
+    """Whether the last connection attempt ended up on PostgreSQL"""
+    return _actually_use_postgres
+
+
+def sqlite_production_enabled() -> bool:
+    """Whether the tuned SQLite profile is active for the current backend"""
+    return settings.sqlite_production_mode and not _actually_use_postgres
+
+
+# ==================== SQLITE PRODUCTION PROFILE ====================
+
+class PersistentConnection(sqlite3.Connection):
+    """
+    SQLite connection that survives ``close()``.
+
+    Route handlers always close their connection when done; for a long-lived
+    per-thread connection that only needs to end any open transaction.
+    """
+
+    def close(self):
+        if self.in_transaction:
+            self.rollback()
+
+    def close_for_real(self):
+        super().close()
+
+
+def apply_sqlite_pragmas(conn: sqlite3.Connection):
+    """Apply the production PRAGMAs from settings to a SQLite connection"""
+    conn.execute(f"PRAGMA journal_mode={settings.sqlite_journal_mode}")
+    conn.execute(f"PRAGMA synchronous={settings.sqlite_synchronous}")
+    conn.execute(f"PRAGMA mmap_size={int(settings.sqlite_mmap_size)}")
+    conn.execute(f"PRAGMA cache_size={int(settings.sqlite_cache_size)}")
+    conn.execute(f"PRAGMA busy_timeout={int(settings.sqlite_busy_timeout)}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+
+
+def _open_tuned_sqlite(isolation_level: Optional[str] = "") -> PersistentConnection:
+    conn = sqlite3.connect(
+        DB_PATH,
+        factory=PersistentConnection,
+        timeout=settings.sqlite_busy_timeout / 1000.0,
+        cached_statements=settings.sqlite_cached_statements,
+        isolation_level=isolation_level,
+    )
+    conn.row_factory = sqlite3.Row
+    apply_sqlite_pragmas(conn)
+    return conn
+
+
+_thread_local = threading.local()
+
+
+def _get_thread_connection() -> PersistentConnection:
+    """Return this thread's long-lived SQLite connection, opening it on first use"""
+    conn = getattr(_thread_local, "conn", None)
+    if conn is None or getattr(_thread_local, "path", None) != DB_PATH:
+        if conn is not None:
+            conn.close_for_real()
+        conn = _open_tuned_sqlite()
+        _thread_local.conn = conn
+        _thread_local.path = DB_PATH
+    return conn
+
+
+class SQLiteWriter:
+    """
+    Single writer thread for SQLite.
+
+    Writes are queued from any thread and applied by one connection. Whatever
+    is waiting in the queue when the writer wakes up (up to ``batch_size``
+    writes) is committed in a single transaction, so concurrent uploads and
+    status updates share one fsync instead of fighting over the write lock.
+    Each write runs inside its own savepoint, so a failing write only fails
+    its own future.
+    """
+
+    def __init__(self, batch_size: int = 64):
+        self.batch_size = max(1, batch_size)
+        self._queue: "queue.Queue[Tuple[WriteStatements, Future]]" = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="sqlite-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, statements: WriteStatements) -> Future:
+        """Queue a group of statements; the future resolves to the last rowcount"""
+        future: Future = Future()
+        self._queue.put((statements, future))
+        return future
+
+    def _run(self):
+        conn = _open_tuned_sqlite(isolation_level=None)
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._commit_batch(conn, batch)
+
+    def _commit_batch(self, conn: sqlite3.Connection, batch):
+        results = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for statements, future in batch:
+                conn.execute("SAVEPOINT write_item")
+                try:
+                    rowcount = 0
+                    for query, params in statements:
+                        started = time.perf_counter()
+                        rowcount = conn.execute(query, params).rowcount
+                        # Charged to the request by execute_write, not here
+                        record_query(query, params, time.perf_counter() - started, rowcount, charge=False)
+                    conn.execute("RELEASE write_item")
+                    results.append((future, rowcount, None))
+                except Exception as e:
+                    conn.execute("ROLLBACK TO write_item")
+                    conn.execute("RELEASE write_item")
+                    results.append((future, None, e))
+            conn.execute("COMMIT")
+        except Exception as e:
+            logger.error("SQLite group commit failed: %s", e)
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            for _, future in batch:
+                future.set_exception(e)
+            return
+
+        for future, rowcount, error in results:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(rowcount)
+
+
+_writer: Optional[SQLiteWriter] = None
+_writer_lock = threading.Lock()
+
+
+def get_sqlite_writer() -> SQLiteWriter:
+    """Singleton pattern for the SQLite writer thread"""
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = SQLiteWriter(settings.sqlite_writer_batch_size)
+    return _writer
+
+
+# ==================== CONNECTIONS ====================
+
+def _connect_sqlite():
+    if settings.sqlite_production_mode:
+        return _get_thread_connection()
+    conn = sqlite3.connect(DB_PATH)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def get_db_connection():
+    global _actually_use_postgres
+    if settings.use_postgresql:
+        try:
+            conn = psycopg2.connect(
+                host=settings.db_host,
+                port=settings.db_port,
+                user=settings.db_user,
+                password=settings.db_password,
+                dbname=settings.db_name,
+                connect_timeout=3
+            )
+            _actually_use_postgres = True
+            return conn
+        except Exception as e:
+            logger.error("Error connecting to PostgreSQL: %s", e)
+            # Fallback to SQLite if Postgres fails (optional, but good for dev)
+            _actually_use_postgres = False
+            return _connect_sqlite()
+    else:
+        _actually_use_postgres = False
+        return _connect_sqlite()
+
+
+def get_db_cursor(conn):
+    """Dict-row cursor for the active backend, instrumented (see query_stats.py)"""
+    if _actually_use_postgres:
+        return instrument(conn.cursor(cursor_factory=RealDictCursor))
+    return instrument(conn.cursor())
+
+
+def format_query(query):
+    if _actually_use_postgres:
+        # Simple placeholder replacement: ? -> %s
+        return query.replace("?", "%s")
+    return query
+
+
+def execute_write_sync(statements: WriteStatements) -> int:
+    """Apply a group of write statements atomically on a fresh connection (for worker processes)"""
+    conn = get_db_connection()
+    cursor = instrument(conn.cursor())
+    try:
+        rowcount = 0
+        for query, params in statements:
+            cursor.execute(format_query(query), params)
+            rowcount = cursor.rowcount
+        conn.commit()
+        return rowcount
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+async def execute_write(statements: WriteStatements) -> int:
+    """
+    Apply a group of write statements atomically.
+
+    In SQLite production mode the statements go through the single writer
+    thread and are group-committed with other pending writes; otherwise they
+    run on a fresh connection as before.
+    """
+    if sqlite_production_enabled():
+        check_budget(len(statements))
+        started = time.perf_counter()
+        try:
+            return await asyncio.wrap_future(get_sqlite_writer().submit(statements))
+        finally:
+            charge_request(len(statements), time.perf_counter() - started)
+    return execute_write_sync(statements)
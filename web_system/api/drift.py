@@ -0,0 +1,351 @@
+"""
+Streaming drift monitoring for iRembo Backend API
+
+The confidence threshold and the blur/glare rules in ``AIService`` were tuned
+offline. This module compares what is being scored now against a stored
+baseline, per document type, for every extracted feature and for the model
+confidence.
+
+Baseline (``DRIFT_BASELINE_PATH``): for each document type with enough rows,
+plus ``all``, ``DRIFT_BINS`` quantile bins per column and the share of
+baseline rows in each bin. Build it from the feature store, or from a CSV of
+training features whose header uses the feature names:
+
+    python drift.py --build-baseline
+    python drift.py --build-baseline --csv training_features.csv
+
+Live sketches: every prediction adds one count to the matching bin of each
+column, in a fixed-size array per document type, after decaying the earlier
+counts so that weight halves every ``DRIFT_HALF_LIFE`` documents. An update
+is a few bisections and one small multiply; memory does not grow with
+traffic. Each process writes its sketches to ``DRIFT_STATE_DIR`` every
+``DRIFT_PERSIST_SECONDS`` (scoring happens in verification workers, not in
+the API process), or only touches the file when nothing changed, and
+``GET /api/statistics/drift`` merges the files of live processes (touched
+within ``DRIFT_STATE_MAX_AGE_SECONDS``):
+
+- PSI between the live and baseline bin shares: below ``DRIFT_PSI_WARN`` is
+  stable, above ``DRIFT_PSI_ALERT`` is drift
+- KS: the largest gap between the two cumulative distributions, computed on
+  the bins
+
+The same call sets the ``drift_psi`` / ``drift_ks`` gauges (labelled by
+document type and feature) in ``GET /api/metrics``.
+
+Usage (from web_system/api):
+    python drift.py                     # current summary
+"""
+
+import argparse
+import atexit
+import bisect
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from config import settings
+from feature_store import FEATURE_COLUMNS, FeatureStore
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+MONITORED_COLUMNS = FEATURE_COLUMNS + ("confidence",)
+ALL_TYPES = "all"
+# Document types sketched separately; the rest only count towards "all"
+MAX_DOCUMENT_TYPES = 32
+# Keeps PSI finite when a bin is empty on one side
+_EPSILON = 1e-4
+
+
+# ==================== BASELINE ====================
+
+def _column_baseline(values: np.ndarray, bins: int) -> Optional[Dict]:
+    values = values[np.isfinite(values)]
+    if len(values) == 0:
+        return None
+    edges = np.unique(np.quantile(values, np.linspace(0, 1, bins + 1)[1:-1]))
+    counts = np.bincount(np.searchsorted(edges, values, side="right"), minlength=len(edges) + 1)
+    return {"edges": edges.tolist(), "expected": (counts / len(values)).tolist()}
+
+
+def build_baseline(columns: Dict[str, np.ndarray], document_types: Optional[np.ndarray], source: str,
+                   bins: int = None, min_rows: int = None) -> Dict:
+    """Quantile bins and bin shares per document type (and ``all``) for each monitored column"""
+    bins = bins or settings.drift_bins
+    min_rows = min_rows or settings.drift_min_observations
+    groups = {ALL_TYPES: slice(None)}
+    if document_types is not None:
+        for document_type in np.unique(document_types):
+            mask = document_types == document_type
+            if document_type and mask.sum() >= min_rows:
+                groups[str(document_type)] = mask
+
+    baseline = {"created_at": datetime.utcnow().isoformat(), "source": source, "bins": bins, "document_types": {}}
+    for document_type, selection in groups.items():
+        features = {}
+        for name in MONITORED_COLUMNS:
+            if name in columns:
+                column = _column_baseline(np.asarray(columns[name], dtype=np.float64)[selection], bins)
+                if column:
+                    features[name] = column
+        rows = len(next(iter(columns.values()))[selection]) if columns else 0
+        baseline["document_types"][document_type] = {"rows": int(rows), "features": features}
+    return baseline
+
+
+def baseline_from_store(store: FeatureStore) -> Dict:
+    columns = store.read(MONITORED_COLUMNS + ("document_type",))
+    document_types = np.char.decode(np.asarray(columns.pop("document_type")), "utf-8")
+    return build_baseline(columns, document_types, source=f"feature store {store.directory} ({len(store)} rows)")
+
+
+def baseline_from_csv(path: str) -> Dict:
+    table = np.genfromtxt(path, delimiter=",", names=True, dtype=None, encoding="utf-8")
+    names = table.dtype.names
+    columns = {name: table[name] for name in MONITORED_COLUMNS if name in names}
+    document_types = table["document_type"].astype(str) if "document_type" in names else None
+    return build_baseline(columns, document_types, source=path)
+
+
+def save_baseline(baseline: Dict, path: str):
+    temp_path = path + ".tmp"
+    with open(temp_path, "w") as f:
+        json.dump(baseline, f)
+    os.replace(temp_path, path)
+
+
+# ==================== LIVE SKETCHES ====================
+
+class DriftSketch:
+    """Exponentially decayed bin counts of every monitored column for one document type"""
+
+    def __init__(self, edges: Dict[str, List[float]], bins: int):
+        self.columns = [name for name in MONITORED_COLUMNS if name in edges]
+        self.edges = [edges[name] for name in self.columns]
+        self.counts = np.zeros((len(self.columns), bins + 1))
+        self.observed = 0
+
+    def add(self, values: Dict[str, float], decay: float):
+        self.counts *= decay
+        for row, (name, edges) in enumerate(zip(self.columns, self.edges)):
+            value = values.get(name)
+            if value is not None:
+                self.counts[row, bisect.bisect_right(edges, value)] += 1
+        self.observed += 1
+
+
+def _compare(actual_counts: np.ndarray, expected: List[float]) -> Dict[str, float]:
+    expected = np.clip(np.asarray(expected), _EPSILON, None)
+    actual = np.clip(actual_counts[:len(expected)] / max(actual_counts.sum(), _EPSILON), _EPSILON, None)
+    psi = float(np.sum((actual - expected) * np.log(actual / expected)))
+    ks = float(np.max(np.abs(np.cumsum(actual) - np.cumsum(expected))))
+    return {"psi": round(psi, 4), "ks": round(ks, 4)}
+
+
+def _status(psi: float) -> str:
+    if psi >= settings.drift_psi_alert:
+        return "drift"
+    if psi >= settings.drift_psi_warn:
+        return "warn"
+    return "ok"
+
+
+class DriftMonitor:
+    """Per-process sketches, persisted for the summary endpoint"""
+
+    def __init__(self, baseline_path: str, state_dir: str):
+        self.baseline_path = baseline_path
+        self.state_dir = state_dir
+        self.decay = 0.5 ** (1.0 / max(1.0, settings.drift_half_life))
+        self._baseline: Optional[Dict] = None
+        self._baseline_mtime: Optional[float] = None
+        self._sketches: Dict[str, DriftSketch] = {}
+        self._lock = threading.Lock()
+        self._persister: Optional[threading.Thread] = None
+        self._dirty = False
+
+    def _state_path(self) -> str:
+        return os.path.join(self.state_dir, f"{socket.gethostname()}-{os.getpid()}.json")
+
+    def _load_baseline(self):
+        """(Re)load the baseline when its file changed; sketches restart with it"""
+        try:
+            mtime = os.path.getmtime(self.baseline_path)
+        except OSError:
+            mtime = None
+        if mtime == self._baseline_mtime:
+            return
+        baseline = None
+        if mtime is not None:
+            try:
+                with open(self.baseline_path) as f:
+                    baseline = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.error("Could not load drift baseline %s: %s", self.baseline_path, e)
+        with self._lock:
+            self._baseline, self._baseline_mtime = baseline, mtime
+            self._sketches = {}
+
+    def _sketch(self, document_type: str) -> Optional[DriftSketch]:
+        sketch = self._sketches.get(document_type)
+        if sketch is None and self._baseline is not None:
+            types = self._baseline["document_types"]
+            reference = types.get(document_type) or types.get(ALL_TYPES)
+            if reference is None or (document_type != ALL_TYPES and len(self._sketches) > MAX_DOCUMENT_TYPES):
+                return None
+            edges = {name: column["edges"] for name, column in reference["features"].items()}
+            sketch = self._sketches[document_type] = DriftSketch(edges, self._baseline["bins"])
+        return sketch
+
+    def observe(self, document_type: Optional[str], ai_result: Dict):
+        """Add one prediction (call before ``record_prediction`` takes its features)"""
+        features = ai_result.get("features")
+        if not features or not settings.drift_enabled:
+            return
+        if self._persister is None:
+            self._load_baseline()
+        # Rounded like the float32 feature store columns baselines are built from,
+        # so values sitting on a bin edge land in the same bin
+        values = {name: float(np.float32(value)) for name, value in features.items() if value is not None}
+        if ai_result.get("prediction") is not None:
+            values["confidence"] = float(np.float32(ai_result["prediction"]))
+        with self._lock:
+            if self._persister is None or not self._persister.is_alive():
+                # Started on first use, so forked workers each run their own
+                self._persister = threading.Thread(target=self._persist_loop, name="drift-persist", daemon=True)
+                self._persister.start()
+            for key in {ALL_TYPES, document_type or ALL_TYPES}:
+                sketch = self._sketch(key)
+                if sketch is not None:
+                    sketch.add(values, self.decay)
+            self._dirty = True
+
+    def _persist_loop(self):
+        while True:
+            self._load_baseline()
+            self.persist()
+            time.sleep(settings.drift_persist_seconds)
+
+    def persist(self):
+        """Write this process's sketches for the summary endpoint"""
+        with self._lock:
+            if self._baseline is None:
+                return
+            if not self._dirty:
+                state = None
+            else:
+                state = {
+                    "baseline_created_at": self._baseline["created_at"],
+                    "sketches": {
+                        key: {"observed": sketch.observed, "columns": sketch.columns, "counts": sketch.counts.tolist()}
+                        for key, sketch in self._sketches.items()
+                    },
+                }
+                self._dirty = False
+        try:
+            if state is None:
+                # Nothing new: only refresh the mtime, which tells the summary this process is alive
+                if os.path.exists(self._state_path()):
+                    os.utime(self._state_path())
+                return
+            os.makedirs(self.state_dir, exist_ok=True)
+            temp_path = self._state_path() + ".tmp"
+            with open(temp_path, "w") as f:
+                json.dump(state, f)
+            os.replace(temp_path, self._state_path())
+        except OSError as e:
+            logger.error("Could not write drift state: %s", e)
+
+    def _merged_states(self) -> Dict[str, Dict]:
+        """Sum the sketches of all processes written against the current baseline"""
+        merged: Dict[str, Dict] = {}
+        if not os.path.isdir(self.state_dir):
+            return merged
+        now = time.time()
+        for name in os.listdir(self.state_dir):
+            path = os.path.join(self.state_dir, name)
+            try:
+                # Exited processes stop touching their file and no longer count
+                if not name.endswith(".json") or now - os.path.getmtime(path) > settings.drift_state_max_age_seconds:
+                    continue
+                with open(path) as f:
+                    state = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if state.get("baseline_created_at") != self._baseline["created_at"]:
+                continue
+            for key, sketch in state["sketches"].items():
+                counts = np.asarray(sketch["counts"])
+                entry = merged.setdefault(key, {"observed": 0, "columns": sketch["columns"], "counts": np.zeros_like(counts),
+                                                "processes": 0})
+                entry["observed"] += sketch["observed"]
+                entry["counts"] += counts
+                entry["processes"] += 1
+        return merged
+
+    def summary(self) -> Dict:
+        """PSI/KS per document type and column across processes; also sets the drift gauges"""
+        self._load_baseline()
+        self.persist()
+        if self._baseline is None:
+            return {"baseline": None, "document_types": {},
+                    "message": f"No baseline at {self.baseline_path}; run python drift.py --build-baseline"}
+
+        types = self._baseline["document_types"]
+        report = {}
+        for key, state in sorted(self._merged_states().items()):
+            reference = types.get(key) or types[ALL_TYPES]
+            weight = float(state["counts"][0].sum()) if len(state["counts"]) else 0.0
+            entry = {"observed": state["observed"], "effective_weight": round(weight, 1),
+                     "processes": state["processes"], "baseline": key if key in types else ALL_TYPES}
+            if weight < settings.drift_min_observations:
+                entry["status"] = "insufficient_data"
+                report[key] = entry
+                continue
+            columns = {}
+            for row, name in enumerate(state["columns"]):
+                comparison = _compare(state["counts"][row], reference["features"][name]["expected"])
+                comparison["status"] = _status(comparison["psi"])
+                columns[name] = comparison
+                metrics.set("drift_psi", comparison["psi"], document_type=key, feature=name)
+                metrics.set("drift_ks", comparison["ks"], document_type=key, feature=name)
+            worst = max((c["psi"] for c in columns.values()), default=0.0)
+            entry.update(status=_status(worst), drifting=[n for n, c in columns.items() if c["status"] == "drift"],
+                         columns=columns)
+            report[key] = entry
+
+        return {
+            "baseline": {"created_at": self._baseline["created_at"], "source": self._baseline["source"],
+                         "document_types": {key: value["rows"] for key, value in types.items()}},
+            "thresholds": {"psi_warn": settings.drift_psi_warn, "psi_alert": settings.drift_psi_alert},
+            "document_types": report,
+        }
+
+
+drift_monitor = DriftMonitor(settings.drift_baseline_path, settings.drift_state_dir)
+atexit.register(drift_monitor.persist)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build a drift baseline or print the current drift summary")
+    parser.add_argument("--build-baseline", action="store_true", help="Write DRIFT_BASELINE_PATH")
+    parser.add_argument("--csv", help="Training features CSV (default: the feature store)")
+    args = parser.parse_args()
+
+    if args.build_baseline:
+        baseline = baseline_from_csv(args.csv) if args.csv else baseline_from_store(FeatureStore(settings.feature_store_dir))
+        save_baseline(baseline, settings.drift_baseline_path)
+        print(json.dumps({key: value["rows"] for key, value in baseline["document_types"].items()}))
+    else:
+        print(json.dumps(drift_monitor.summary(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,509 @@
+"""
+Change bus and server-sent events for iRembo Backend API
+
+Every write to an application or document request appends a row to
+``change_events`` in the same transaction, snapshotting the row after the
+change. Each API process tails that table from one background task (so
+changes made by other workers and by ``worker.py`` are seen too), keeps the
+in-process queue index in step, and fans events out to SSE subscribers.
+
+The same log serves delta sync: list endpoints accept ``since_seq`` and
+return only rows changed after that sequence number, plus tombstones for
+deleted rows.
+
+``GET /api/events/stream`` subscribes: citizens pass ``account_id`` and only
+receive their own changes plus their queue positions; officers pass
+``stage``. Event ids are ``change_events.seq``, so a reconnecting
+``EventSource`` resumes from its ``Last-Event-ID``.
+"""
+
+import asyncio
+import json
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Deque, Dict, List, Optional, Set, Tuple
+
+from config import settings
+from database import get_db_connection, get_db_cursor, format_query, using_postgres, execute_write_sync
+from json_columns import json_object_select, decode_json
+from queue_index import applications_queue, document_requests_queue
+from cache import apply_registry_change
+from utils import logger
+
+# Columns snapshotted into each event payload
+APPLICATION_EVENT_COLUMNS = [
+    "application_id", "status", "current_stage", "document_type", "priority",
+    "ai_confidence", "ai_verdict", "feedback", "created_at"
+]
+DOCUMENT_REQUEST_EVENT_COLUMNS = [
+    "request_id", "status", "document_type", "remarks", "requested_at", "updated_at"
+]
+APPEAL_EVENT_COLUMNS = [
+    "appeal_id", "application_id", "status", "notes", "created_at", "updated_at"
+]
+
+
+class SyncWindowExpired(Exception):
+    """The requested sync point is older than the retained change log"""
+
+
+def create_change_tables(cursor):
+    if using_postgres():
+        seq = "seq BIGSERIAL PRIMARY KEY"
+    else:
+        seq = "seq INTEGER PRIMARY KEY AUTOINCREMENT"
+    cursor.execute(f'''
+    CREATE TABLE IF NOT EXISTS change_events (
+        {seq},
+        entity TEXT,
+        entity_id TEXT,
+        account_id TEXT,
+        stage TEXT,
+        document_type TEXT,
+        payload TEXT,
+        created_at TEXT,
+        op TEXT DEFAULT 'upsert'
+    )
+    ''')
+    if using_postgres():
+        cursor.execute("ALTER TABLE change_events ADD COLUMN IF NOT EXISTS op TEXT DEFAULT 'upsert'")
+    else:
+        cursor.execute("PRAGMA table_info(change_events)")
+        if 'op' not in [info[1] for info in cursor.fetchall()]:
+            cursor.execute("ALTER TABLE change_events ADD COLUMN op TEXT DEFAULT 'upsert'")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_change_events_created_at ON change_events (created_at)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_change_events_entity_seq ON change_events (entity, seq)")
+
+
+def application_change(application_id: str) -> Tuple[str, tuple]:
+    """Statement recording the current state of an application; run it after the update"""
+    return (
+        "INSERT INTO change_events (entity, entity_id, account_id, stage, document_type, payload, created_at) "
+        f"SELECT 'application', application_id, account_id, current_stage, document_type, "
+        f"{json_object_select(APPLICATION_EVENT_COLUMNS)}, ? FROM applications WHERE application_id = ?",
+        (datetime.utcnow().isoformat(), application_id)
+    )
+
+
+def document_request_change(request_id: str) -> Tuple[str, tuple]:
+    """Statement recording the current state of a document request; run it after the update"""
+    return (
+        "INSERT INTO change_events (entity, entity_id, account_id, stage, document_type, payload, created_at) "
+        f"SELECT 'document_request', request_id, account_id, NULL, document_type, "
+        f"{json_object_select(DOCUMENT_REQUEST_EVENT_COLUMNS)}, ? FROM document_requests WHERE request_id = ?",
+        (datetime.utcnow().isoformat(), request_id)
+    )
+
+
+def appeal_change(appeal_id: str) -> Tuple[str, tuple]:
+    """Statement recording the current state of an appeal; run it after the update"""
+    return (
+        "INSERT INTO change_events (entity, entity_id, account_id, stage, document_type, payload, created_at) "
+        f"SELECT 'appeal', appeal_id, account_id, NULL, NULL, "
+        f"{json_object_select(APPEAL_EVENT_COLUMNS)}, ? FROM appeals WHERE appeal_id = ?",
+        (datetime.utcnow().isoformat(), appeal_id)
+    )
+
+
+def appeal_deletion(appeal_id: str) -> Tuple[str, tuple]:
+    """Tombstone for an appeal; run it before the DELETE"""
+    return (
+        "INSERT INTO change_events (entity, entity_id, account_id, stage, document_type, payload, created_at, op) "
+        f"SELECT 'appeal', appeal_id, account_id, NULL, NULL, "
+        f"{json_object_select(['appeal_id'])}, ?, 'delete' FROM appeals WHERE appeal_id = ?",
+        (datetime.utcnow().isoformat(), appeal_id)
+    )
+
+
+def application_archival(application_id: str) -> Tuple[str, tuple]:
+    """Tombstone for an application moved to cold storage (see archive.py); run it before the DELETE"""
+    return (
+        "INSERT INTO change_events (entity, entity_id, account_id, stage, document_type, payload, created_at, op) "
+        f"SELECT 'application', application_id, account_id, current_stage, document_type, "
+        f"{json_object_select(['application_id'])}, ?, 'delete' FROM applications WHERE application_id = ?",
+        (datetime.utcnow().isoformat(), application_id)
+    )
+
+
+def registry_change(table: str, citizen_id: Optional[str] = None,
+                    document_type: Optional[str] = None) -> Tuple[str, tuple]:
+    """Statement telling every process to drop cached registry or template entries (all of them without a key)"""
+    payload = json.dumps({"table": table, "citizen_id": citizen_id, "document_type": document_type})
+    return (
+        "INSERT INTO change_events (entity, entity_id, account_id, stage, document_type, payload, created_at) "
+        "VALUES ('registry', ?, NULL, NULL, ?, ?, ?)",
+        (table, document_type, payload, datetime.utcnow().isoformat())
+    )
+
+
+def registry_changes_since(after_seq: int) -> List[Dict]:
+    """Registry change events after ``after_seq``, for processes that do not run the change bus"""
+    conn = get_db_connection()
+    cursor = get_db_cursor(conn)
+    cursor.execute(format_query(
+        "SELECT seq, entity, entity_id, account_id, stage, document_type, payload, op "
+        "FROM change_events WHERE entity = 'registry' AND seq > ? ORDER BY seq"
+    ), (after_seq,))
+    events = [_row_to_event(row) for row in cursor.fetchall()]
+    conn.close()
+    return events
+
+
+# ==================== DELTA SYNC ====================
+
+def _sync_cutoff() -> str:
+    return (datetime.utcnow() - timedelta(hours=settings.change_events_retention_hours)).isoformat()
+
+
+def check_sync_window(since_seq: Optional[int], updated_since: Optional[str]):
+    """Raise SyncWindowExpired when deletions since the sync point may have been pruned"""
+    if updated_since is not None and updated_since < _sync_cutoff():
+        raise SyncWindowExpired("updated_since is older than the change log retention; reload the full list")
+    if since_seq is not None:
+        conn = get_db_connection()
+        cursor = get_db_cursor(conn)
+        cursor.execute("SELECT MIN(seq) AS seq FROM change_events")
+        row = cursor.fetchone()
+        conn.close()
+        oldest = row["seq"] if row else None
+        if oldest is not None and since_seq < oldest - 1:
+            raise SyncWindowExpired("since_seq is older than the change log retention; reload the full list")
+
+
+def changed_since_condition(entity: str, id_column: str, since_seq: int) -> Tuple[str, list]:
+    """WHERE condition selecting rows with a change after ``since_seq``"""
+    return (
+        f"{id_column} IN (SELECT entity_id FROM change_events WHERE entity = ? AND seq > ?)",
+        [entity, since_seq]
+    )
+
+
+def deleted_since(entity: str, since_seq: Optional[int] = None, updated_since: Optional[str] = None) -> List[str]:
+    """Ids of rows deleted after a sync point (tombstones)"""
+    if since_seq is None and updated_since is None:
+        return []
+    if since_seq is not None:
+        condition, param = "seq > ?", since_seq
+    else:
+        condition, param = "created_at > ?", updated_since
+    conn = get_db_connection()
+    cursor = get_db_cursor(conn)
+    cursor.execute(format_query(
+        f"SELECT DISTINCT entity_id FROM change_events WHERE entity = ? AND op = 'delete' AND {condition}"
+    ), (entity, param))
+    deleted = [row["entity_id"] for row in cursor.fetchall()]
+    conn.close()
+    return deleted
+
+
+def _row_to_event(row) -> Dict:
+    row = dict(row)
+    return {
+        "seq": row["seq"],
+        "entity": row["entity"],
+        "entity_id": row["entity_id"],
+        "account_id": row["account_id"],
+        "stage": row["stage"],
+        "document_type": row["document_type"],
+        "op": row["op"] or "upsert",
+        "data": decode_json(row["payload"], {}),
+    }
+
+
+def _fetch_events(after_seq: int, limit: int) -> List[Dict]:
+    conn = get_db_connection()
+    cursor = get_db_cursor(conn)
+    cursor.execute(format_query(
+        "SELECT seq, entity, entity_id, account_id, stage, document_type, payload, op "
+        "FROM change_events WHERE seq > ? ORDER BY seq LIMIT ?"
+    ), (after_seq, limit))
+    events = [_row_to_event(row) for row in cursor.fetchall()]
+    conn.close()
+    return events
+
+
+def current_seq() -> int:
+    """Latest change sequence number; clients pass it back as since_seq"""
+    conn = get_db_connection()
+    cursor = get_db_cursor(conn)
+    cursor.execute("SELECT MAX(seq) AS seq FROM change_events")
+    row = cursor.fetchone()
+    conn.close()
+    return (row["seq"] if row else None) or 0
+
+
+def entity_version(*entities: str) -> Tuple[int, Optional[str]]:
+    """
+    Sequence number and time of the latest change to any of ``entities``;
+    (0, None) when the log holds none. Each lookup is one probe of the
+    (entity, seq) index.
+    """
+    conn = get_db_connection()
+    cursor = get_db_cursor(conn)
+    latest = (0, None)
+    for entity in entities:
+        cursor.execute(format_query(
+            "SELECT seq, created_at FROM change_events WHERE entity = ? ORDER BY seq DESC LIMIT 1"
+        ), (entity,))
+        row = cursor.fetchone()
+        if row and row["seq"] > latest[0]:
+            latest = (row["seq"], row["created_at"])
+    conn.close()
+    return latest
+
+
+def _prune_events():
+    cutoff = (datetime.utcnow() - timedelta(hours=settings.change_events_retention_hours)).isoformat()
+    execute_write_sync([("DELETE FROM change_events WHERE created_at < ?", (cutoff,))])
+
+
+class Subscription:
+    """One SSE client: its filter, queued events and tracked queue positions"""
+
+    def __init__(self, account_id: Optional[str], stage: Optional[str], queue_size: int):
+        self.account_id = account_id
+        self.stage = stage
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.closed = False
+        # application_id -> (document_type, created_at) of this citizen's pending applications
+        self.tracked: Dict[str, Tuple[str, str]] = {}
+
+    def matches(self, event: Dict) -> bool:
+        if event["entity"] == "registry":
+            # Cache invalidation only; nothing for clients
+            return False
+        if self.account_id and event["account_id"] != self.account_id:
+            return False
+        if self.stage and event["entity"] == "application" and event["stage"] != self.stage:
+            return False
+        return True
+
+    def offer(self, event: Dict):
+        """Queue a matching event, or a queue-position recheck for another citizen's change"""
+        if self.closed:
+            return
+        if self.matches(event):
+            item = event
+        elif event["entity"] == "application" and any(t[0] == event["document_type"] for t in self.tracked.values()):
+            item = {"entity": "queue", "document_type": event["document_type"]}
+        else:
+            return
+        try:
+            self.queue.put_nowait(item)
+        except asyncio.QueueFull:
+            # Drop the slow client; it reconnects and resumes from Last-Event-ID
+            self.closed = True
+
+
+class ChangeBus:
+    """Tails ``change_events`` and fans new events out to subscribers"""
+
+    def __init__(self, poll_interval: float, buffer_size: int, gap_timeout: float = 2.0):
+        self.poll_interval = poll_interval
+        self.gap_timeout = gap_timeout
+        self._buffer: Deque[Dict] = deque(maxlen=buffer_size)
+        self._subscribers: Set[Subscription] = set()
+        self._last_seq = 0
+        self._gap_since: Optional[float] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def last_seq(self) -> int:
+        return self._last_seq
+
+    async def start(self):
+        if self._task is None:
+            self._wake = asyncio.Event()
+            self._last_seq = await asyncio.to_thread(current_seq)
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def notify(self):
+        """Wake the tail loop after a local write instead of waiting for the next poll"""
+        if self._wake is not None:
+            self._wake.set()
+
+    def subscribe(self, account_id: Optional[str] = None, stage: Optional[str] = None) -> Subscription:
+        subscription = Subscription(account_id, stage, settings.sse_queue_size)
+        self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        self._subscribers.discard(subscription)
+
+    async def replay(self, after_seq: int, subscription: Subscription) -> List[Dict]:
+        """Events after ``after_seq`` visible to a subscriber, from memory when possible"""
+        if self._buffer and self._buffer[0]["seq"] <= after_seq + 1:
+            events = [e for e in self._buffer if e["seq"] > after_seq]
+        else:
+            events = []
+            while True:
+                batch = await asyncio.to_thread(_fetch_events, after_seq, 1000)
+                batch = [e for e in batch if e["seq"] <= self._last_seq]
+                if not batch:
+                    break
+                events.extend(batch)
+                after_seq = batch[-1]["seq"]
+        return [e for e in events if subscription.matches(e)]
+
+    async def _run(self):
+        last_prune = 0.0
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                events = await asyncio.to_thread(_fetch_events, self._last_seq, 500)
+                self._dispatch(events)
+                if time.monotonic() - last_prune > 600:
+                    last_prune = time.monotonic()
+                    await asyncio.to_thread(_prune_events)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Change bus error: %s", e)
+
+    def _dispatch(self, events: List[Dict]):
+        for event in events:
+            if event["seq"] != self._last_seq + 1:
+                # A sequence gap is usually a PostgreSQL transaction that has
+                # not committed yet; wait for it briefly before skipping it
+                now = time.monotonic()
+                if self._gap_since is None:
+                    self._gap_since = now
+                if now - self._gap_since < self.gap_timeout:
+                    return
+            self._gap_since = None
+            self._last_seq = event["seq"]
+            self._apply(event)
+            self._buffer.append(event)
+            for subscription in list(self._subscribers):
+                subscription.offer(event)
+
+    def _apply(self, event: Dict):
+        """Keep this process's queue index and caches in step with changes made elsewhere"""
+        data = event["data"]
+        if event["entity"] == "application":
+            applications_queue.set_status(event["document_type"], event["entity_id"],
+                                          data.get("created_at"), data.get("status"))
+        elif event["entity"] == "document_request":
+            document_requests_queue.set_status(event["document_type"], event["entity_id"],
+                                               data.get("requested_at"), data.get("status"))
+        elif event["entity"] == "registry":
+            apply_registry_change(data)
+
+
+change_bus = ChangeBus(settings.change_bus_poll_seconds, settings.change_bus_buffer_size)
+
+
+# ==================== SERVER-SENT EVENTS ====================
+
+def _sse(event: str, data: Dict, event_id: Optional[int] = None) -> str:
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data, separators=(',', ':'), default=str)}")
+    return "\n".join(lines) + "\n\n"
+
+
+def _load_tracked(account_id: str) -> Dict[str, Tuple[str, str]]:
+    conn = get_db_connection()
+    cursor = get_db_cursor(conn)
+    cursor.execute(format_query(
+        "SELECT application_id, document_type, created_at FROM applications WHERE account_id = ? AND status = 'pending'"
+    ), (account_id,))
+    tracked = {r["application_id"]: (r["document_type"], r["created_at"]) for r in cursor.fetchall()}
+    conn.close()
+    return tracked
+
+
+class EventStream:
+    """SSE messages for one client connection"""
+
+    def __init__(self, request, account_id: Optional[str], stage: Optional[str], last_event_id: Optional[int]):
+        self.request = request
+        self.account_id = account_id
+        self.stage = stage
+        self.last_event_id = last_event_id
+        self._positions: Dict[str, int] = {}
+
+    def _queue_messages(self, subscription: Subscription, document_type: Optional[str] = None) -> List[str]:
+        messages = []
+        if subscription.account_id:
+            for application_id, (doc_type, created_at) in subscription.tracked.items():
+                if document_type and doc_type != document_type:
+                    continue
+                position = applications_queue.position(doc_type, created_at)
+                if self._positions.get(application_id) != position:
+                    self._positions[application_id] = position
+                    messages.append(_sse("queue", {
+                        "application_id": application_id,
+                        "document_type": doc_type,
+                        "queue_position": position
+                    }))
+        elif document_type:
+            messages.append(_sse("queue", {
+                "document_type": document_type,
+                "length": applications_queue.length(document_type)
+            }))
+        return messages
+
+    def _event_messages(self, subscription: Subscription, event: Dict) -> List[str]:
+        data = dict(event["data"], deleted=True) if event["op"] == "delete" else event["data"]
+        messages = [_sse(event["entity"], data, event["seq"])]
+        if event["entity"] == "application":
+            if subscription.account_id:
+                if event["data"].get("status") == "pending":
+                    subscription.tracked[event["entity_id"]] = (event["document_type"], event["data"].get("created_at"))
+                else:
+                    subscription.tracked.pop(event["entity_id"], None)
+                    self._positions.pop(event["entity_id"], None)
+            messages.extend(self._queue_messages(subscription, event["document_type"]))
+        return messages
+
+    async def messages(self):
+        bus = change_bus
+        subscription = bus.subscribe(self.account_id, self.stage)
+        # Everything after this point reaches the subscription queue
+        sent_seq = bus.last_seq
+        try:
+            yield f"retry: {settings.sse_retry_ms}\n\n"
+            if subscription.account_id:
+                subscription.tracked = await asyncio.to_thread(_load_tracked, subscription.account_id)
+                for message in self._queue_messages(subscription):
+                    yield message
+
+            if self.last_event_id is not None:
+                for event in await bus.replay(self.last_event_id, subscription):
+                    for message in self._event_messages(subscription, event):
+                        yield message
+                    sent_seq = max(sent_seq, event["seq"])
+
+            while not subscription.closed:
+                try:
+                    item = await asyncio.wait_for(subscription.queue.get(), timeout=settings.sse_heartbeat_seconds)
+                except asyncio.TimeoutError:
+                    if await self.request.is_disconnected():
+                        break
+                    yield ": keep-alive\n\n"
+                    continue
+
+                if item["entity"] == "queue":
+                    messages = self._queue_messages(subscription, item["document_type"])
+                elif item["seq"] <= sent_seq:
+                    continue  # already sent during replay
+                else:
+                    messages = self._event_messages(subscription, item)
+                for message in messages:
+                    yield message
+        finally:
+            bus.unsubscribe(subscription)
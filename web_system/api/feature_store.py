@@ -0,0 +1,237 @@
+"""
+Columnar feature store for iRembo Backend API
+
+Every document scored by the model leaves a row here: the image features
+``AIService.extract_features`` computed, the model confidence and verdict,
+the model version, and the application and document type it belongs to.
+Retraining, threshold analysis and drift baselines (see drift.py) can then
+read millions of documents without decoding a single image again.
+
+The store is a directory of fixed-width columns, one raw little-endian file
+per column (``mean_brightness.col`` holds float32 values, ``application_id.col``
+40-byte strings, ...), plus ``meta.json`` with the committed row count.
+Columns open as read-only ``np.memmap`` arrays, so reading is zero-copy:
+
+    from feature_store import FeatureStore, VERDICTS
+    columns = FeatureStore("feature_store").read(["blur_score", "verdict"])
+    columns["blur_score"][columns["verdict"] == VERDICTS.index("fraudulent")].mean()
+
+The prediction path only buffers rows; a background thread appends them in
+batches (every ``FEATURE_STORE_BATCH_SIZE`` rows, or
+``FEATURE_STORE_FLUSH_SECONDS``) under a file lock, so API workers and
+verification workers can share a store.
+The row count in ``meta.json`` is updated after the column files are
+fsynced; readers never see a partial row, and the next append truncates
+whatever an interrupted one left behind.
+
+Usage (from web_system/api):
+    python feature_store.py        # row count and per-column summary
+"""
+
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+from config import settings
+from metrics import metrics
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Same order as the keys of the feature dict built by extract_features
+FEATURE_COLUMNS = (
+    "mean_brightness", "std_brightness", "contrast", "edge_density", "blur_score",
+    "text_density", "hist_entropy", "aspect_ratio", "forensic_noise", "glare_index",
+)
+# Verdicts are stored as their index in this tuple
+VERDICTS = ("unknown", "authentic", "fraudulent", "suspicious")
+
+COLUMNS: Dict[str, np.dtype] = {
+    **{name: np.dtype("<f4") for name in FEATURE_COLUMNS},
+    "confidence": np.dtype("<f4"),
+    "verdict": np.dtype("u1"),
+    "scored_at": np.dtype("<f8"),
+    "application_id": np.dtype("S40"),
+    "document_type": np.dtype("S32"),
+    "model_version": np.dtype("S32"),
+}
+
+
+def _column_values(rows: List[Dict], name: str, dtype: np.dtype) -> np.ndarray:
+    if dtype.kind == "S":
+        # Longer strings are cut to the column width
+        return np.array([str(row.get(name) or "").encode()[:dtype.itemsize] for row in rows], dtype=dtype)
+    return np.array([row.get(name) or 0 for row in rows], dtype=dtype)
+
+
+class FeatureStore:
+    """Append-only directory of fixed-width columns"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._lock = threading.Lock()
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, f"{name}.col")
+
+    def _meta_path(self) -> str:
+        return os.path.join(self.directory, "meta.json")
+
+    def __len__(self) -> int:
+        try:
+            with open(self._meta_path()) as f:
+                return json.load(f)["rows"]
+        except FileNotFoundError:
+            return 0
+
+    @contextmanager
+    def _writer_lock(self):
+        os.makedirs(self.directory, exist_ok=True)
+        with self._lock, open(os.path.join(self.directory, ".lock"), "w") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield
+
+    def append(self, rows: List[Dict]) -> int:
+        """Append rows (dicts keyed by column name; missing values are 0/empty); returns the new row count"""
+        if not rows:
+            return len(self)
+        with self._writer_lock():
+            committed = len(self)
+            for name, dtype in COLUMNS.items():
+                values = _column_values(rows, name, dtype)
+                path = self._path(name)
+                with open(path, "r+b" if os.path.exists(path) else "wb") as f:
+                    # Drop anything an interrupted append wrote past the committed rows (or
+                    # zero-fill a column added since the store was created)
+                    f.truncate(committed * dtype.itemsize)
+                    f.seek(0, os.SEEK_END)
+                    f.write(values.tobytes())
+                    f.flush()
+                    os.fsync(f.fileno())
+            total = committed + len(rows)
+            temp_path = self._meta_path() + ".tmp"
+            with open(temp_path, "w") as f:
+                json.dump({"rows": total, "columns": {name: dtype.str for name, dtype in COLUMNS.items()}}, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, self._meta_path())
+        return total
+
+    def read(self, columns: Optional[Iterable[str]] = None) -> Dict[str, np.ndarray]:
+        """Committed rows as read-only memory-mapped arrays (no copy)"""
+        rows = len(self)
+        arrays = {}
+        for name in columns or COLUMNS:
+            dtype = COLUMNS[name]
+            if rows == 0:
+                arrays[name] = np.empty(0, dtype=dtype)
+            else:
+                arrays[name] = np.memmap(self._path(name), dtype=dtype, mode="r", shape=(rows,))
+        return arrays
+
+    def features(self) -> np.ndarray:
+        """Feature columns as one (rows, features) float32 matrix (this one is a copy)"""
+        arrays = self.read(FEATURE_COLUMNS)
+        return np.column_stack([arrays[name] for name in FEATURE_COLUMNS]) if len(self) else \
+            np.empty((0, len(FEATURE_COLUMNS)), dtype=np.float32)
+
+
+class FeatureRecorder:
+    """Buffers scored documents and appends them to the store in batches"""
+
+    def __init__(self, store: FeatureStore, batch_size: int, flush_seconds: float):
+        self.store = store
+        self.batch_size = max(1, batch_size)
+        self.flush_seconds = max(0.1, flush_seconds)
+        self._buffer: List[Dict] = []
+        self._lock = threading.Lock()
+        self._batch_ready = threading.Event()
+        self._flusher: Optional[threading.Thread] = None
+
+    def _flush_loop(self):
+        while True:
+            self._batch_ready.wait(self.flush_seconds)
+            self._batch_ready.clear()
+            self.flush()
+
+    def record(self, row: Dict):
+        """Buffer one row; never touches the disk itself"""
+        with self._lock:
+            self._buffer.append(row)
+            # Started on first use, so forked workers each run their own
+            if self._flusher is None or not self._flusher.is_alive():
+                self._flusher = threading.Thread(target=self._flush_loop, name="feature-store-flush", daemon=True)
+                self._flusher.start()
+            if len(self._buffer) >= self.batch_size:
+                self._batch_ready.set()
+
+    def flush(self):
+        with self._lock:
+            rows, self._buffer = self._buffer, []
+        if not rows:
+            return
+        started = time.perf_counter()
+        try:
+            self.store.append(rows)
+        except Exception as e:
+            metrics.inc("feature_store_errors")
+            logger.error("Feature store append of %d rows failed: %s", len(rows), e)
+            return
+        metrics.inc("feature_store_rows", len(rows))
+        metrics.observe("feature_store_flush_seconds", time.perf_counter() - started)
+
+
+feature_store = FeatureStore(settings.feature_store_dir)
+recorder = FeatureRecorder(feature_store, settings.feature_store_batch_size, settings.feature_store_flush_seconds)
+atexit.register(recorder.flush)
+
+
+def record_prediction(application_id: str, ai_result: Dict, document_type: Optional[str] = None):
+    """Queue the features of a prediction for the store, removing them from ``ai_result``
+
+    Simulated predictions carry no features and are not recorded.
+    """
+    features = ai_result.pop("features", None)
+    if not features or not settings.feature_store_enabled:
+        return
+    verdict = ai_result.get("verdict", "unknown")
+    recorder.record({
+        **{name: features.get(name) for name in FEATURE_COLUMNS},
+        "confidence": ai_result.get("prediction"),
+        "verdict": VERDICTS.index(verdict) if verdict in VERDICTS else 0,
+        "scored_at": time.time(),
+        "application_id": application_id,
+        "document_type": document_type,
+        "model_version": ai_result.get("model_version"),
+    })
+
+
+def main():
+    store = FeatureStore(settings.feature_store_dir)
+    columns = store.read()
+    summary = {"rows": len(store), "columns": {}}
+    for name in FEATURE_COLUMNS + ("confidence",):
+        values = columns[name]
+        summary["columns"][name] = {
+            "mean": float(values.mean()), "min": float(values.min()), "max": float(values.max())
+        } if len(values) else {}
+    summary["verdicts"] = {
+        VERDICTS[code]: int(count) for code, count in enumerate(np.bincount(columns["verdict"], minlength=len(VERDICTS)))
+    }
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
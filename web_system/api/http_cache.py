@@ -0,0 +1,81 @@
+"""
+Conditional GET for iRembo Backend API list endpoints
+
+Validators come from the change log (see ``events.py``): the ETag of a list
+is the sequence number of the latest change to the tables it reads, and
+Last-Modified is the time of that change. Checking them costs one index
+probe per table, so an unchanged dashboard poll is answered with
+``304 Not Modified`` before any rows are read.
+
+Validators are read before the rows, like ``next_seq``: a change racing the
+query gives the client an older ETag and a fresh body on its next poll.
+Tables whose changes have all been pruned from the log get no validators.
+"""
+
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Optional, Tuple
+
+from fastapi import Request, Response
+
+from events import entity_version
+from metrics import metrics
+
+Validators = Tuple[str, Optional[str]]
+
+
+def list_validators(*entities: str) -> Optional[Validators]:
+    """(ETag, Last-Modified) for a response built from ``entities``, or None"""
+    seq, changed_at = entity_version(*entities)
+    if not seq:
+        return None
+    etag = f'W/"{"+".join(entities)}-{seq}"'
+    last_modified = None
+    if changed_at:
+        last_modified = format_datetime(datetime.fromisoformat(changed_at).replace(tzinfo=timezone.utc), usegmt=True)
+    return etag, last_modified
+
+
+def _opaque(tag: str) -> str:
+    tag = tag.strip()
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def _is_fresh(request: Request, validators: Validators) -> bool:
+    etag, last_modified = validators
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        # Weak comparison (RFC 9110 13.1.2); If-Modified-Since is then ignored
+        tags = [_opaque(tag) for tag in if_none_match.split(",")]
+        return "*" in tags or _opaque(etag) in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified:
+        try:
+            return parsedate_to_datetime(last_modified) <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def _headers(validators: Validators) -> dict:
+    etag, last_modified = validators
+    # Per-account lists: browsers may keep them, but must revalidate each time
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if last_modified:
+        headers["Last-Modified"] = last_modified
+    return headers
+
+
+def not_modified(request: Request, validators: Optional[Validators]) -> Optional[Response]:
+    """A 304 response when the client's copy is current, else None"""
+    if validators is None or not _is_fresh(request, validators):
+        return None
+    metrics.inc("http_not_modified", path=request.url.path)
+    return Response(status_code=304, headers=_headers(validators))
+
+
+def with_validators(response: Response, validators: Optional[Validators]) -> Response:
+    """Attach ETag, Last-Modified and Cache-Control to a full response"""
+    if validators is not None:
+        response.headers.update(_headers(validators))
+    return response
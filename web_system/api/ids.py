@@ -0,0 +1,69 @@
+"""
+Entity ID generation for iRembo Backend API
+
+IDs are ULIDs (https://github.com/ulid/spec) behind the entity prefix, e.g.
+``APP-01JAB3K9Q2N4X7V8M5R6T1W0YZ``: a 48-bit millisecond timestamp and 80
+random bits in Crockford base32, so IDs sort by creation time as plain
+strings and new rows land at the right-hand end of primary key indexes.
+
+Within a process, IDs generated in the same millisecond increment the random
+part instead of drawing a new one, so they stay strictly increasing. Each
+process (including forked uvicorn workers) draws its own randomness, which
+keeps IDs from different processes apart without any coordination.
+"""
+
+import os
+import threading
+import time
+
+_ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+_RANDOM_BITS = 80
+_RANDOM_MAX = (1 << _RANDOM_BITS) - 1
+
+_lock = threading.Lock()
+_last_ms = 0
+_last_random = 0
+
+
+def _reset():
+    global _last_ms, _last_random
+    _last_ms = 0
+    _last_random = 0
+
+
+# A forked worker must not continue its parent's sequence
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset)
+
+
+def _encode(value: int, length: int) -> str:
+    chars = []
+    for _ in range(length):
+        value, digit = divmod(value, 32)
+        chars.append(_ALPHABET[digit])
+    return "".join(reversed(chars))
+
+
+def new_ulid() -> str:
+    """26-character ULID, strictly increasing within this process"""
+    global _last_ms, _last_random
+    with _lock:
+        now_ms = time.time_ns() // 1_000_000
+        if now_ms <= _last_ms:
+            # Same millisecond (or the clock stepped back): continue the sequence
+            now_ms = _last_ms
+            random_part = _last_random + 1
+            if random_part > _RANDOM_MAX:
+                now_ms += 1
+                random_part = int.from_bytes(os.urandom(10), "big") >> 1
+        else:
+            # Top bit clear leaves room to increment within the millisecond
+            random_part = int.from_bytes(os.urandom(10), "big") >> 1
+        _last_ms, _last_random = now_ms, random_part
+    return _encode(now_ms, 10) + _encode(random_part, 16)
+
+
+def generate_id(prefix: str) -> str:
+    """Time-sortable entity ID, e.g. ``APP-01JAB3K9Q2N4X7V8M5R6T1W0YZ``"""
+    return f"{prefix}-{new_ulid()}"
+
@@ -0,0 +1,414 @@
+"""
+Shared inference server for iRembo Backend API
+
+Every API worker (``uvicorn --workers N``) and verification worker used to
+load TensorFlow and its own copy of the model. With
+``AI_SERVICE_MODE=remote`` they send documents to this process instead. It
+holds the only copy of the model and scores documents from all clients
+together: requests that arrive within ``INFERENCE_BATCH_WAIT_MS`` of each
+other (up to ``INFERENCE_MAX_BATCH``) share one model call.
+
+Clients connect over a Unix domain socket at ``INFERENCE_SOCKET_PATH``. Each
+message is a 12-byte header followed by its payload:
+
+    magic "IR" | version u8 | type u8 | request id u32 | payload length u32
+
+- ``PREDICT``: u32 length of a JSON object with the request's
+  ``user_data`` and ``document_type`` (which picks the model, see
+  model_router.py), that JSON, then the raw image bytes
+- ``RESULT``: the prediction as JSON; ``ERROR``: a UTF-8 message
+- ``PING``: empty; ``PONG``: server statistics as JSON
+
+``RemoteAIService`` is the client. It starts the server on first use when
+``INFERENCE_AUTOSTART`` is on (a lock file next to the socket makes sure
+only one process spawns it), and the API checks its health every
+``INFERENCE_HEALTH_INTERVAL_SECONDS``. A spawned server runs in its own
+session so it outlives the worker that started it.
+
+Usage (from web_system/api):
+    python inference_server.py
+"""
+
+import asyncio
+import fcntl
+import itertools
+import json
+import os
+import signal
+import socket
+import struct
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import settings
+from metrics import metrics
+from thread_budget import apply_thread_budget
+
+apply_thread_budget()
+
+from utils import AIService, logger
+
+HEADER = struct.Struct("!2sBBII")
+MAGIC = b"IR"
+VERSION = 2
+PREDICT, RESULT, ERROR, PING, PONG = 1, 2, 3, 4, 5
+_META_LENGTH = struct.Struct("!I")
+
+# Largest accepted payload: an upload plus its user data
+MAX_PAYLOAD = settings.max_file_size + 64 * 1024
+
+
+class ProtocolError(Exception):
+    """Malformed or unexpected message on the inference socket"""
+
+
+class InferenceUnavailable(RuntimeError):
+    """The inference server could not be reached or started"""
+
+
+def encode_message(msg_type: int, request_id: int, payload: bytes = b"") -> bytes:
+    return HEADER.pack(MAGIC, VERSION, msg_type, request_id, len(payload)) + payload
+
+
+def decode_header(header: bytes) -> Tuple[int, int, int]:
+    """(type, request id, payload length) of a message header"""
+    magic, version, msg_type, request_id, length = HEADER.unpack(header)
+    if magic != MAGIC or version != VERSION:
+        raise ProtocolError(f"Unsupported message (magic={magic!r}, version={version})")
+    if length > MAX_PAYLOAD:
+        raise ProtocolError(f"Payload of {length} bytes exceeds {MAX_PAYLOAD}")
+    return msg_type, request_id, length
+
+
+def encode_predict(file_bytes: bytes, user_data: Optional[Dict] = None, document_type: Optional[str] = None) -> bytes:
+    meta = json.dumps({"user_data": user_data, "document_type": document_type}).encode()
+    return _META_LENGTH.pack(len(meta)) + meta + file_bytes
+
+
+def decode_predict(payload: bytes) -> Tuple[bytes, Optional[Dict], Optional[str]]:
+    """(image bytes, user_data, document_type) of a PREDICT payload"""
+    (meta_length,) = _META_LENGTH.unpack_from(payload)
+    start = _META_LENGTH.size
+    meta = json.loads(payload[start:start + meta_length]) if meta_length else {}
+    return payload[start + meta_length:], meta.get("user_data"), meta.get("document_type")
+
+
+# ==================== SERVER ====================
+
+class InferenceServer:
+    """Serves one AIService to many clients, batching their requests"""
+
+    def __init__(self, service: AIService = None, socket_path: str = None,
+                 max_batch: int = None, batch_wait_ms: float = None):
+        self.service = service
+        self.socket_path = socket_path or settings.inference_socket_path
+        self.max_batch = max(1, max_batch or settings.inference_max_batch)
+        wait_ms = batch_wait_ms if batch_wait_ms is not None else settings.inference_batch_wait_ms
+        self.batch_wait = max(0.0, wait_ms) / 1000
+        self.started_at = time.time()
+        self.requests = 0
+        self.batches = 0
+        self.errors = 0
+        self._queue: Optional[asyncio.Queue] = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pid": os.getpid(),
+            "uptime_seconds": round(time.time() - self.started_at, 1),
+            "model_loaded": bool(self.service and self.service.model is not None),
+            "requests": self.requests,
+            "batches": self.batches,
+            "avg_batch_size": round(self.requests / self.batches, 2) if self.batches else 0.0,
+            "errors": self.errors,
+            "queued": self._queue.qsize() if self._queue else 0,
+            "models": self.service.router.stats() if self.service else None,
+        }
+
+    async def serve(self):
+        if self.service is None:
+            self.service = await asyncio.to_thread(AIService)
+        self._queue = asyncio.Queue()
+        _remove_stale_socket(self.socket_path)
+        server = await asyncio.start_unix_server(self._handle_client, path=self.socket_path)
+        os.chmod(self.socket_path, 0o600)
+        batcher = asyncio.create_task(self._batch_loop())
+        logger.info("Inference server %d listening on %s", os.getpid(), self.socket_path)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            batcher.cancel()
+            try:
+                os.unlink(self.socket_path)
+            except OSError:
+                pass
+
+    async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        write_lock = asyncio.Lock()
+        pending = set()
+        try:
+            while True:
+                msg_type, request_id, length = decode_header(await reader.readexactly(HEADER.size))
+                payload = await reader.readexactly(length)
+                if msg_type == PING:
+                    await self._send(writer, write_lock, PONG, request_id, json.dumps(self.stats()).encode())
+                elif msg_type == PREDICT:
+                    # Replies go out as batches finish, so a client may pipeline requests
+                    task = asyncio.create_task(self._predict(writer, write_lock, request_id, payload))
+                    pending.add(task)
+                    task.add_done_callback(pending.discard)
+                else:
+                    await self._send(writer, write_lock, ERROR, request_id, f"Unknown message type {msg_type}".encode())
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except ProtocolError as e:
+            logger.warning("Inference client dropped: %s", e)
+        finally:
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+            writer.close()
+
+    async def _send(self, writer: asyncio.StreamWriter, write_lock: asyncio.Lock,
+                    msg_type: int, request_id: int, payload: bytes):
+        async with write_lock:
+            writer.write(encode_message(msg_type, request_id, payload))
+            await writer.drain()
+
+    async def _predict(self, writer, write_lock, request_id: int, payload: bytes):
+        try:
+            file_bytes, user_data, document_type = decode_predict(payload)
+            future = asyncio.get_running_loop().create_future()
+            await self._queue.put((file_bytes, user_data, document_type, future))
+            reply_type, reply = RESULT, json.dumps(await future).encode()
+        except Exception as e:
+            self.errors += 1
+            reply_type, reply = ERROR, f"{type(e).__name__}: {e}".encode()
+        try:
+            await self._send(writer, write_lock, reply_type, request_id, reply)
+        except ConnectionError:
+            pass
+
+    async def _batch_loop(self):
+        while True:
+            batch = [await self._queue.get()]
+            if self.max_batch > 1 and self.batch_wait > 0:
+                # Give requests from other workers a moment to join this model call
+                await asyncio.sleep(self.batch_wait)
+            while len(batch) < self.max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+
+            self.requests += len(batch)
+            self.batches += 1
+            try:
+                results = await asyncio.to_thread(
+                    self.service.predict_batch,
+                    [file_bytes for file_bytes, _, _, _ in batch],
+                    [user_data for _, user_data, _, _ in batch],
+                    [document_type for _, _, document_type, _ in batch],
+                )
+            except Exception as e:
+                logger.error("Inference batch of %d failed: %s", len(batch), e)
+                for *_, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (*_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+
+def _remove_stale_socket(path: str):
+    """Unlink a socket file left behind by a server that is no longer running"""
+    if not os.path.exists(path):
+        return
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except OSError:
+        os.unlink(path)
+    else:
+        raise RuntimeError(f"An inference server is already listening on {path}")
+    finally:
+        probe.close()
+
+
+# ==================== CLIENT ====================
+
+def _recv_exactly(sock: socket.socket, size: int) -> bytes:
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1 << 20))
+        if not chunk:
+            raise ConnectionError("Inference server closed the connection")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+@contextmanager
+def _spawn_lock(socket_path: str):
+    """Exclusive lock shared by every process that might start the server"""
+    with open(f"{socket_path}.lock", "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class RemoteAIService:
+    """AIService stand-in that scores documents on the shared inference server"""
+
+    def __init__(self, socket_path: str = None):
+        self.socket_path = socket_path or settings.inference_socket_path
+        self._local = threading.local()
+        self._ids = itertools.count(1)
+        self._spawn_lock = threading.Lock()
+
+    def _connection(self) -> socket.socket:
+        # One connection per thread: predict runs in to_thread and worker pools
+        sock = getattr(self._local, "sock", None)
+        if sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(settings.inference_timeout_seconds)
+            try:
+                sock.connect(self.socket_path)
+            except OSError:
+                sock.close()
+                raise
+            self._local.sock = sock
+        return sock
+
+    def _disconnect(self):
+        sock = getattr(self._local, "sock", None)
+        self._local.sock = None
+        if sock is not None:
+            sock.close()
+
+    def _call(self, msg_type: int, payload: bytes = b"") -> Tuple[int, bytes]:
+        request_id = next(self._ids) & 0xFFFFFFFF
+        sock = self._connection()
+        try:
+            sock.sendall(encode_message(msg_type, request_id, payload))
+            reply_type, reply_id, length = decode_header(_recv_exactly(sock, HEADER.size))
+            reply = _recv_exactly(sock, length)
+            if reply_id != request_id:
+                raise ProtocolError(f"Reply {reply_id} does not match request {request_id}")
+        except (OSError, ProtocolError):
+            # The stream is out of step or gone; never reuse it
+            self._disconnect()
+            raise
+        return reply_type, reply
+
+    def _request(self, msg_type: int, payload: bytes = b"") -> Tuple[int, bytes]:
+        try:
+            return self._call(msg_type, payload)
+        except socket.timeout as e:
+            # The server is up but slow; sending the request again would only add to its load
+            metrics.inc("inference_remote_timeouts")
+            raise InferenceUnavailable(
+                f"Inference server did not answer within {settings.inference_timeout_seconds:.0f}s"
+            ) from e
+        except (ConnectionError, FileNotFoundError):
+            # Refused, reset or no socket: the server restarted or is not started yet
+            pass
+        except (OSError, ProtocolError) as e:
+            metrics.inc("inference_remote_errors")
+            raise InferenceUnavailable(f"Inference server unavailable: {e}") from e
+
+        # Make sure one is up and retry once
+        self.ensure_server()
+        try:
+            return self._call(msg_type, payload)
+        except (OSError, ProtocolError) as e:
+            metrics.inc("inference_remote_errors")
+            raise InferenceUnavailable(f"Inference server unavailable: {e}") from e
+
+    def predict(self, file_source, user_data: Dict = None, document_type: Optional[str] = None) -> Dict[str, Any]:
+        """Same result as AIService.predict, computed by the inference server"""
+        if isinstance(file_source, str):
+            with open(file_source, "rb") as f:
+                file_source = f.read()
+        started = time.perf_counter()
+        reply_type, reply = self._request(PREDICT, encode_predict(file_source, user_data, document_type))
+        metrics.observe("inference_remote_seconds", time.perf_counter() - started)
+        if reply_type != RESULT:
+            metrics.inc("inference_remote_errors")
+            raise RuntimeError(f"Inference failed: {reply.decode(errors='replace')}")
+        return json.loads(reply)
+
+    def predict_batch(self, file_sources: List, user_data: List[Optional[Dict]] = None,
+                      document_types: List[Optional[str]] = None) -> List[Dict[str, Any]]:
+        user_data = user_data or [None] * len(file_sources)
+        document_types = document_types or [None] * len(file_sources)
+        return [self.predict(*request) for request in zip(file_sources, user_data, document_types)]
+
+    def ping(self) -> Optional[Dict[str, Any]]:
+        """Server statistics, or None when no server answers"""
+        try:
+            reply_type, reply = self._call(PING)
+        except (OSError, ProtocolError):
+            return None
+        return json.loads(reply) if reply_type == PONG else None
+
+    def ensure_server(self) -> Dict[str, Any]:
+        """Make sure a server answers on the socket, starting one if allowed"""
+        stats = self.ping()
+        if stats is not None:
+            return stats
+        if not settings.inference_autostart:
+            raise InferenceUnavailable(f"No inference server on {self.socket_path} and INFERENCE_AUTOSTART is off")
+
+        with self._spawn_lock, _spawn_lock(self.socket_path):
+            # Another thread or process may have started it while we waited
+            stats = self.ping()
+            if stats is not None:
+                return stats
+            script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "inference_server.py")
+            process = subprocess.Popen([sys.executable, script], start_new_session=True)
+            logger.info("Started inference server (pid %d) on %s", process.pid, self.socket_path)
+            deadline = time.monotonic() + settings.inference_start_timeout_seconds
+            while time.monotonic() < deadline:
+                time.sleep(0.2)
+                stats = self.ping()
+                if stats is not None:
+                    return stats
+                if process.poll() is not None:
+                    raise InferenceUnavailable(f"Inference server exited with code {process.returncode}")
+        raise InferenceUnavailable(
+            f"Inference server did not start within {settings.inference_start_timeout_seconds:.0f}s"
+        )
+
+
+async def health_check_loop(service: RemoteAIService):
+    """Check (and if needed restart) the inference server until cancelled"""
+    while True:
+        try:
+            stats = await asyncio.to_thread(service.ensure_server)
+            metrics.set("inference_server_up", 1)
+            for key in ("requests", "batches", "avg_batch_size", "errors", "queued"):
+                metrics.set(f"inference_server_{key}", stats.get(key, 0))
+        except Exception as e:
+            metrics.set("inference_server_up", 0)
+            logger.error("Inference server health check failed: %s", e)
+        await asyncio.sleep(settings.inference_health_interval_seconds)
+
+
+async def _main():
+    server = InferenceServer()
+    task = asyncio.create_task(server.serve())
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, task.cancel)
+    try:
+        await task
+    except asyncio.CancelledError:
+        logger.info("Inference server stopped")
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
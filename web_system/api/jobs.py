@@ -0,0 +1,290 @@
+"""
+Verification job queue for iRembo Backend API
+
+``POST /api/upload`` stores the application with status ``queued`` and inserts
+a ``verification_jobs`` row in the same transaction. Worker processes
+(``python worker.py``) claim jobs from the table, move the application to
+``processing``, score its documents and hand it to officers as ``pending``.
+The database is the queue, so no broker is needed.
+
+A failed job is retried with exponential backoff. After ``JOB_MAX_ATTEMPTS``
+it is dead-lettered (status ``dead``) and the application goes to officers
+unverified. A worker refreshes the lock (``locked_at``) of the jobs it is
+scoring; jobs whose lock is older than ``JOB_VISIBILITY_TIMEOUT_SECONDS``
+(their worker died) are re-queued. Completing or failing a job only writes
+while the worker still holds it, so a re-queued job is never closed by the
+worker that lost it.
+
+The worker the API starts (``VERIFICATION_WORKER_AUTOSTART``) holds
+``autostart_lock()``, so with several API workers only one of them starts it.
+"""
+
+import os
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from config import settings
+from ids import generate_id
+from database import get_db_connection, get_db_cursor, format_query, using_postgres, execute_write_sync
+from json_columns import JSON_COLUMNS, json_placeholder
+from events import application_change
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+# Job statuses
+QUEUED = "queued"
+PROCESSING = "processing"
+DONE = "done"
+DEAD = "dead"
+
+
+def autostart_lock():
+    """Lock file of the autostarted worker, locked without waiting; None when another process holds it"""
+    directory = os.path.dirname(settings.verification_worker_lock_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    lock_file = open(settings.verification_worker_lock_path, "w")
+    if fcntl is not None:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return None
+    return lock_file
+
+
+def create_job_tables(cursor):
+    """Create the job table and its claim index (same DDL on both backends)"""
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS verification_jobs (
+        job_id TEXT PRIMARY KEY,
+        application_id TEXT,
+        status TEXT,
+        attempts INTEGER DEFAULT 0,
+        max_attempts INTEGER,
+        run_after TEXT,
+        locked_by TEXT,
+        locked_at TEXT,
+        last_error TEXT,
+        created_at TEXT,
+        updated_at TEXT
+    )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_verification_jobs_claim ON verification_jobs (status, run_after)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_verification_jobs_application ON verification_jobs (application_id)")
+
+
+def _now() -> str:
+    return datetime.utcnow().isoformat()
+
+
+def enqueue_statements(application_id: str) -> Tuple[str, List[Tuple[str, tuple]]]:
+    """Job id and the INSERT to run in the same write as the application row"""
+    job_id = generate_id("JOB")
+    now = _now()
+    return job_id, [(
+        "INSERT INTO verification_jobs (job_id, application_id, status, attempts, max_attempts, run_after, created_at, updated_at) "
+        "VALUES (?, ?, ?, 0, ?, ?, ?, ?)",
+        (job_id, application_id, QUEUED, settings.job_max_attempts, now, now, now)
+    )]
+
+
+def claim_job(worker_id: str) -> Optional[Dict]:
+    """
+    Atomically take the oldest runnable job and mark it (and its application)
+    as processing. Returns None when the queue is empty.
+    """
+    now = _now()
+    conn = get_db_connection()
+    cursor = get_db_cursor(conn)
+    try:
+        if using_postgres():
+            cursor.execute(format_query('''
+                UPDATE verification_jobs
+                SET status = ?, attempts = attempts + 1, locked_by = ?, locked_at = ?, updated_at = ?
+                WHERE job_id = (
+                    SELECT job_id FROM verification_jobs
+                    WHERE status = ? AND run_after <= ?
+                    ORDER BY run_after
+                    LIMIT 1
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING job_id, application_id, attempts, max_attempts
+            '''), (PROCESSING, worker_id, now, now, QUEUED, now))
+            row = cursor.fetchone()
+        else:
+            # The write lock serializes claims across worker processes
+            cursor.execute("BEGIN IMMEDIATE")
+            cursor.execute('''
+                SELECT job_id, application_id, attempts, max_attempts FROM verification_jobs
+                WHERE status = ? AND run_after <= ?
+                ORDER BY run_after
+                LIMIT 1
+            ''', (QUEUED, now))
+            row = cursor.fetchone()
+            if row:
+                cursor.execute('''
+                    UPDATE verification_jobs
+                    SET status = ?, attempts = attempts + 1, locked_by = ?, locked_at = ?, updated_at = ?
+                    WHERE job_id = ?
+                ''', (PROCESSING, worker_id, now, now, row["job_id"]))
+
+        if not row:
+            conn.commit()
+            return None
+
+        job = dict(row, locked_by=worker_id)
+        if not using_postgres():
+            job["attempts"] += 1
+        cursor.execute(format_query("UPDATE applications SET status = ?, updated_at = ? WHERE application_id = ? AND status = ?"),
+                       (PROCESSING, now, job["application_id"], QUEUED))
+        change_query, change_params = application_change(job["application_id"])
+        cursor.execute(format_query(change_query), change_params)
+        conn.commit()
+        return job
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def _guarded_write(guard: Tuple[str, tuple], statements: List[Tuple[str, tuple]]) -> bool:
+    """
+    Run ``guard`` (a job UPDATE) and, only if it matched the job, the other
+    statements, in one transaction. False when the job was not matched.
+    """
+    conn = get_db_connection()
+    cursor = get_db_cursor(conn)
+    try:
+        cursor.execute(format_query(guard[0]), guard[1])
+        if cursor.rowcount != 1:
+            conn.rollback()
+            return False
+        for query, params in statements:
+            cursor.execute(format_query(query), params)
+        conn.commit()
+        return True
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def touch_job(job: Dict) -> bool:
+    """Refresh the lock of a job still being scored; False when this worker lost it"""
+    return execute_write_sync([(
+        "UPDATE verification_jobs SET locked_at = ? WHERE job_id = ? AND status = ? AND locked_by = ?",
+        (_now(), job["job_id"], PROCESSING, job["locked_by"])
+    )]) == 1
+
+
+def complete_job(job: Dict, application_fields: Dict) -> bool:
+    """
+    Store the scoring results and release the application to the officer
+    queue. False (and nothing written) when the job was re-queued meanwhile.
+    """
+    assignments = ", ".join(
+        f"{column} = {json_placeholder() if column in JSON_COLUMNS else '?'}" for column in application_fields
+    )
+    now = _now()
+    return _guarded_write(
+        ("UPDATE verification_jobs SET status = ?, last_error = NULL, locked_by = NULL, updated_at = ? "
+         "WHERE job_id = ? AND status = ? AND locked_by = ?",
+         (DONE, now, job["job_id"], PROCESSING, job["locked_by"])),
+        [
+            (f"UPDATE applications SET {assignments}, status = 'pending', updated_at = ? WHERE application_id = ? AND status = ?",
+             (*application_fields.values(), now, job["application_id"], PROCESSING)),
+            application_change(job["application_id"]),
+        ]
+    )
+
+
+def fail_job(job: Dict, error: str) -> Optional[str]:
+    """
+    Schedule a retry with exponential backoff, or dead-letter the job once it
+    has used all its attempts. Returns the new job status, or None (and
+    nothing written) when the job was re-queued meanwhile.
+    """
+    now = datetime.utcnow()
+    if job["attempts"] >= job["max_attempts"]:
+        written = _guarded_write(
+            ("UPDATE verification_jobs SET status = ?, last_error = ?, locked_by = NULL, updated_at = ? "
+             "WHERE job_id = ? AND status = ? AND locked_by = ?",
+             (DEAD, error, now.isoformat(), job["job_id"], PROCESSING, job["locked_by"])),
+            [
+                ("UPDATE applications SET status = 'pending', priority = 'high', ai_verdict = 'unverified', feedback = ?, updated_at = ? "
+                 "WHERE application_id = ? AND status IN (?, ?)",
+                 ("Automated verification failed. Manual review required.", now.isoformat(), job["application_id"], QUEUED, PROCESSING)),
+                application_change(job["application_id"]),
+            ]
+        )
+        return DEAD if written else None
+
+    delay = settings.job_retry_backoff_seconds * (2 ** (job["attempts"] - 1))
+    written = _guarded_write(
+        ("UPDATE verification_jobs SET status = ?, last_error = ?, locked_by = NULL, run_after = ?, updated_at = ? "
+         "WHERE job_id = ? AND status = ? AND locked_by = ?",
+         (QUEUED, error, (now + timedelta(seconds=delay)).isoformat(), now.isoformat(), job["job_id"],
+          PROCESSING, job["locked_by"])),
+        [
+            ("UPDATE applications SET status = ?, updated_at = ? WHERE application_id = ? AND status = ?",
+             (QUEUED, now.isoformat(), job["application_id"], PROCESSING)),
+            application_change(job["application_id"]),
+        ]
+    )
+    return QUEUED if written else None
+
+
+def requeue_stale_jobs() -> int:
+    """Return jobs locked longer than the visibility timeout to the queue"""
+    cutoff = (datetime.utcnow() - timedelta(seconds=settings.job_visibility_timeout_seconds)).isoformat()
+    conn = get_db_connection()
+    cursor = get_db_cursor(conn)
+    cursor.execute(format_query("SELECT job_id, application_id FROM verification_jobs WHERE status = ? AND locked_at < ?"),
+                   (PROCESSING, cutoff))
+    stale = [dict(row) for row in cursor.fetchall()]
+    conn.close()
+
+    requeued = 0
+    for job in stale:
+        # Skipped if the worker refreshed its lock since the SELECT
+        requeued += _guarded_write(
+            ("UPDATE verification_jobs SET status = ?, locked_by = NULL, updated_at = ? "
+             "WHERE job_id = ? AND status = ? AND locked_at < ?",
+             (QUEUED, _now(), job["job_id"], PROCESSING, cutoff)),
+            [
+                ("UPDATE applications SET status = ?, updated_at = ? WHERE application_id = ? AND status = ?",
+                 (QUEUED, _now(), job["application_id"], PROCESSING)),
+                application_change(job["application_id"]),
+            ]
+        )
+    return requeued
+
+
+def get_job_for_application(application_id: str) -> Optional[Dict]:
+    """Latest job for an application"""
+    conn = get_db_connection()
+    cursor = get_db_cursor(conn)
+    cursor.execute(format_query('''
+        SELECT job_id, status, attempts, max_attempts, run_after, last_error, created_at, updated_at
+        FROM verification_jobs WHERE application_id = ?
+        ORDER BY created_at DESC LIMIT 1
+    '''), (application_id,))
+    row = cursor.fetchone()
+    conn.close()
+    return dict(row) if row else None
+
+
+def job_counts() -> Dict[str, int]:
+    """Number of jobs per status"""
+    conn = get_db_connection()
+    cursor = get_db_cursor(conn)
+    cursor.execute("SELECT status, COUNT(*) AS count FROM verification_jobs GROUP BY status")
+    counts = {row["status"]: row["count"] for row in cursor.fetchall()}
+    conn.close()
+    return counts
@@ -0,0 +1,146 @@
+"""
+JSON column helpers for iRembo Backend API
+
+``ai_results`` and ``documents`` are stored as JSONB on PostgreSQL and, when
+the SQLite library supports it (3.45+), as SQLite's binary JSONB format;
+older SQLite builds keep minified JSON text. Values are always read back as
+JSON text and only decoded for the rows a response actually returns.
+"""
+
+import json
+import re
+import sqlite3
+from typing import Any, List, Optional, Tuple
+
+from database import using_postgres
+
+JSON_COLUMNS = ("ai_results", "documents")
+
+# e.g. "ai_results[].confidence", "documents[0].name", "ai_results"
+_PATH_RE = re.compile(r"^(?P<column>[a-z_]+)(?P<rest>(\[\d*\]|\.[A-Za-z_][A-Za-z0-9_]*)*)$")
+_STEP_RE = re.compile(r"\[\d*\]|\.[A-Za-z_][A-Za-z0-9_]*")
+
+
+def sqlite_supports_jsonb() -> bool:
+    """SQLite gained the binary JSONB storage format in 3.45.0"""
+    return sqlite3.sqlite_version_info >= (3, 45, 0)
+
+
+def encode_json(value: Any) -> str:
+    """Serialize a value for a JSON column (compact separators)"""
+    return json.dumps(value, separators=(",", ":"))
+
+
+def json_placeholder() -> str:
+    """Bind placeholder for writing a JSON column, converting to native storage"""
+    if using_postgres():
+        return "?::jsonb"
+    if sqlite_supports_jsonb():
+        return "jsonb(?)"
+    return "?"
+
+
+def json_select(column: str) -> str:
+    """Select expression that returns a JSON column as JSON text"""
+    if using_postgres():
+        return f"{column}::text AS {column}"
+    if sqlite_supports_jsonb():
+        return f"json({column}) AS {column}"
+    return column
+
+
+def json_object_select(columns: List[str]) -> str:
+    """Select expression building a JSON object (as text) from the named columns of the current row"""
+    pairs = ", ".join(f"'{c}', {c}" for c in columns)
+    if using_postgres():
+        return f"json_build_object({pairs})::text"
+    return f"json_object({pairs})"
+
+
+def decode_json(value: Any, default: Any = None) -> Any:
+    """Decode JSON text from a JSON column; already-decoded values pass through"""
+    if value is None:
+        return default
+    if isinstance(value, (bytes, memoryview)):
+        value = bytes(value).decode("utf-8")
+    if isinstance(value, str):
+        try:
+            return json.loads(value)
+        except ValueError:
+            return default
+    return value
+
+
+def parse_json_path(path: str) -> Tuple[str, List[str]]:
+    """
+    Split a projection path into its column and steps.
+
+    Raises ValueError for unknown columns, malformed paths or more than one
+    ``[]`` wildcard.
+    """
+    match = _PATH_RE.match(path.strip())
+    if not match or match.group("column") not in JSON_COLUMNS:
+        raise ValueError(f"Invalid JSON path: {path}")
+    steps = _STEP_RE.findall(match.group("rest"))
+    if steps.count("[]") > 1:
+        raise ValueError(f"Only one [] wildcard is supported: {path}")
+    return match.group("column"), steps
+
+
+def _jsonpath(steps: List[str]) -> str:
+    return "$" + "".join(steps)
+
+
+def json_path_select(path: str, alias: str) -> str:
+    """
+    Select expression that evaluates a projection path inside the database.
+
+    ``[]`` maps over array elements and yields a JSON array, so only the
+    projected values leave the database instead of the whole blob.
+    """
+    column, steps = parse_json_path(path)
+
+    if using_postgres():
+        if "[]" in steps:
+            jsonpath = _jsonpath(["[*]" if s == "[]" else s for s in steps])
+            return f"jsonb_path_query_array({column}, '{jsonpath}')::text AS \"{alias}\""
+        return f"jsonb_path_query_first({column}, '{_jsonpath(steps)}')::text AS \"{alias}\""
+
+    if "[]" in steps:
+        split = steps.index("[]")
+        prefix, suffix = _jsonpath(steps[:split]), _jsonpath(steps[split + 1:])
+        return (
+            f"(SELECT json_group_array(json_extract(value, '{suffix}')) "
+            f"FROM json_each({column}, '{prefix}')) AS \"{alias}\""
+        )
+    return f"json_quote(json_extract({column}, '{_jsonpath(steps)}')) AS \"{alias}\""
+
+
+def document_refs_select(alias: str = "documents") -> str:
+    """Select expression listing uploaded documents without their base64 ``data`` payload"""
+    if using_postgres():
+        return f"(SELECT jsonb_agg(d - 'data') FROM jsonb_array_elements(documents) d)::text AS {alias}"
+    return f"(SELECT json_group_array(json_remove(value, '$.data')) FROM json_each(documents)) AS {alias}"
+
+
+def document_lookup_query() -> str:
+    """Query returning one uploaded document (as JSON text) by application_id and doc_id"""
+    if using_postgres():
+        return (
+            "SELECT d::text AS document FROM applications, jsonb_array_elements(applications.documents) d "
+            "WHERE application_id = ? AND d->>'doc_id' = ?"
+        )
+    return (
+        "SELECT value AS document FROM applications, json_each(applications.documents) "
+        "WHERE application_id = ? AND json_extract(value, '$.doc_id') = ?"
+    )
+
+
+def parse_json_fields(json_fields: Optional[str]) -> List[str]:
+    """Split a comma-separated ``json_fields`` query parameter, validating each path"""
+    if not json_fields:
+        return []
+    paths = [p.strip() for p in json_fields.split(",") if p.strip()]
+    for path in paths:
+        parse_json_path(path)
+    return paths
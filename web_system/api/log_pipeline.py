@@ -0,0 +1,93 @@
+"""
+Non-blocking structured logging for iRembo Backend API
+
+A log call only puts the record on a bounded in-memory queue. A background
+thread formats queued records as JSON (with ``python-json-logger``, when
+installed) and writes them to stderr, so log formatting and I/O stay off
+the event loop:
+
+- when the queue is full a record is dropped and counted in the
+  ``log_records_dropped`` metric instead of blocking the caller
+- records below INFO are kept at ``LOG_DEBUG_SAMPLE_RATE``; the rest are
+  counted in ``log_records_sampled_out``
+- uvicorn's loggers, including the access log, go through the same queue
+
+Messages are formatted in the background thread: pass values as logging
+arguments (``logger.info("Verified %s", application_id)``) or ``extra``
+fields rather than f-strings, and don't mutate them after logging.
+"""
+
+import atexit
+import logging
+import queue
+import random
+import sys
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+
+from config import settings
+from metrics import metrics
+
+try:
+    from pythonjsonlogger import jsonlogger
+except ImportError:  # pragma: no cover - optional dependency
+    jsonlogger = None
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+JSON_FORMAT = "%(asctime)s %(levelname)s %(name)s %(message)s"
+UVICORN_LOGGERS = ("uvicorn", "uvicorn.error", "uvicorn.access")
+
+
+class BoundedQueueHandler(QueueHandler):
+    """Queues records as they are, dropping rather than blocking when full"""
+
+    def __init__(self, log_queue: queue.Queue, debug_sample_rate: float = 1.0):
+        super().__init__(log_queue)
+        self.debug_sample_rate = debug_sample_rate
+
+    def emit(self, record: logging.LogRecord):
+        if record.levelno < logging.INFO and random.random() >= self.debug_sample_rate:
+            metrics.inc("log_records_sampled_out")
+            return
+        try:
+            # Unlike QueueHandler.prepare, leave the message unformatted
+            self.queue.put_nowait(record)
+        except queue.Full:
+            metrics.inc("log_records_dropped")
+
+
+def _formatter() -> logging.Formatter:
+    if settings.log_format == "json" and jsonlogger is not None:
+        return jsonlogger.JsonFormatter(
+            JSON_FORMAT, rename_fields={"asctime": "timestamp", "levelname": "level", "name": "logger"}
+        )
+    return logging.Formatter(TEXT_FORMAT)
+
+
+_listener: Optional[QueueListener] = None
+
+
+def configure_logging():
+    """Route the root and uvicorn loggers through the queue (idempotent per process)"""
+    global _listener
+    if _listener is not None:
+        return
+
+    log_queue: queue.Queue = queue.Queue(maxsize=max(1, settings.log_queue_size))
+    output = logging.StreamHandler(sys.stderr)
+    output.setFormatter(_formatter())
+    _listener = QueueListener(log_queue, output)
+    _listener.start()
+    # Flush what is still queued when the process exits
+    atexit.register(_listener.stop)
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(BoundedQueueHandler(log_queue, settings.log_debug_sample_rate))
+    root.setLevel(settings.log_level.upper())
+
+    for name in UVICORN_LOGGERS:
+        uvicorn_logger = logging.getLogger(name)
+        uvicorn_logger.handlers = []
+        uvicorn_logger.propagate = True
@@ -6,16 +6,31 @@ FastAPI Application Entry Point
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from datetime import datetime
+import asyncio
 import json
+import os
+import subprocess
+import sys
+
+from thread_budget import apply_thread_budget
+apply_thread_budget()
 
 # Import routers
 from routes import router as api_router
+from responses import FastJSONResponse
+from compression import CompressionMiddleware
+from query_stats import QueryStatsMiddleware
+from profiling import ProfilingMiddleware, profiling_enabled
+from config import settings
+from events import change_bus
+from jobs import autostart_lock
 
 # Initialize FastAPI app
 app = FastAPI(
     title="iRembo Document Verification API",
     description="Backend API for document verification and appeals management",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=FastJSONResponse
 )
 
 # Add CORS middleware
@@ -25,11 +40,72 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Retry-After", "X-DB-Queries", "X-DB-Time-Ms"],
 )
 
+# Per-request query count and DB time (see query_stats.py)
+app.add_middleware(QueryStatsMiddleware)
+
+# Compress large responses (brotli or gzip, see compression.py)
+app.add_middleware(CompressionMiddleware)
+
+# Per-request profiling, installed only when configured (see profiling.py)
+if profiling_enabled():
+    app.add_middleware(ProfilingMiddleware)
+
 # Include routers
 app.include_router(api_router, prefix="/api")
 
+@app.on_event("startup")
+async def start_change_bus():
+    await change_bus.start()
+
+@app.on_event("shutdown")
+async def stop_change_bus():
+    await change_bus.stop()
+
+# Shared inference server health check (see inference_server.py)
+_inference_health_task = None
+
+@app.on_event("startup")
+async def start_inference_health_check():
+    global _inference_health_task
+    if settings.ai_service_mode == "remote":
+        # Imported only in remote mode: the server relies on Unix domain sockets
+        from inference_server import health_check_loop
+        from utils import get_ai_service
+        _inference_health_task = asyncio.create_task(health_check_loop(get_ai_service()))
+
+@app.on_event("shutdown")
+async def stop_inference_health_check():
+    if _inference_health_task:
+        _inference_health_task.cancel()
+
+# Local verification worker (see worker.py); disable when workers run separately
+_worker_process = None
+
+@app.on_event("startup")
+async def start_verification_worker():
+    global _worker_process
+    if settings.verification_worker_autostart:
+        # Every uvicorn worker runs this hook; skip it when another one's worker holds the lock
+        lock_file = autostart_lock()
+        if lock_file is None:
+            return
+        lock_file.close()
+        worker_script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "worker.py")
+        # --exclusive: the worker takes the lock itself and exits if it loses a start race
+        _worker_process = subprocess.Popen([sys.executable, worker_script, "--exclusive"])
+
+@app.on_event("shutdown")
+async def stop_verification_worker():
+    if _worker_process and _worker_process.poll() is None:
+        _worker_process.terminate()
+        try:
+            _worker_process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            _worker_process.kill()
+
 # Root endpoint
 @app.get("/")
 async def root():
@@ -0,0 +1,61 @@
+"""
+In-process metrics for iRembo Backend API
+
+A small thread-safe registry of counters, gauges and summaries, exposed as
+JSON by ``GET /api/metrics``. Each worker process reports its own values.
+"""
+
+import threading
+from typing import Dict, Tuple
+
+
+def _key(name: str, labels: Dict[str, str]) -> str:
+    if not labels:
+        return name
+    rendered = ",".join(f"{k}={v}" for k, v in sorted(labels.items()))
+    return f"{name}{{{rendered}}}"
+
+
+class MetricsRegistry:
+    """Counters, gauges and count/sum/max summaries keyed by name and labels"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = {}
+        self._gauges: Dict[str, float] = {}
+        self._summaries: Dict[str, Tuple[int, float, float]] = {}
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            self._gauges[key] = value
+
+    def observe(self, name: str, value: float, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            count, total, peak = self._summaries.get(key, (0, 0.0, 0.0))
+            self._summaries[key] = (count + 1, total + value, max(peak, value))
+
+    def counter(self, name: str, **labels) -> float:
+        with self._lock:
+            return self._counters.get(_key(name, labels), 0)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                "counters": dict(self._counters),
+                "gauges": dict(self._gauges),
+                "summaries": {
+                    key: {"count": count, "sum": round(total, 6), "max": round(peak, 6),
+                          "avg": round(total / count, 6) if count else 0.0}
+                    for key, (count, total, peak) in self._summaries.items()
+                },
+            }
+
+
+metrics = MetricsRegistry()
@@ -0,0 +1,176 @@
+"""
+Per-document-type model routing for iRembo Backend API
+
+The generic model (``MODEL_PATH``, ``POLY_PATH``, ``SCALER_PATH``) scores any
+document. A document type can have its own bundle in a directory under
+``MODEL_BUNDLE_DIR`` named after the type in lower case with non-alphanumeric
+characters as ``_`` (``national_id``, ``birth_certificate``, ...), holding
+files with the same names as the generic ones:
+
+    by_type/passport/best_model.keras
+    by_type/passport/feature_poly.pkl
+    by_type/passport/feature_scaler.pkl
+    by_type/passport/VERSION            # optional, recorded as model_version
+
+A specialized bundle is loaded the first time its type is scored and kept in
+an LRU. When the bundles' combined size (their files on disk, a stand-in for
+their resident size) exceeds ``MODEL_MEMORY_BUDGET_MB``, the least recently
+used ones are dropped. The generic model is always resident and outside the
+budget. Types without a bundle, or whose bundle fails to load, use the
+generic model.
+
+Loads, evictions and per-model prediction latency are reported as
+``model_loads`` / ``model_evictions`` counters, ``model_load_seconds`` and
+``model_predict_seconds`` summaries (labelled by model) and
+``model_resident_bytes``.
+"""
+
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+import joblib
+import numpy as np
+
+from config import settings
+from metrics import metrics
+from thread_budget import configure_tensorflow
+
+logger = logging.getLogger(__name__)
+
+GENERIC = "generic"
+# A bundle that failed to load is retried after this long
+RETRY_FAILED_SECONDS = 60
+
+
+def bundle_name(document_type: Optional[str]) -> str:
+    """Bundle directory name of a document type ("National ID" -> "national_id")"""
+    return re.sub(r"[^a-z0-9]+", "_", (document_type or "").lower()).strip("_")
+
+
+class ModelBundle:
+    """A model with its polynomial features and scaler"""
+
+    def __init__(self, name: str, version: str, model, poly, scaler, size_bytes: int = 0):
+        self.name = name
+        self.version = version
+        self.model = model
+        self.poly = poly
+        self.scaler = scaler
+        self.size_bytes = size_bytes
+
+    def predict(self, features: np.ndarray) -> np.ndarray:
+        """Model confidence per row of a (documents, 8) feature matrix, in one model call"""
+        started = time.perf_counter()
+        features_scaled = self.scaler.transform(self.poly.transform(features))
+        prediction = self.model.predict(features_scaled, verbose=0)
+        metrics.observe("model_predict_seconds", time.perf_counter() - started, model=self.name)
+        metrics.observe("model_batch_size", len(features), model=self.name)
+        return prediction[:, 0]
+
+
+def _bundle_files(directory: str):
+    return [os.path.join(directory, os.path.basename(path))
+            for path in (settings.model_path, settings.poly_path, settings.scaler_path)]
+
+
+def load_bundle(name: str, directory: str) -> ModelBundle:
+    """Load a specialized bundle from its directory"""
+    # Imported here so processes that use the inference server never load TensorFlow
+    import tensorflow as tf
+    configure_tensorflow(tf)
+    model_file, poly_file, scaler_file = _bundle_files(directory)
+    version_file = os.path.join(directory, "VERSION")
+    if os.path.exists(version_file):
+        with open(version_file) as f:
+            version = f.read().strip()
+    else:
+        version = f"{name}/{os.path.basename(model_file)}"
+    return ModelBundle(
+        name, version,
+        tf.keras.models.load_model(model_file), joblib.load(poly_file), joblib.load(scaler_file),
+        size_bytes=sum(os.path.getsize(path) for path in (model_file, poly_file, scaler_file))
+    )
+
+
+class ModelRouter:
+    """Picks the bundle for a document type, holding specialized bundles in a size-bounded LRU"""
+
+    def __init__(self, generic: Optional[ModelBundle], bundle_dir: str = None, budget_bytes: int = None):
+        self.generic = generic
+        self.bundle_dir = bundle_dir or settings.model_bundle_dir
+        self.budget_bytes = int(settings.model_memory_budget_mb * 1024 * 1024) if budget_bytes is None else budget_bytes
+        self._resident: "OrderedDict[str, ModelBundle]" = OrderedDict()
+        self._failed: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._loading: Dict[str, threading.Lock] = {}
+
+    def route(self, document_type: Optional[str]) -> Optional[ModelBundle]:
+        """Bundle to score a document type with (the generic one when there is no usable specialized bundle)"""
+        name = bundle_name(document_type)
+        if not name:
+            return self.generic
+        with self._lock:
+            bundle = self._resident.get(name)
+            if bundle is not None:
+                self._resident.move_to_end(name)
+                return bundle
+            if time.monotonic() - self._failed.get(name, -RETRY_FAILED_SECONDS) < RETRY_FAILED_SECONDS:
+                return self.generic
+            loading = self._loading.setdefault(name, threading.Lock())
+        directory = os.path.join(self.bundle_dir, name)
+        if not os.path.isdir(directory):
+            return self.generic
+
+        # One thread loads a bundle; others asking for it meanwhile wait for that load
+        with loading:
+            with self._lock:
+                bundle = self._resident.get(name)
+            if bundle is None:
+                bundle = self._load(name, directory)
+        return bundle or self.generic
+
+    def _load(self, name: str, directory: str) -> Optional[ModelBundle]:
+        started = time.perf_counter()
+        try:
+            bundle = load_bundle(name, directory)
+        except Exception as e:
+            metrics.inc("model_load_errors", model=name)
+            logger.error("Could not load model bundle %s: %s", directory, e)
+            with self._lock:
+                self._failed[name] = time.monotonic()
+            return None
+        seconds = time.perf_counter() - started
+        metrics.inc("model_loads", model=name)
+        metrics.observe("model_load_seconds", seconds, model=name)
+        logger.info("Loaded model bundle %s (%s, %d bytes) in %.2fs", name, bundle.version, bundle.size_bytes, seconds)
+
+        with self._lock:
+            self._failed.pop(name, None)
+            self._resident[name] = bundle
+            # Evict least recently used bundles, but never the one just loaded
+            while len(self._resident) > 1 and self._resident_bytes() > self.budget_bytes:
+                evicted_name, evicted = self._resident.popitem(last=False)
+                metrics.inc("model_evictions", model=evicted_name)
+                logger.info("Evicted model bundle %s (%d bytes)", evicted_name, evicted.size_bytes)
+            metrics.set("model_resident_bytes", self._resident_bytes())
+        return bundle
+
+    def _resident_bytes(self) -> int:
+        return sum(bundle.size_bytes for bundle in self._resident.values())
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "generic": self.generic.version if self.generic else None,
+                "resident": [
+                    {"name": name, "version": bundle.version, "bytes": bundle.size_bytes}
+                    for name, bundle in reversed(self._resident.items())
+                ],
+                "resident_bytes": self._resident_bytes(),
+                "budget_bytes": self.budget_bytes,
+            }
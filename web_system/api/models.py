@@ -134,3 +134,8 @@ class PaginatedResponse(BaseModel):
     data: List[dict]
     message: str = "Success"
     timestamp: datetime = Field(default_factory=datetime.utcnow)
+
+class SyncPaginatedResponse(PaginatedResponse):
+    """Paginated response for lists that support delta sync"""
+    next_seq: int = 0
+    deleted: List[str] = []
@@ -0,0 +1,244 @@
+"""
+On-demand request profiling for iRembo Backend API
+
+``ProfilingMiddleware`` samples the Python stacks of every thread in the
+process while a selected request runs, so time spent in the event loop and
+in worker threads (``asyncio.to_thread``, sync endpoints) both show up. A
+request is profiled when it carries ``X-Profile: <PROFILE_TOKEN>`` or is
+picked by ``PROFILE_SAMPLE_RATE``. One request is profiled at a time per
+process; other requests running meanwhile appear in the same samples.
+
+Profiles are written to ``PROFILE_DIR`` as collapsed stacks (one
+``frame;frame;frame count`` line per stack, readable by flamegraph.pl and
+speedscope) plus a small JSON metadata file, keyed by the request id that is
+returned in ``X-Profile-ID``. ``GET /api/admin/profiles`` lists them and
+``GET /api/admin/profiles/{id}`` serves a profile as collapsed text or
+speedscope JSON.
+
+The middleware is only installed when a token or sample rate is configured,
+so requests pay nothing when profiling is off.
+"""
+
+import asyncio
+import hmac
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from config import settings
+from metrics import metrics
+
+# Leaf frames of threads that are parked rather than working
+_IDLE_LEAVES = {
+    ("threading.py", "wait"), ("threading.py", "_wait_for_tstate_lock"), ("queue.py", "get"),
+    ("thread.py", "_worker"),  # concurrent.futures worker blocked on its queue
+}
+_SAFE_ID = re.compile(r"^[A-Za-z0-9_.-]{1,64}$")
+
+# One profiled request at a time: samples cover the whole process
+_profiling = threading.Lock()
+
+
+def profiling_enabled() -> bool:
+    return bool(settings.profile_token) or settings.profile_sample_rate > 0
+
+
+def token_matches(value: Optional[str]) -> bool:
+    """Constant-time check of a header value against PROFILE_TOKEN"""
+    return bool(settings.profile_token) and value is not None and hmac.compare_digest(value, settings.profile_token)
+
+
+class StackSampler:
+    """Background thread counting collapsed stacks of all other threads"""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        own = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            for thread in threading.enumerate():
+                names[thread.ident] = thread.name
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append((os.path.basename(code.co_filename), code.co_name, frame.f_lineno))
+                    frame = frame.f_back
+                if not stack or stack[0][:2] in _IDLE_LEAVES:
+                    continue
+                stack.reverse()
+                self.stacks[";".join([names.get(ident, str(ident))] +
+                                     [f"{name} ({filename}:{line})" for filename, name, line in stack])] += 1
+            self.samples += 1
+
+
+def _path(profile_id: str, suffix: str) -> str:
+    return os.path.join(settings.profile_dir, f"{profile_id}{suffix}")
+
+
+def save_profile(profile_id: str, sampler: StackSampler, meta: Dict):
+    os.makedirs(settings.profile_dir, exist_ok=True)
+    with open(_path(profile_id, ".collapsed"), "w", encoding="utf-8") as f:
+        for stack, count in sampler.stacks.most_common():
+            f.write(f"{stack} {count}\n")
+    meta = dict(meta, profile_id=profile_id, samples=sampler.samples,
+                interval_ms=round(sampler.interval * 1000, 3))
+    with open(_path(profile_id, ".json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    _prune()
+
+
+def _prune():
+    entries = list_profiles()
+    for meta in entries[settings.profile_max_files:]:
+        for suffix in (".collapsed", ".json"):
+            try:
+                os.remove(_path(meta["profile_id"], suffix))
+            except OSError:
+                pass
+
+
+def list_profiles() -> List[Dict]:
+    """Metadata of stored profiles, newest first"""
+    if not os.path.isdir(settings.profile_dir):
+        return []
+    entries = []
+    for name in os.listdir(settings.profile_dir):
+        if not name.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(settings.profile_dir, name), encoding="utf-8") as f:
+                entries.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    entries.sort(key=lambda meta: meta.get("started_at", ""), reverse=True)
+    return entries
+
+
+def load_profile(profile_id: str) -> Optional[Tuple[str, Dict]]:
+    """Collapsed stacks and metadata of a stored profile"""
+    if not _SAFE_ID.match(profile_id):
+        return None
+    try:
+        with open(_path(profile_id, ".collapsed"), encoding="utf-8") as f:
+            collapsed = f.read()
+        with open(_path(profile_id, ".json"), encoding="utf-8") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return collapsed, meta
+
+
+def to_speedscope(profile_id: str, collapsed: str, interval_ms: float) -> Dict:
+    """Collapsed stacks as a speedscope 'sampled' profile (weights in ms)"""
+    frames: List[Dict] = []
+    index: Dict[str, int] = {}
+    samples, weights = [], []
+    for line in collapsed.splitlines():
+        stack, _, count = line.rpartition(" ")
+        if not stack:
+            continue
+        sample = []
+        for name in stack.split(";"):
+            if name not in index:
+                index[name] = len(frames)
+                frames.append({"name": name})
+            sample.append(index[name])
+        samples.append(sample)
+        weights.append(int(count) * interval_ms)
+    return {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "shared": {"frames": frames},
+        "profiles": [{
+            "type": "sampled",
+            "name": profile_id,
+            "unit": "milliseconds",
+            "startValue": 0,
+            "endValue": sum(weights),
+            "samples": samples,
+            "weights": weights,
+        }],
+        "name": profile_id,
+        "exporter": "irembo-api",
+    }
+
+
+def _header(scope, name: bytes) -> Optional[str]:
+    for key, value in scope["headers"]:
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+
+class ProfilingMiddleware:
+    """ASGI middleware profiling requests selected by header or sampling rate"""
+
+    def __init__(self, app):
+        self.app = app
+
+    def _wanted(self, scope) -> bool:
+        if token_matches(_header(scope, b"x-profile")):
+            return True
+        return settings.profile_sample_rate > 0 and random.random() < settings.profile_sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self._wanted(scope):
+            await self.app(scope, receive, send)
+            return
+        if not _profiling.acquire(blocking=False):
+            metrics.inc("profiles_skipped")
+            await self.app(scope, receive, send)
+            return
+
+        request_id = _header(scope, b"x-request-id") or ""
+        profile_id = request_id if _SAFE_ID.match(request_id) else uuid.uuid4().hex
+        status = {"code": 500}
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [(b"x-profile-id", profile_id.encode())]
+            await send(message)
+
+        sampler = StackSampler(settings.profile_interval_ms / 1000)
+        started_at = datetime.utcnow().isoformat()
+        started = time.perf_counter()
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            sampler.stop()
+            _profiling.release()
+            meta = {
+                "method": scope["method"],
+                "path": scope["path"],
+                "query": scope.get("query_string", b"").decode("latin-1"),
+                "status": status["code"],
+                "started_at": started_at,
+                "duration_ms": round((time.perf_counter() - started) * 1000, 3),
+            }
+            await asyncio.to_thread(save_profile, profile_id, sampler, meta)
+            metrics.inc("profiles_recorded")
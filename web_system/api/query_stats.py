@@ -0,0 +1,299 @@
+"""
+SQL query instrumentation for iRembo Backend API
+
+Cursors returned by ``get_db_cursor`` (and the statements run by
+``execute_write``) are wrapped so every statement is recorded with its
+normalized text (literals and placeholders replaced by ``?``, ``IN`` lists
+and multi-row ``VALUES`` collapsed), duration and row count:
+
+- per statement totals, reported by ``GET /api/metrics`` under ``db``
+- statements slower than ``DB_SLOW_QUERY_MS`` are logged with their
+  parameters redacted to types and lengths
+- ``QueryStatsMiddleware`` counts the queries and DB time of each request,
+  returns them in ``X-DB-Queries`` and ``X-DB-Time-Ms`` and records them
+  per endpoint
+
+``DB_QUERY_BUDGET`` caps the queries of one request. Over budget a request
+is logged once (``DB_QUERY_BUDGET_MODE=warn``) or the offending statement
+raises ``QueryBudgetExceeded`` (``fail``), which makes an N+1 loop fail the
+endpoint's tests instead of going unnoticed.
+"""
+
+import logging
+import re
+import threading
+import time
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+
+from config import settings
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Distinct statements tracked before the rest are folded into one entry
+MAX_STATEMENTS = 500
+OTHER_STATEMENTS = "<other>"
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b")
+_PLACEHOLDER = re.compile(r"%s|\?")
+_SPACE = re.compile(r"\s+")
+_IN_LIST = re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)", re.IGNORECASE)
+_VALUES_ROWS = re.compile(r"(\([?, ]+\))(?:\s*,\s*\([?, ]+\))+")
+
+
+class QueryBudgetExceeded(RuntimeError):
+    """A request ran more statements than ``DB_QUERY_BUDGET`` allows"""
+
+
+@lru_cache(maxsize=2048)
+def normalize_sql(query: str) -> str:
+    """Statement text with literals and parameters replaced by ``?``"""
+    text = _STRING.sub("?", query)
+    text = _PLACEHOLDER.sub("?", text)
+    text = _NUMBER.sub("?", text)
+    text = _SPACE.sub(" ", text).strip()
+    text = _IN_LIST.sub("IN (?...)", text)
+    return _VALUES_ROWS.sub(r"\1, ...", text)
+
+
+def redact_params(params: Any) -> str:
+    """Parameter types and sizes, never their values"""
+    if params is None:
+        return "()"
+    if isinstance(params, list) and params and isinstance(params[0], (tuple, list, dict)):
+        return f"[{len(params)} rows]"
+    if isinstance(params, dict):
+        return "{" + ", ".join(f"{key}: {_redact_value(value)}" for key, value in params.items()) + "}"
+    return "(" + ", ".join(_redact_value(value) for value in params) + ")"
+
+
+def _redact_value(value: Any) -> str:
+    if value is None:
+        return "NULL"
+    if isinstance(value, (str, bytes, bytearray, memoryview)):
+        return f"{type(value).__name__}[{len(value)}]"
+    return type(value).__name__
+
+
+class _StatementStats:
+    __slots__ = ("calls", "seconds", "max_seconds", "rows")
+
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.rows = 0
+
+
+_lock = threading.Lock()
+_statements: Dict[str, _StatementStats] = {}
+
+
+def _statement(text: str) -> _StatementStats:
+    stats = _statements.get(text)
+    if stats is None:
+        if len(_statements) >= MAX_STATEMENTS:
+            text = OTHER_STATEMENTS
+        stats = _statements.setdefault(text, _StatementStats())
+    return stats
+
+
+class RequestQueries:
+    """Queries and DB time charged to one HTTP request"""
+
+    def __init__(self, scope: Optional[dict] = None):
+        self.scope = scope
+        self.count = 0
+        self.seconds = 0.0
+        self.over_budget = False
+        self._lock = threading.Lock()
+
+    def add(self, count: int, seconds: float):
+        with self._lock:
+            self.count += count
+            self.seconds += seconds
+
+    def route(self) -> str:
+        """Name of the matched endpoint (path templates lose router prefixes)"""
+        route = (self.scope or {}).get("route")
+        return getattr(route, "name", None) or "unmatched"
+
+
+# Set by QueryStatsMiddleware; copied into asyncio.to_thread and threadpool calls
+_current: ContextVar[Optional[RequestQueries]] = ContextVar("request_queries", default=None)
+
+
+def check_budget(pending: int = 1):
+    """Enforce DB_QUERY_BUDGET before ``pending`` more statements run for this request"""
+    current = _current.get()
+    budget = settings.db_query_budget
+    if current is None or budget <= 0 or current.count + pending <= budget:
+        return
+    if settings.db_query_budget_mode == "fail":
+        metrics.inc("db_query_budget_exceeded", route=current.route())
+        raise QueryBudgetExceeded(
+            f"{current.route()} ran more than {budget} queries (DB_QUERY_BUDGET)"
+        )
+    if not current.over_budget:
+        current.over_budget = True
+        metrics.inc("db_query_budget_exceeded", route=current.route())
+        logger.warning("Query budget exceeded: %s ran more than %d queries", current.route(), budget)
+
+
+def record_query(query: str, params: Any, seconds: float, rowcount: int = -1, charge: bool = True):
+    """Record one executed statement; ``charge`` adds it to the current request"""
+    text = normalize_sql(query)
+    with _lock:
+        stats = _statement(text)
+        stats.calls += 1
+        stats.seconds += seconds
+        stats.max_seconds = max(stats.max_seconds, seconds)
+        if rowcount > 0:
+            stats.rows += rowcount
+    metrics.observe("db_query_seconds", seconds, op=text.split(" ", 1)[0].upper())
+    if charge:
+        current = _current.get()
+        if current is not None:
+            current.add(1, seconds)
+    if settings.db_slow_query_ms > 0 and seconds * 1000 >= settings.db_slow_query_ms:
+        metrics.inc("db_slow_queries")
+        logger.warning(
+            "Slow query (%.1f ms, rows=%d): %s params=%s", seconds * 1000, rowcount, text, redact_params(params),
+            extra={"duration_ms": round(seconds * 1000, 3), "statement": text},
+        )
+
+
+def record_rows(query: str, rows: int):
+    """Add rows fetched after ``execute`` to a statement's totals"""
+    if rows <= 0:
+        return
+    text = normalize_sql(query)
+    with _lock:
+        _statement(text).rows += rows
+
+
+def charge_request(count: int, seconds: float):
+    """Charge statements that ran outside this request's context (the SQLite writer thread)"""
+    current = _current.get()
+    if current is not None:
+        current.add(count, seconds)
+
+
+class InstrumentedCursor:
+    """DB-API cursor wrapper that records every statement it runs"""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self._query: Optional[str] = None
+
+    def execute(self, query, params=None):
+        check_budget()
+        started = time.perf_counter()
+        try:
+            if params is None:
+                result = self._cursor.execute(query)
+            else:
+                result = self._cursor.execute(query, params)
+        finally:
+            record_query(query, params, time.perf_counter() - started, self._cursor.rowcount)
+        self._query = query
+        # sqlite3 returns the cursor itself; keep callers on the wrapper
+        return self if result is self._cursor else result
+
+    def executemany(self, query, seq_of_params):
+        check_budget()
+        seq_of_params = list(seq_of_params)
+        started = time.perf_counter()
+        try:
+            result = self._cursor.executemany(query, seq_of_params)
+        finally:
+            record_query(query, seq_of_params, time.perf_counter() - started, self._cursor.rowcount)
+        self._query = query
+        return self if result is self._cursor else result
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        if row is not None and self._query:
+            record_rows(self._query, 1)
+        return row
+
+    def fetchmany(self, *args, **kwargs):
+        rows = self._cursor.fetchmany(*args, **kwargs)
+        if self._query:
+            record_rows(self._query, len(rows))
+        return rows
+
+    def fetchall(self):
+        rows = self._cursor.fetchall()
+        if self._query:
+            record_rows(self._query, len(rows))
+        return rows
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+def instrument(cursor):
+    """Wrap a cursor unless instrumentation is disabled"""
+    return InstrumentedCursor(cursor) if settings.db_query_stats else cursor
+
+
+def query_stats(limit: int = 20) -> Dict[str, Any]:
+    """Statements with the most total DB time, for the metrics endpoint"""
+    with _lock:
+        items = sorted(_statements.items(), key=lambda item: item[1].seconds, reverse=True)
+        top: List[Dict[str, Any]] = [
+            {
+                "statement": text,
+                "calls": stats.calls,
+                "total_ms": round(stats.seconds * 1000, 3),
+                "avg_ms": round(stats.seconds * 1000 / stats.calls, 3) if stats.calls else 0.0,
+                "max_ms": round(stats.max_seconds * 1000, 3),
+                "rows": stats.rows,
+            }
+            for text, stats in items[:limit]
+        ]
+        distinct = len(_statements)
+    return {
+        "distinct_statements": distinct,
+        "slow_query_ms": settings.db_slow_query_ms,
+        "query_budget": settings.db_query_budget,
+        "top_statements": top,
+    }
+
+
+class QueryStatsMiddleware:
+    """ASGI middleware reporting the queries and DB time of each request"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        current = RequestQueries(scope)
+        token = _current.set(current)
+
+        async def send_with_stats(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"x-db-queries", str(current.count).encode()),
+                    (b"x-db-time-ms", f"{current.seconds * 1000:.3f}".encode()),
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_stats)
+        finally:
+            _current.reset(token)
+            route = current.route()
+            metrics.observe("db_queries_per_request", current.count, route=route)
+            metrics.observe("db_seconds_per_request", current.seconds, route=route)
@@ -0,0 +1,167 @@
+"""
+In-process queue index for iRembo Backend API
+
+Keeps the pending applications and document requests of each document type
+in an order-statistic tree keyed by submission time, so a queue position or
+queue length is answered in O(log n) without a COUNT query per row.
+
+The index is rebuilt from the database at startup and updated by the write
+paths. Each worker process keeps its own copy, so it is also rebuilt every
+``QUEUE_INDEX_REFRESH_SECONDS`` to pick up writes made by other workers.
+"""
+
+import random
+import threading
+import time
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+# (submitted_at, item_id) - the id breaks ties between equal timestamps
+Key = Tuple[str, str]
+
+
+class _Node:
+    __slots__ = ("key", "priority", "size", "left", "right")
+
+    def __init__(self, key: Key):
+        self.key = key
+        self.priority = random.random()
+        self.size = 1
+        self.left: Optional["_Node"] = None
+        self.right: Optional["_Node"] = None
+
+
+def _size(node: Optional[_Node]) -> int:
+    return node.size if node else 0
+
+
+def _update(node: _Node):
+    node.size = 1 + _size(node.left) + _size(node.right)
+
+
+def _split(node: Optional[_Node], key: Key):
+    """Split into (keys < key, keys >= key)"""
+    if node is None:
+        return None, None
+    if node.key < key:
+        left, right = _split(node.right, key)
+        node.right = left
+        _update(node)
+        return node, right
+    left, right = _split(node.left, key)
+    node.left = right
+    _update(node)
+    return left, node
+
+
+def _merge(left: Optional[_Node], right: Optional[_Node]) -> Optional[_Node]:
+    if left is None or right is None:
+        return left or right
+    if left.priority > right.priority:
+        left.right = _merge(left.right, right)
+        _update(left)
+        return left
+    right.left = _merge(left, right.left)
+    _update(right)
+    return right
+
+
+class OrderStatisticTree:
+    """Treap with subtree sizes: insert, remove and rank in O(log n) expected time"""
+
+    def __init__(self):
+        self._root: Optional[_Node] = None
+
+    def __len__(self) -> int:
+        return _size(self._root)
+
+    def insert(self, key: Key):
+        left, right = _split(self._root, key)
+        self._root = _merge(_merge(left, _Node(key)), right)
+
+    def remove(self, key: Key):
+        left, right = _split(self._root, key)
+        # (ts, id + "\0") is the smallest possible key above ``key``
+        _, right = _split(right, (key[0], key[1] + "\0"))
+        self._root = _merge(left, right)
+
+    def rank(self, key: Key) -> int:
+        """Number of keys strictly less than ``key``"""
+        node, count = self._root, 0
+        while node is not None:
+            if node.key < key:
+                count += _size(node.left) + 1
+                node = node.right
+            else:
+                node = node.left
+        return count
+
+
+class QueueIndex:
+    """Pending items per document type, ordered by submission time"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._trees: Dict[str, OrderStatisticTree] = {}
+        self._items: Dict[str, Tuple[str, Key]] = {}
+        self._lock = threading.Lock()
+        self._built_at = 0.0
+
+    def add(self, document_type: str, item_id: str, submitted_at: str):
+        with self._lock:
+            self._discard(item_id)
+            key = (submitted_at or "", item_id)
+            self._trees.setdefault(document_type, OrderStatisticTree()).insert(key)
+            self._items[item_id] = (document_type, key)
+
+    def discard(self, item_id: str):
+        with self._lock:
+            self._discard(item_id)
+
+    def _discard(self, item_id: str):
+        entry = self._items.pop(item_id, None)
+        if entry:
+            document_type, key = entry
+            self._trees[document_type].remove(key)
+
+    def set_status(self, document_type: str, item_id: str, submitted_at: str, status: str):
+        """Keep the index in step with a status change"""
+        if status == "pending":
+            self.add(document_type, item_id, submitted_at)
+        else:
+            self.discard(item_id)
+
+    def position(self, document_type: str, submitted_at: str) -> int:
+        """1-based queue position: pending items of the type submitted strictly earlier, plus one"""
+        with self._lock:
+            tree = self._trees.get(document_type)
+            return (tree.rank((submitted_at or "", "")) if tree else 0) + 1
+
+    def length(self, document_type: str) -> int:
+        with self._lock:
+            tree = self._trees.get(document_type)
+            return len(tree) if tree else 0
+
+    def lengths(self) -> Dict[str, int]:
+        with self._lock:
+            return {doc_type: len(tree) for doc_type, tree in self._trees.items() if len(tree)}
+
+    def rebuild(self, rows: Iterable[Tuple[str, str, str]]):
+        """Replace the contents with (item_id, document_type, submitted_at) rows"""
+        trees: Dict[str, OrderStatisticTree] = {}
+        items: Dict[str, Tuple[str, Key]] = {}
+        for item_id, document_type, submitted_at in rows:
+            key = (submitted_at or "", item_id)
+            trees.setdefault(document_type, OrderStatisticTree()).insert(key)
+            items[item_id] = (document_type, key)
+        with self._lock:
+            self._trees, self._items = trees, items
+            self._built_at = time.monotonic()
+
+    def refresh_if_stale(self, max_age: float, loader: Callable[[], Iterable[Tuple[str, str, str]]]):
+        """Rebuild from ``loader`` when older than ``max_age`` seconds (0 disables)"""
+        if max_age > 0 and time.monotonic() - self._built_at > max_age:
+            self.rebuild(loader())
+
+
+applications_queue = QueueIndex("applications")
+document_requests_queue = QueueIndex("document_requests")
@@ -0,0 +1,269 @@
+"""
+Bulk import for the official document registry
+
+Streams CSV or NDJSON records into ``document_registry`` (or
+``document_templates``) in constant memory. PostgreSQL loads each batch with
+``COPY`` into a temporary staging table (or ``execute_values`` with
+``--method values``); SQLite uses batched ``executemany`` inside a single
+transaction. Existing rows are upserted by primary key. Secondary indexes are
+dropped before the load and rebuilt afterwards.
+
+Usage (from web_system/api):
+    python registry_import.py registry.csv
+    python registry_import.py registry.ndjson --batch-size 50000
+    python registry_import.py templates.csv --table document_templates
+
+The load commits together with a ``registry`` change event, on which running
+API and verification workers drop their cached registry records (or
+templates), so they see the imported rows right away.
+"""
+
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+import time
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from cache import apply_registry_change
+from database import get_db_connection, get_db_cursor, format_query, using_postgres
+from events import registry_change
+
+TABLES = {
+    "document_registry": {
+        "key": "registry_id",
+        "columns": ["registry_id", "citizen_id", "document_type", "issued_date", "file_path", "metadata"],
+        "json": ["metadata"],
+    },
+    "document_templates": {
+        "key": "template_id",
+        "columns": ["template_id", "document_type", "standard_version", "required_fields",
+                    "layout_metadata", "sample_image_url"],
+        "json": ["required_fields", "layout_metadata"],
+    },
+}
+
+# (index name, indexed columns) per table
+SECONDARY_INDEXES = {
+    "document_registry": [("idx_document_registry_citizen_type", "citizen_id, document_type")],
+    "document_templates": [("idx_document_templates_type", "document_type")],
+}
+
+Row = Tuple[Optional[str], ...]
+
+
+def create_indexes(cursor, table: str):
+    """Create the secondary indexes of a table if they are missing"""
+    for name, columns in SECONDARY_INDEXES.get(table, []):
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})")
+
+
+def drop_indexes(cursor, table: str):
+    for name, _ in SECONDARY_INDEXES.get(table, []):
+        cursor.execute(f"DROP INDEX IF EXISTS {name}")
+
+
+def upsert_query(table: str, update: bool = True) -> str:
+    """INSERT with ``?`` placeholders that updates (or keeps) rows on a primary key conflict"""
+    spec = TABLES[table]
+    columns = spec["columns"]
+    conflict = "NOTHING"
+    if update:
+        assignments = ", ".join(f"{c} = excluded.{c}" for c in columns if c != spec["key"])
+        conflict = f"UPDATE SET {assignments}"
+    return (
+        f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)}) "
+        f"ON CONFLICT ({spec['key']}) DO {conflict}"
+    )
+
+
+# ==================== INPUT ====================
+
+def _to_row(record: Dict, table: str) -> Optional[Row]:
+    spec = TABLES[table]
+    if not record.get(spec["key"]):
+        return None
+    row = []
+    for column in spec["columns"]:
+        value = record.get(column)
+        if column in spec["json"] and value is not None and not isinstance(value, str):
+            value = json.dumps(value, separators=(",", ":"))
+        elif value is not None and not isinstance(value, str):
+            value = str(value)
+        row.append(value if value != "" else None)
+    return tuple(row)
+
+
+def read_records(path: str, fmt: str) -> Iterator[Dict]:
+    """Yield one dict per CSV row or NDJSON line without loading the file"""
+    stream = sys.stdin if path == "-" else open(path, newline="", encoding="utf-8")
+    try:
+        if fmt == "csv":
+            yield from csv.DictReader(stream)
+        else:
+            for line in stream:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+
+def _batches(rows: Iterable[Row], size: int) -> Iterator[List[Row]]:
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+
+# ==================== LOADERS ====================
+
+def _load_sqlite(conn, table: str, batches: Iterable[List[Row]]) -> int:
+    query = upsert_query(table)
+    loaded = 0
+    cursor = conn.cursor()
+    for batch in batches:
+        cursor.executemany(query, batch)
+        loaded += len(batch)
+    return loaded
+
+
+def _dedupe(batch: List[Row]) -> List[Row]:
+    """Last row wins; PostgreSQL rejects an upsert touching the same key twice"""
+    return list({row[0]: row for row in batch}.values())
+
+
+def _load_postgres_values(conn, table: str, batches: Iterable[List[Row]]) -> int:
+    from psycopg2.extras import execute_values
+
+    # execute_values expands a single %s into the VALUES list
+    values = "(" + ", ".join("?" for _ in TABLES[table]["columns"]) + ")"
+    query = upsert_query(table).replace(values, "%s", 1)
+    cursor = conn.cursor()
+    loaded = 0
+    for batch in batches:
+        execute_values(cursor, query, _dedupe(batch), page_size=len(batch))
+        loaded += len(batch)
+    return loaded
+
+
+def _load_postgres_copy(conn, table: str, batches: Iterable[List[Row]]) -> int:
+    spec = TABLES[table]
+    columns = ", ".join(spec["columns"])
+    assignments = ", ".join(f"{c} = excluded.{c}" for c in spec["columns"] if c != spec["key"])
+    cursor = conn.cursor()
+    cursor.execute(f"CREATE TEMP TABLE import_stage (LIKE {table} INCLUDING DEFAULTS) ON COMMIT DROP")
+    loaded = 0
+    for batch in batches:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in batch:
+            # COPY's CSV format reads an unquoted empty field as NULL
+            writer.writerow(["" if v is None else v for v in row])
+        buffer.seek(0)
+        cursor.copy_expert(f"COPY import_stage ({columns}) FROM STDIN WITH (FORMAT csv)", buffer)
+        cursor.execute(f"""
+            INSERT INTO {table} ({columns})
+            SELECT DISTINCT ON ({spec['key']}) {columns} FROM import_stage
+            ON CONFLICT ({spec['key']}) DO UPDATE SET {assignments}
+        """)
+        cursor.execute("TRUNCATE import_stage")
+        loaded += len(batch)
+    return loaded
+
+
+def import_rows(rows: Iterable[Row], table: str = "document_registry",
+                batch_size: int = 10000, method: str = "copy") -> Dict[str, float]:
+    """
+    Upsert rows into ``table`` in one transaction, rebuilding its secondary
+    indexes afterwards. Returns row counts and timings.
+    """
+    conn = get_db_connection()
+    cursor = get_db_cursor(conn)
+    started = time.perf_counter()
+    try:
+        if not using_postgres():
+            # Also covers the index drop, so a failed load leaves the indexes in place
+            cursor.execute("BEGIN IMMEDIATE")
+        drop_indexes(cursor, table)
+        batches = _batches(rows, batch_size)
+        if not using_postgres():
+            loaded = _load_sqlite(conn, table, batches)
+        elif method == "values":
+            loaded = _load_postgres_values(conn, table, batches)
+        else:
+            loaded = _load_postgres_copy(conn, table, batches)
+        load_seconds = time.perf_counter() - started
+
+        create_indexes(cursor, table)
+        cursor.execute(f"ANALYZE {table}")
+        # Other processes drop their cached entries for this table
+        query, params = registry_change(table)
+        cursor.execute(format_query(query), params)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    apply_registry_change({"table": table})
+
+    total_seconds = time.perf_counter() - started
+    return {
+        "rows": loaded,
+        "load_seconds": round(load_seconds, 3),
+        "index_seconds": round(total_seconds - load_seconds, 3),
+        "total_seconds": round(total_seconds, 3),
+        "rows_per_sec": round(loaded / total_seconds) if total_seconds else 0,
+    }
+
+
+def import_file(path: str, fmt: str, table: str = "document_registry",
+                batch_size: int = 10000, method: str = "copy") -> Dict[str, float]:
+    """Import a CSV/NDJSON file; records without a primary key are skipped"""
+    skipped = 0
+
+    def rows() -> Iterator[Row]:
+        nonlocal skipped
+        for record in read_records(path, fmt):
+            row = _to_row(record, table)
+            if row is None:
+                skipped += 1
+                continue
+            yield row
+
+    report = import_rows(rows(), table, batch_size, method)
+    report["skipped"] = skipped
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk import registry records from CSV or NDJSON")
+    parser.add_argument("path", help="Input file, or - for stdin")
+    parser.add_argument("--format", choices=["csv", "ndjson"], help="Input format (default: from file extension)")
+    parser.add_argument("--table", choices=sorted(TABLES), default="document_registry")
+    parser.add_argument("--batch-size", type=int, default=10000)
+    parser.add_argument("--method", choices=["copy", "values"], default="copy",
+                        help="PostgreSQL load method (ignored on SQLite)")
+    args = parser.parse_args()
+
+    fmt = args.format
+    if fmt is None:
+        ext = os.path.splitext(args.path)[1].lower()
+        fmt = "ndjson" if ext in (".ndjson", ".jsonl") else "csv"
+
+    report = import_file(args.path, fmt, args.table, max(1, args.batch_size), args.method)
+    backend = "PostgreSQL" if using_postgres() else "SQLite"
+    print(f"Imported {report['rows']} rows into {args.table} ({backend}) in {report['total_seconds']}s "
+          f"({report['rows_per_sec']} rows/sec; index rebuild {report['index_seconds']}s; "
+          f"{report['skipped']} skipped)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,311 @@
+"""
+Offline re-scoring of past applications
+
+Before shipping a new model or changing ``CONFIDENCE_THRESHOLD``, re-score
+every uploaded document in the ``applications`` table and see which
+verdicts would flip:
+
+- applications are read in ``--chunk-size`` chunks, in ``application_id``
+  order (IDs sort by creation time)
+- documents are decoded and their features extracted by a pool of
+  ``--processes`` worker processes, which split the CPU threads between
+  them (see thread_budget.py)
+- the features of a chunk are scored in model calls of up to
+  ``--batch-size`` documents
+
+Each document's new confidence and verdict, with its previous verdict from
+``ai_results``, goes to ``rescore_results`` under a run ID. The last
+application of a chunk is checkpointed in ``rescore_runs`` in the same
+transaction as the chunk's results, so an interrupted run resumes exactly
+where it stopped:
+
+    python rescore.py                                   # new run, current model
+    python rescore.py --threshold 0.8                   # what-if threshold
+    python rescore.py --run-id RESCORE-01JAB...         # resume that run
+    python rescore.py --report RESCORE-01JAB...         # verdict confusion only
+
+At the end the confusion between old and new verdicts is printed for
+documents and for applications (an application is authentic only when all
+its documents are). The application IDs whose verdict flipped can be
+listed from ``rescore_results``.
+
+Archived applications (see archive.py) are not re-scored.
+"""
+
+import argparse
+import base64
+import json
+import multiprocessing
+import os
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from config import settings
+from thread_budget import apply_thread_budget, child_thread_env, compute_budget
+
+# Scoring shares the box with the API: one process's budget, without a pinning slot
+apply_thread_budget(pin=False)
+
+import cv2
+import numpy as np
+
+from database import get_db_connection, get_db_cursor, format_query, execute_write_sync
+from ids import generate_id
+from json_columns import json_select, decode_json
+from utils import AIService, extract_features, logger
+
+RUNNING, COMPLETED = "running", "completed"
+
+
+def create_rescore_tables(cursor):
+    """Create the re-scoring run and result tables (same DDL on both backends)"""
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS rescore_runs (
+        run_id TEXT PRIMARY KEY,
+        model_version TEXT,
+        confidence_threshold FLOAT,
+        last_application_id TEXT,
+        applications INTEGER DEFAULT 0,
+        documents INTEGER DEFAULT 0,
+        status TEXT,
+        started_at TEXT,
+        updated_at TEXT
+    )
+    ''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS rescore_results (
+        run_id TEXT,
+        application_id TEXT,
+        doc_id TEXT,
+        model_version TEXT,
+        confidence FLOAT,
+        verdict TEXT,
+        old_verdict TEXT,
+        PRIMARY KEY (run_id, application_id, doc_id)
+    )
+    ''')
+
+
+def _init_extractor(threads: int):
+    """Runs in each pool process; its BLAS already took ``threads`` from the environment"""
+    cv2.setNumThreads(threads)
+
+
+def _extract(data_url: str) -> Optional[Tuple[np.ndarray, Dict]]:
+    """Runs in the process pool: decode one uploaded document and extract its features"""
+    try:
+        image = base64.b64decode((data_url or "").split(",", 1)[-1])
+    except ValueError:
+        return None
+    return extract_features(image) if image else None
+
+
+def _fetch_chunk(after: str, limit: int) -> List[Dict]:
+    conn = get_db_connection()
+    cursor = get_db_cursor(conn)
+    cursor.execute(format_query(
+        f"SELECT application_id, document_type, {json_select('documents')}, {json_select('ai_results')} "
+        "FROM applications WHERE application_id > ? ORDER BY application_id LIMIT ?"
+    ), (after, limit))
+    rows = [dict(row) for row in cursor.fetchall()]
+    conn.close()
+    return rows
+
+
+def _documents(application: Dict) -> List[Tuple[str, str, Optional[str]]]:
+    """(doc_id, data URL, previous verdict) of each uploaded document"""
+    previous = decode_json(application.get("ai_results"), []) or []
+    by_doc_id = {result.get("doc_id"): result.get("authenticity") for result in previous if isinstance(result, dict)}
+    documents = []
+    for index, document in enumerate(decode_json(application.get("documents"), []) or []):
+        doc_id = document.get("doc_id") or str(index)
+        documents.append((doc_id, document.get("data"), by_doc_id.get(document.get("doc_id"))))
+    return documents
+
+
+def _load_run(run_id: str) -> Optional[Dict]:
+    conn = get_db_connection()
+    cursor = get_db_cursor(conn)
+    cursor.execute(format_query("SELECT * FROM rescore_runs WHERE run_id = ?"), (run_id,))
+    row = cursor.fetchone()
+    conn.close()
+    return dict(row) if row else None
+
+
+def _start_run(run_id: Optional[str], model_version: str, threshold: float) -> Dict:
+    run = _load_run(run_id) if run_id else None
+    if run:
+        if run["model_version"] != model_version or run["confidence_threshold"] != threshold:
+            raise SystemExit(
+                f"{run_id} was started with model {run['model_version']} and threshold "
+                f"{run['confidence_threshold']}; resume it with the same settings"
+            )
+        logger.info("Resuming %s after %s", run_id, run["last_application_id"] or "the start")
+        return run
+    now = datetime.utcnow().isoformat()
+    run_id = run_id or generate_id("RESCORE")
+    execute_write_sync([(
+        "INSERT INTO rescore_runs (run_id, model_version, confidence_threshold, last_application_id, "
+        "applications, documents, status, started_at, updated_at) VALUES (?, ?, ?, '', 0, 0, ?, ?, ?)",
+        (run_id, model_version, threshold, RUNNING, now, now)
+    )])
+    return _load_run(run_id)
+
+
+def _score_chunk(service: AIService, pool: ProcessPoolExecutor, applications: List[Dict],
+                 threshold: float, batch_size: int) -> List[Tuple]:
+    """(application_id, doc_id, confidence, verdict, old_verdict, model_version) for every document of the chunk"""
+    documents = [
+        (application["application_id"], application["document_type"], doc_id, data_url, old_verdict)
+        for application in applications
+        for doc_id, data_url, old_verdict in _documents(application)
+    ]
+    extracted = list(pool.map(_extract, [data_url for _, _, _, data_url, _ in documents], chunksize=8))
+
+    scorable = [i for i, result in enumerate(extracted) if result is not None]
+    scored: Dict[int, Dict] = {}
+    for start in range(0, len(scorable), batch_size):
+        rows = scorable[start:start + batch_size]
+        results = service.score_features(
+            np.concatenate([extracted[i][0] for i in rows]), [extracted[i][1] for i in rows], threshold=threshold,
+            document_types=[documents[i][1] for i in rows]
+        )
+        scored.update(zip(rows, results))
+
+    outcomes = []
+    for i, (application_id, _, doc_id, _, old_verdict) in enumerate(documents):
+        result = scored.get(i)
+        confidence = result.get("prediction") if result else None
+        verdict = result.get("verdict", "error") if result else "unreadable"
+        model_version = result.get("model_version", service.model_version) if result else service.model_version
+        outcomes.append((application_id, doc_id, confidence, verdict, old_verdict, model_version))
+    return outcomes
+
+
+def rescore(run_id: Optional[str] = None, threshold: Optional[float] = None, chunk_size: int = 200,
+            batch_size: int = 1024, processes: Optional[int] = None, max_chunks: Optional[int] = None) -> str:
+    """Re-score applications after the run's checkpoint; returns the run ID"""
+    processes = processes or os.cpu_count()
+    service = AIService()
+    if service.model is None or service.poly is None or service.scaler is None:
+        raise SystemExit(f"Model resources could not be loaded from {settings.model_path}")
+    threshold = settings.confidence_threshold if threshold is None else threshold
+    run = _start_run(run_id, service.model_version, threshold)
+    run_id = run["run_id"]
+    after = run["last_application_id"] or ""
+    chunks = scored = 0
+    started = time.perf_counter()
+
+    # The pool processes split the cores between them
+    pool_threads = compute_budget(processes)["threads"]
+    # spawn: forking a process that has loaded TensorFlow is not safe
+    with child_thread_env(pool_threads), ProcessPoolExecutor(
+        max_workers=processes, mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_extractor, initargs=(pool_threads,)
+    ) as pool:
+        while max_chunks is None or chunks < max_chunks:
+            applications = _fetch_chunk(after, chunk_size)
+            if not applications:
+                execute_write_sync([(
+                    "UPDATE rescore_runs SET status = ?, updated_at = ? WHERE run_id = ?",
+                    (COMPLETED, datetime.utcnow().isoformat(), run_id)
+                )])
+                break
+            outcomes = _score_chunk(service, pool, applications, threshold, batch_size)
+            after = applications[-1]["application_id"]
+            statements = [(
+                "INSERT INTO rescore_results (run_id, application_id, doc_id, model_version, confidence, verdict, "
+                "old_verdict) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (run_id, application_id, doc_id, model_version, confidence, verdict, old_verdict)
+            ) for application_id, doc_id, confidence, verdict, old_verdict, model_version in outcomes]
+            # Results and checkpoint commit together: a resumed run neither skips nor repeats a chunk
+            statements.append((
+                "UPDATE rescore_runs SET last_application_id = ?, applications = applications + ?, "
+                "documents = documents + ?, updated_at = ? WHERE run_id = ?",
+                (after, len(applications), len(outcomes), datetime.utcnow().isoformat(), run_id)
+            ))
+            execute_write_sync(statements)
+            chunks += 1
+            scored += len(outcomes)
+            logger.info("%s: %d documents scored up to %s (%.1f documents/s)", run_id,
+                        run["documents"] + scored, after, scored / max(time.perf_counter() - started, 1e-9))
+    return run_id
+
+
+def confusion_report(run_id: str) -> Dict:
+    """Old vs new verdict counts for documents and applications of a run"""
+    run = _load_run(run_id)
+    if run is None:
+        raise SystemExit(f"Unknown run {run_id}")
+    conn = get_db_connection()
+    cursor = get_db_cursor(conn)
+    cursor.execute(format_query(
+        "SELECT application_id, verdict, old_verdict FROM rescore_results WHERE run_id = ? ORDER BY application_id"
+    ), (run_id,))
+    documents: Counter = Counter()
+    applications: Counter = Counter()
+    current, old_all, new_all = None, True, True
+
+    def close_application():
+        if current is not None:
+            applications[(_combined(old_all), _combined(new_all))] += 1
+
+    while True:
+        rows = cursor.fetchmany(5000)
+        if not rows:
+            break
+        for row in rows:
+            old_verdict = row["old_verdict"] or "unscored"
+            documents[(old_verdict, row["verdict"])] += 1
+            if row["application_id"] != current:
+                close_application()
+                current, old_all, new_all = row["application_id"], True, True
+            old_all = old_all and old_verdict == "authentic"
+            new_all = new_all and row["verdict"] == "authentic"
+    close_application()
+    conn.close()
+
+    def table(counts: Counter) -> Dict:
+        flipped = sum(n for (old, new), n in counts.items() if old != new)
+        return {
+            "total": sum(counts.values()),
+            "flipped": flipped,
+            "confusion": {f"{old} -> {new}": n for (old, new), n in sorted(counts.items())},
+        }
+
+    return {
+        "run_id": run_id,
+        "status": run["status"],
+        "model_version": run["model_version"],
+        "confidence_threshold": run["confidence_threshold"],
+        "documents": table(documents),
+        "applications": table(applications),
+    }
+
+
+def _combined(all_authentic: bool) -> str:
+    return "authentic" if all_authentic else "not_authentic"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-score past applications and compare verdicts")
+    parser.add_argument("--run-id", help="Resume this run (or start it under this ID)")
+    parser.add_argument("--threshold", type=float, help=f"Confidence threshold (default {settings.confidence_threshold})")
+    parser.add_argument("--chunk-size", type=int, default=200, help="Applications read per chunk")
+    parser.add_argument("--batch-size", type=int, default=1024, help="Documents per model call")
+    parser.add_argument("--processes", type=int, help="Feature extraction processes (default: CPU count)")
+    parser.add_argument("--max-chunks", type=int, help="Stop after this many chunks (resume later)")
+    parser.add_argument("--report", metavar="RUN_ID", help="Only print the verdict confusion of a run")
+    args = parser.parse_args()
+
+    run_id = args.report or rescore(
+        args.run_id, args.threshold, args.chunk_size, args.batch_size, args.processes, args.max_chunks
+    )
+    print(json.dumps(confusion_report(run_id), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Fast JSON responses for iRembo Backend API
+
+Responses are rendered with orjson when it is installed and fall back to the
+standard library encoder otherwise. List endpoints build their response
+models with ``model_construct`` and return ``FastJSONResponse`` directly, so
+FastAPI does not re-validate and re-encode every row.
+"""
+
+import json
+from datetime import date, datetime
+from typing import Any
+
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+from json_columns import decode_json
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+# orjson.Fragment (3.9+) embeds already-serialized JSON without parsing it
+_Fragment = getattr(orjson, "Fragment", None)
+
+
+class RawJSON:
+    """JSON text to embed as-is when the encoder cannot pass it through natively"""
+
+    __slots__ = ("text",)
+
+    def __init__(self, text: str):
+        self.text = text
+
+
+def raw_json(value: Any, default: Any = None) -> Any:
+    """
+    Wrap JSON text read from a JSON column for zero-copy output.
+
+    Only use the result in a ``FastJSONResponse``; FastAPI's own encoder
+    does not understand it.
+    """
+    if value is None:
+        return default
+    if isinstance(value, (bytes, memoryview)):
+        value = bytes(value).decode("utf-8")
+    if not isinstance(value, str):
+        return value
+    if _Fragment is not None:
+        return _Fragment(value)
+    return RawJSON(value)
+
+
+def _default(obj: Any) -> Any:
+    if isinstance(obj, BaseModel):
+        # Shallow: field values are already plain data for constructed models
+        return dict(obj)
+    if isinstance(obj, RawJSON):
+        return decode_json(obj.text)
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with orjson, understanding models and raw JSON"""
+
+    def render(self, content: Any) -> bytes:
+        if orjson is not None:
+            return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+        return json.dumps(
+            content,
+            default=_default,
+            ensure_ascii=False,
+            allow_nan=False,
+            separators=(",", ":"),
+        ).encode("utf-8")
@@ -2,20 +2,16 @@
 API Routes for iRembo Document Verification System
 """
 
-from fastapi import APIRouter, HTTPException, Query, UploadFile, File, Form
-from fastapi.responses import JSONResponse, FileResponse, StreamingResponse
+from fastapi import APIRouter, HTTPException, Query, UploadFile, File, Form, Request, Header, Depends
+from fastapi.responses import JSONResponse, FileResponse, StreamingResponse, Response
 from datetime import datetime, timedelta, date
+import asyncio
 import base64
-import uuid
 import os
 import shutil
-import time
 import sqlite3
-import psycopg2
-from psycopg2.extras import RealDictCursor
 import json
 import io
-import random
 from typing import Optional, List, Dict, Any
 from PIL import Image, ImageDraw, ImageFont
 
@@ -25,60 +21,46 @@ from models import (
     VerificationData, Verification,
     AIReviewData, AIReview,
     DocumentUpload, DocumentRequest,
-    SuccessResponse, PaginatedResponse, ErrorResponse
+    SuccessResponse, PaginatedResponse, SyncPaginatedResponse, ErrorResponse
+)
+from utils import get_ai_service, logger
+from ids import generate_id
+from database import (
+    get_db_connection, get_db_cursor, format_query, execute_write, using_postgres
+)
+from responses import FastJSONResponse, raw_json
+from queue_index import applications_queue, document_requests_queue
+from cache import template_cache, registry_cache, cache_stats
+from metrics import metrics
+from http_cache import list_validators, not_modified, with_validators
+from admission import admission, admission_stats
+from query_stats import query_stats
+from profiling import token_matches, list_profiles, load_profile, to_speedscope
+from registry_import import create_indexes, upsert_query
+from jobs import create_job_tables, enqueue_statements, get_job_for_application, job_counts
+from archive import create_archive_tables, archived_application
+from feature_store import record_prediction
+from rescore import create_rescore_tables
+from drift import drift_monitor
+from shadow import create_shadow_tables, shadow_sample, shadow_summary
+from events import (
+    create_change_tables, application_change, document_request_change, appeal_change, appeal_deletion,
+    change_bus, EventStream, SyncWindowExpired, check_sync_window, changed_since_condition,
+    deleted_since, current_seq
+)
+from json_columns import (
+    JSON_COLUMNS, encode_json, json_placeholder, json_select, json_path_select,
+    decode_json, parse_json_fields, document_refs_select, document_lookup_query
 )
-from utils import get_ai_service
 
 router = APIRouter()
 
 # Database Setup
-DB_PATH = "irembo_verification.db"
-# This flag tracks if we are actually using PostgreSQL (dynamic fallback support)
-_actually_use_postgres = settings.use_postgresql
-
-def get_db_connection():
-    global _actually_use_postgres
-    if settings.use_postgresql:
-        try:
-            conn = psycopg2.connect(
-                host=settings.db_host,
-                port=settings.db_port,
-                user=settings.db_user,
-                password=settings.db_password,
-                dbname=settings.db_name,
-                connect_timeout=3
-            )
-            _actually_use_postgres = True
-            return conn
-        except Exception as e:
-            print(f"Error connecting to PostgreSQL: {e}")
-            # Fallback to SQLite if Postgres fails (optional, but good for dev)
-            conn = sqlite3.connect(DB_PATH)
-            conn.row_factory = sqlite3.Row
-            _actually_use_postgres = False
-            return conn
-    else:
-        _actually_use_postgres = False
-        conn = sqlite3.connect(DB_PATH)
-        conn.row_factory = sqlite3.Row
-        return conn
-
-def get_db_cursor(conn):
-    if _actually_use_postgres:
-        return conn.cursor(cursor_factory=RealDictCursor)
-    return conn.cursor()
-
-def format_query(query):
-    if _actually_use_postgres:
-        # Simple placeholder replacement: ? -> %s
-        return query.replace("?", "%s")
-    return query
-
 def init_db():
     conn = get_db_connection()
     cursor = conn.cursor()
     
-    if _actually_use_postgres:
+    if using_postgres():
         # PostgreSQL syntax
         cursor.execute('''
         CREATE TABLE IF NOT EXISTS applications (
@@ -95,12 +77,13 @@ def init_db():
             priority TEXT,
             ai_confidence FLOAT,
             ai_verdict TEXT,
-            ai_results TEXT,
+            ai_results JSONB,
             document_base64 TEXT,
-            documents TEXT,
+            documents JSONB,
             local_feedback TEXT,
             irembo_feedback TEXT,
-            feedback TEXT
+            feedback TEXT,
+            updated_at TEXT
         )
         ''')
         
@@ -188,7 +171,8 @@ def init_db():
             documents TEXT,
             local_feedback TEXT,
             irembo_feedback TEXT,
-            feedback TEXT
+            feedback TEXT,
+            updated_at TEXT
         )
         ''')
         
@@ -256,6 +240,14 @@ def init_db():
         )
         ''')
     
+    # Registry lookups are by (citizen_id, document_type), not registry_id
+    create_indexes(cursor, "document_registry")
+    create_indexes(cursor, "document_templates")
+    create_job_tables(cursor)
+    create_change_tables(cursor)
+    create_archive_tables(cursor)
+    create_rescore_tables(cursor)
+    create_shadow_tables(cursor)
     conn.commit()
     
     # Check for missing columns in applications (for migrations)
@@ -289,6 +281,10 @@ def init_db():
                 cursor.execute("ALTER TABLE applications ADD COLUMN feedback TEXT")
             if 'priority' not in columns:
                 cursor.execute("ALTER TABLE applications ADD COLUMN priority TEXT")
+            if 'current_stage' not in columns:
+                cursor.execute("ALTER TABLE applications ADD COLUMN current_stage TEXT DEFAULT 'irembo'")
+            if 'updated_at' not in columns:
+                cursor.execute("ALTER TABLE applications ADD COLUMN updated_at TEXT")
             
             # Migration for document_requests table
             cursor.execute("PRAGMA table_info(document_requests)")
@@ -314,6 +310,8 @@ def init_db():
             """)
             if not cursor.fetchone():
                 cursor.execute("ALTER TABLE applications ADD COLUMN citizen_id TEXT")
+            cursor.execute("ALTER TABLE applications ADD COLUMN IF NOT EXISTS account_id TEXT")
+            cursor.execute("ALTER TABLE applications ADD COLUMN IF NOT EXISTS updated_at TEXT")
             
             cursor.execute("""
             SELECT column_name 
@@ -322,13 +320,54 @@ def init_db():
             """)
             if not cursor.fetchone():
                 cursor.execute("ALTER TABLE document_requests ADD COLUMN updated_at TEXT")
+
+            # Convert legacy TEXT JSON columns to native JSONB
+            for column in JSON_COLUMNS:
+                cursor.execute("""
+                SELECT data_type 
+                FROM information_schema.columns 
+                WHERE table_name='applications' AND column_name=%s
+                """, (column,))
+                row = cursor.fetchone()
+                if row and row[0] == 'text':
+                    cursor.execute(f"ALTER TABLE applications ALTER COLUMN {column} TYPE JSONB USING NULLIF({column}, '')::jsonb")
     except Exception as e:
-        print(f"Migration error: {e}")
+        logger.error("Migration error: %s", e)
         conn.rollback()
+
+    # Delta sync filters on modification time
+    cursor.execute("UPDATE applications SET updated_at = created_at WHERE updated_at IS NULL")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_applications_updated_at ON applications (updated_at)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_document_requests_updated_at ON document_requests (updated_at)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_appeals_updated_at ON appeals (updated_at)")
     
     conn.commit()
     conn.close()
 
+# Columns returned for an application, in table order
+APPLICATION_COLUMNS = [
+    "application_id", "citizen_name", "citizen_email", "citizen_id", "citizen_phone",
+    "description", "document_type", "status", "current_stage", "created_at", "priority",
+    "ai_confidence", "ai_verdict", "ai_results", "document_base64", "documents",
+    "local_feedback", "irembo_feedback", "feedback", "account_id", "updated_at"
+]
+
+# Columns returned by the default "summary" list view; document contents are
+# replaced by references and fetched from the detail endpoints instead
+SUMMARY_COLUMNS = [
+    c for c in APPLICATION_COLUMNS if c not in ("ai_results", "document_base64")
+] + ["queue_position"]
+
+def parse_application_fields(fields: Optional[str], view: str) -> List[str]:
+    """Resolve the columns for an application list from ``fields`` or the view"""
+    if not fields:
+        return list(SUMMARY_COLUMNS) if view == "summary" else APPLICATION_COLUMNS + ["queue_position"]
+    columns = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [c for c in columns if c not in APPLICATION_COLUMNS and c != "queue_position"]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return list(dict.fromkeys(columns))
+
 # Initialize the database
 init_db()
 
@@ -433,14 +472,8 @@ def initialize_demo_data():
         ("REG-123", "123456789", "National ID", "2024-01-01", "synthetic_documents/nida_id/valid/nida_id_0001.jpg", '{}')
     ]
     
-    for item in registry_data:
-        # Check if already exists to avoid duplicates during dev-restarts
-        cursor.execute(format_query("SELECT registry_id FROM document_registry WHERE registry_id = ?"), (item[0],))
-        if not cursor.fetchone():
-            cursor.execute(format_query("""
-                INSERT INTO document_registry (registry_id, citizen_id, document_type, issued_date, file_path, metadata)
-                VALUES (?, ?, ?, ?, ?, ?)
-            """), item)
+    # Existing rows are kept to avoid duplicates during dev-restarts
+    cursor.executemany(format_query(upsert_query("document_registry", update=False)), registry_data)
     
     # Seed Document Templates (Standard Reference Logic)
     templates_data = [
@@ -449,31 +482,84 @@ def initialize_demo_data():
         ("TMP-MARRY", "Marriage Certificate", "v1.1", '["Spouse A Name", "Spouse B Name", "Place of Marriage", "Officer Signature"]', '{"border_style": "ornate", "seal_color": "gold"}', "assets/samples/marriage_cert.jpg")
     ]
     
-    for tmpl in templates_data:
-        cursor.execute(format_query("SELECT template_id FROM document_templates WHERE template_id = ?"), (tmpl[0],))
-        if not cursor.fetchone():
-            cursor.execute(format_query("""
-                INSERT INTO document_templates (template_id, document_type, standard_version, required_fields, layout_metadata, sample_image_url)
-                VALUES (?, ?, ?, ?, ?, ?)
-            """), tmpl)
+    cursor.executemany(format_query(upsert_query("document_templates", update=False)), templates_data)
 
     conn.commit()
     conn.close()
+    template_cache.invalidate()
+    registry_cache.clear()
 
 # Seed the database for demo/testing
 initialize_demo_data()
 
+# ==================== QUEUE INDEX ====================
+
+def _load_pending_applications():
+    conn = get_db_connection()
+    cursor = get_db_cursor(conn)
+    cursor.execute("SELECT application_id, document_type, created_at FROM applications WHERE status = 'pending'")
+    rows = [(r["application_id"], r["document_type"], r["created_at"]) for r in cursor.fetchall()]
+    conn.close()
+    return rows
+
+def _load_pending_document_requests():
+    conn = get_db_connection()
+    cursor = get_db_cursor(conn)
+    cursor.execute("SELECT request_id, document_type, requested_at FROM document_requests WHERE status = 'pending'")
+    rows = [(r["request_id"], r["document_type"], r["requested_at"]) for r in cursor.fetchall()]
+    conn.close()
+    return rows
+
+def refresh_queue_indexes():
+    """Rebuild the in-process queue indexes when they are older than the refresh interval"""
+    applications_queue.refresh_if_stale(settings.queue_index_refresh_seconds, _load_pending_applications)
+    document_requests_queue.refresh_if_stale(settings.queue_index_refresh_seconds, _load_pending_document_requests)
+
+# Build the queue indexes from the database
+applications_queue.rebuild(_load_pending_applications())
+document_requests_queue.rebuild(_load_pending_document_requests())
+
+# ==================== DELTA SYNC ====================
+
+def start_sync(since_seq: Optional[int], updated_since: Optional[str]) -> int:
+    """
+    Validate a delta sync point and return the ``next_seq`` for the response.
+    The sequence is read before the rows so a change racing the query is sent
+    again on the next sync rather than lost.
+    """
+    try:
+        check_sync_window(since_seq, updated_since)
+    except SyncWindowExpired as e:
+        raise HTTPException(status_code=410, detail=str(e))
+    return current_seq()
+
+def sync_condition(entity: str, id_column: str, since_seq: Optional[int], updated_since: Optional[str]):
+    """WHERE condition and params for a delta sync, or (None, [])"""
+    if since_seq is not None:
+        return changed_since_condition(entity, id_column, since_seq)
+    if updated_since is not None:
+        return "updated_at > ?", [updated_since]
+    return None, []
+
 # ==================== APPEALS ENDPOINTS ====================
 
-@router.get("/appeals", response_model=PaginatedResponse)
+@router.get("/appeals", response_model=SyncPaginatedResponse)
 async def list_appeals(
+    request: Request,
     citizen_id: Optional[str] = Query(None),
     account_id: Optional[str] = Query(None),
     status: Optional[str] = Query(None),
+    since_seq: Optional[int] = Query(None, ge=0, description="Only rows changed after this next_seq from a previous response"),
+    updated_since: Optional[str] = Query(None, description="Only rows with updated_at after this ISO timestamp"),
     page: int = Query(1, ge=1),
     per_page: int = Query(10, ge=1, le=100)
 ):
     """List all appeals from SQLite"""
+    validators = list_validators("appeal")
+    cached = not_modified(request, validators)
+    if cached:
+        return cached
+    next_seq = start_sync(since_seq, updated_since)
     conn = get_db_connection()
     cursor = get_db_cursor(conn)
     
@@ -490,6 +576,10 @@ async def list_appeals(
     if status:
         conditions.append("status = ?")
         params.append(status)
+    sync, sync_params = sync_condition("appeal", "appeal_id", since_seq, updated_since)
+    if sync:
+        conditions.append(sync)
+        params.extend(sync_params)
         
     if conditions:
         query += " WHERE " + " AND ".join(conditions)
@@ -506,13 +596,15 @@ async def list_appeals(
     start = (page - 1) * per_page
     end = start + per_page
     
-    return PaginatedResponse(
+    return with_validators(FastJSONResponse(SyncPaginatedResponse.model_construct(
         total=total,
         page=page,
         per_page=per_page,
         data=appeals_list[start:end],
-        message="Appeals retrieved successfully"
-    )
+        message="Appeals retrieved successfully",
+        next_seq=next_seq,
+        deleted=deleted_since("appeal", since_seq, updated_since)
+    )), validators)
 
 @router.get("/appeals/{appeal_id}")
 async def get_appeal(appeal_id: str):
@@ -531,23 +623,20 @@ async def get_appeal(appeal_id: str):
 @router.post("/appeals", response_model=SuccessResponse)
 async def create_appeal(appeal_data: AppealCreate):
     """Submit a new appeal to SQLite"""
-    appeal_id = f"APPEAL-{uuid.uuid4().hex[:8].upper()}"
+    appeal_id = generate_id("APPEAL")
     now = datetime.utcnow().isoformat()
     
-    conn = get_db_connection()
-    cursor = get_db_cursor(conn)
-    cursor.execute(format_query('''
+    await execute_write([('''
     INSERT INTO appeals (
         appeal_id, application_id, citizen_id, account_id, reason, 
         status, created_at, updated_at, notes, additional_documents
     ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    '''), (
+    ''', (
         appeal_id, appeal_data.application_id, appeal_data.citizen_id or "CITIZEN-DEFAULT", 
         appeal_data.account_id,
         appeal_data.reason, "pending", now, now, "", appeal_data.additional_documents
-    ))
-    conn.commit()
-    conn.close()
+    )), appeal_change(appeal_id)])
+    change_bus.notify()
     
     return SuccessResponse(message="Appeal submitted successfully", data={"appeal_id": appeal_id})
     
@@ -559,17 +648,28 @@ async def create_appeal(appeal_data: AppealCreate):
 @router.put("/appeals/{appeal_id}", response_model=SuccessResponse)
 async def update_appeal(appeal_id: str, update_data: AppealUpdate):
     """Update an appeal's status or notes"""
-    if appeal_id not in appeals_db:
-        raise HTTPException(status_code=404, detail="Appeal not found")
-    
-    appeal = appeals_db[appeal_id]
-    
+    assignments = ["updated_at = ?"]
+    params = [datetime.utcnow().isoformat()]
     if update_data.status:
-        appeal["status"] = update_data.status
+        assignments.append("status = ?")
+        params.append(update_data.status)
     if update_data.notes:
-        appeal["notes"] = update_data.notes
+        assignments.append("notes = ?")
+        params.append(update_data.notes)
+    
+    updated = await execute_write([
+        (f"UPDATE appeals SET {', '.join(assignments)} WHERE appeal_id = ?", (*params, appeal_id)),
+        appeal_change(appeal_id)
+    ])
+    if not updated:
+        raise HTTPException(status_code=404, detail="Appeal not found")
+    change_bus.notify()
     
-    appeal["updated_at"] = datetime.utcnow().isoformat()
+    conn = get_db_connection()
+    cursor = get_db_cursor(conn)
+    cursor.execute(format_query("SELECT * FROM appeals WHERE appeal_id = ?"), (appeal_id,))
+    appeal = dict(cursor.fetchone())
+    conn.close()
     
     return SuccessResponse(
         message="Appeal updated successfully",
@@ -578,11 +678,14 @@ async def update_appeal(appeal_id: str, update_data: AppealUpdate):
 
 @router.delete("/appeals/{appeal_id}", response_model=SuccessResponse)
 async def delete_appeal(appeal_id: str):
-    """Delete an appeal"""
-    if appeal_id not in appeals_db:
+    """Delete an appeal, leaving a tombstone for delta sync"""
+    deleted = await execute_write([
+        appeal_deletion(appeal_id),
+        ("DELETE FROM appeals WHERE appeal_id = ?", (appeal_id,))
+    ])
+    if not deleted:
         raise HTTPException(status_code=404, detail="Appeal not found")
-    
-    del appeals_db[appeal_id]
+    change_bus.notify()
     
     return SuccessResponse(message="Appeal deleted successfully")
 
@@ -591,7 +694,7 @@ async def delete_appeal(appeal_id: str):
 @router.post("/verify", response_model=SuccessResponse)
 async def verify_document(verification_data: VerificationData):
     """Officer submits verification decision"""
-    verification_id = f"VER-{uuid.uuid4().hex[:8].upper()}"
+    verification_id = generate_id("VER")
     
     verification = {
         "verification_id": verification_id,
@@ -626,7 +729,7 @@ async def get_verification(verification_id: str):
 @router.post("/ai-review", response_model=SuccessResponse)
 async def submit_ai_review(review_data: AIReviewData):
     """Officer submits AI review result"""
-    review_id = f"REVIEW-{uuid.uuid4().hex[:8].upper()}"
+    review_id = generate_id("REVIEW")
     
     review = {
         "review_id": review_id,
@@ -661,17 +764,53 @@ async def get_ai_review(review_id: str):
 
 @router.get("/applications")
 async def list_applications(
+    request: Request,
     status: Optional[str] = Query(None),
     citizen_id: Optional[str] = Query(None),
     account_id: Optional[str] = Query(None),
+    since_seq: Optional[int] = Query(None, ge=0, description="Only rows changed after this next_seq from a previous response"),
+    updated_since: Optional[str] = Query(None, description="Only rows with updated_at after this ISO timestamp"),
     page: int = Query(1, ge=1),
-    per_page: int = Query(10, ge=1, le=100)
+    per_page: int = Query(10, ge=1, le=100),
+    view: str = Query("summary", pattern="^(summary|full)$", description="summary replaces document contents with references"),
+    fields: Optional[str] = Query(None, description="Comma-separated columns to return, e.g. application_id,status,queue_position"),
+    json_fields: Optional[str] = Query(None, description="Comma-separated JSON paths to project, e.g. ai_results[].confidence")
 ):
     """List all applications from SQLite"""
+    try:
+        json_paths = parse_json_fields(json_fields)
+        columns = parse_application_fields(fields, view)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    want_queue_position = "queue_position" in columns
+    columns = [c for c in columns if c != "queue_position"]
+    # Queue position needs these even when the caller did not ask for them
+    internal = [c for c in ("status", "document_type", "created_at") if want_queue_position and c not in columns]
+    if "documents" in columns and "application_id" not in columns:
+        internal.append("application_id")
+
+    validators = list_validators("application")
+    cached = not_modified(request, validators)
+    if cached:
+        return cached
+
+    if want_queue_position:
+        refresh_queue_indexes()
+
+    next_seq = start_sync(since_seq, updated_since)
     conn = get_db_connection()
     cursor = get_db_cursor(conn)
     
-    query = "SELECT * FROM applications"
+    select_list = []
+    for c in columns + internal:
+        if c == "documents" and view == "summary":
+            select_list.append(document_refs_select())
+        elif c in JSON_COLUMNS:
+            select_list.append(json_select(c))
+        else:
+            select_list.append(c)
+    select_list += [json_path_select(path, f"json_field_{i}") for i, path in enumerate(json_paths)]
     params = []
     
     conditions = []
@@ -684,85 +823,141 @@ async def list_applications(
     if account_id:
         conditions.append("account_id = ?")
         params.append(account_id)
+    sync, sync_params = sync_condition("application", "application_id", since_seq, updated_since)
+    if sync:
+        conditions.append(sync)
+        params.extend(sync_params)
 
-    if conditions:
-        query += " WHERE " + " AND ".join(conditions)
+    where = " WHERE " + " AND ".join(conditions) if conditions else ""
     
-    query += " ORDER BY created_at DESC"
-    
-    cursor.execute(format_query(query), params)
+    cursor.execute(format_query(f"SELECT COUNT(*) AS total FROM applications{where}"), params)
+    total = cursor.fetchone()["total"]
+
+    query = f"SELECT {', '.join(select_list)} FROM applications{where} ORDER BY created_at DESC LIMIT ? OFFSET ?"
+    cursor.execute(format_query(query), params + [per_page, (page - 1) * per_page])
     rows = cursor.fetchall()
     
     apps_list = []
     for row in rows:
         app = dict(row)
         
-        # Calculate current queue position if pending, based on same document type
-        if app.get("status") == "pending":
-            doc_type = app.get("document_type")
-            cursor.execute(format_query("SELECT COUNT(*) FROM applications WHERE status = 'pending' AND document_type = ? AND created_at < ?"), (doc_type, app['created_at']))
-            result = cursor.fetchone()
-            # Fetchone in RealDictCursor returns a dict, in sqlite3.Row it returns a Row (indexable)
-            count = result[0] if isinstance(result, (tuple, list, sqlite3.Row)) else list(result.values())[0]
-            app["queue_position"] = count + 1
-        else:
-            app["queue_position"] = 0
-
+        # Current queue position if pending, based on same document type
+        if want_queue_position:
+            if app.get("status") == "pending":
+                app["queue_position"] = applications_queue.position(app.get("document_type"), app["created_at"])
+            else:
+                app["queue_position"] = 0
+
+        # Stored JSON is passed through to the response without decoding
         if app.get("ai_results"):
-            try:
-                app["ai_results"] = json.loads(app["ai_results"])
-            except:
-                pass
+            app["ai_results"] = raw_json(app["ai_results"])
         
-        if app.get("documents"):
-            try:
-                app["documents"] = json.loads(app["documents"])
-            except:
-                app["documents"] = []
+        if "documents" in app:
+            if view == "summary":
+                app["documents"] = decode_json(app["documents"], []) or []
+                for doc in app["documents"]:
+                    doc["url"] = f"{settings.api_prefix}/applications/{app['application_id']}/documents/{doc.get('doc_id')}"
+            else:
+                app["documents"] = raw_json(app["documents"], [])
+
+        for i, path in enumerate(json_paths):
+            app[path] = raw_json(app.pop(f"json_field_{i}"))
+
+        for c in internal:
+            app.pop(c, None)
                 
         apps_list.append(app)
     
     conn.close()
     
-    total = len(apps_list)
-    start = (page - 1) * per_page
-    end = start + per_page
-    
-    return PaginatedResponse(
+    return with_validators(FastJSONResponse(SyncPaginatedResponse.model_construct(
         total=total,
         page=page,
         per_page=per_page,
-        data=apps_list[start:end],
-        message="Applications retrieved successfully"
-    )
+        data=apps_list,
+        message="Applications retrieved successfully",
+        next_seq=next_seq,
+        deleted=deleted_since("application", since_seq, updated_since)
+    )), validators)
 
 @router.get("/applications/{application_id}")
 async def get_application(application_id: str):
     """Get single application from SQLite"""
     conn = get_db_connection()
     cursor = get_db_cursor(conn)
-    cursor.execute(format_query("SELECT * FROM applications WHERE application_id = ?"), (application_id,))
+    select_list = [json_select(c) if c in JSON_COLUMNS else c for c in APPLICATION_COLUMNS]
+    cursor.execute(format_query(f"SELECT {', '.join(select_list)} FROM applications WHERE application_id = ?"), (application_id,))
     row = cursor.fetchone()
     conn.close()
     
-    if not row:
-        raise HTTPException(status_code=404, detail="Application not found")
-    
-    app = dict(row)
+    if row:
+        app = dict(row)
+    else:
+        # Old finalized applications live in cold storage (see archive.py)
+        archived = await asyncio.to_thread(archived_application, application_id)
+        if not archived:
+            raise HTTPException(status_code=404, detail="Application not found")
+        app = {c: archived.get(c) for c in APPLICATION_COLUMNS}
+        app["archived"] = True
+
     if app.get("ai_results"):
-        try:
-            app["ai_results"] = json.loads(app["ai_results"])
-        except:
-            pass
+        app["ai_results"] = decode_json(app["ai_results"], app["ai_results"])
             
     if app.get("documents"):
-        try:
-            app["documents"] = json.loads(app["documents"])
-        except:
-            app["documents"] = []
+        app["documents"] = decode_json(app["documents"], [])
             
     return SuccessResponse(message="Application retrieved", data=app)
 
+@router.get("/applications/{application_id}/documents/{doc_id}")
+async def get_application_document(application_id: str, doc_id: str):
+    """Get one uploaded document, including its data URL"""
+    conn = get_db_connection()
+    cursor = get_db_cursor(conn)
+    cursor.execute(format_query(document_lookup_query()), (application_id, doc_id))
+    row = cursor.fetchone()
+    conn.close()
+
+    if row:
+        return SuccessResponse(message="Document retrieved", data=decode_json(row["document"], {}))
+
+    archived = await asyncio.to_thread(archived_application, application_id)
+    documents = decode_json(archived.get("documents"), []) if archived else []
+    document = next((d for d in documents or [] if d.get("doc_id") == doc_id), None)
+    if document is None:
+        raise HTTPException(status_code=404, detail="Document not found")
+    return SuccessResponse(message="Document retrieved", data=document)
+
+@router.get("/applications/{application_id}/verification", response_model=SuccessResponse)
+async def get_application_verification(application_id: str):
+    """Poll the AI verification job of an application"""
+    conn = get_db_connection()
+    cursor = get_db_cursor(conn)
+    cursor.execute(format_query(
+        f"SELECT status, ai_confidence, ai_verdict, feedback, {json_select('ai_results')} FROM applications WHERE application_id = ?"
+    ), (application_id,))
+    row = cursor.fetchone()
+    conn.close()
+    
+    if not row:
+        raise HTTPException(status_code=404, detail="Application not found")
+    
+    app = dict(row)
+    job = get_job_for_application(application_id)
+    data = {
+        "application_id": application_id,
+        "status": app["status"],
+        "job": job
+    }
+    if app["status"] not in ("queued", "processing"):
+        data.update({
+            "ai_confidence": app["ai_confidence"],
+            "ai_verdict": app["ai_verdict"],
+            "feedback": app["feedback"],
+            "results": decode_json(app["ai_results"], [])
+        })
+    
+    return SuccessResponse(message="Verification status retrieved", data=data)
+
 @router.put("/applications/{application_id}")
 async def update_application(application_id: str, payload: dict):
     """Update application status or feedback in SQLite"""
@@ -770,55 +965,61 @@ async def update_application(application_id: str, payload: dict):
     cursor = get_db_cursor(conn)
     
     # Check if exists
-    cursor.execute(format_query("SELECT * FROM applications WHERE application_id = ?"), (application_id,))
+    cursor.execute(format_query("SELECT citizen_id, document_type, feedback, created_at FROM applications WHERE application_id = ?"), (application_id,))
     app = cursor.fetchone()
     if not app:
         conn.close()
         raise HTTPException(status_code=404, detail="Application not found")
 
+    app = dict(app)
+    conn.close()
+
     status = payload.get("status")
     feedback = payload.get("feedback")
     updated_at = datetime.utcnow().isoformat()
 
+    statements = []
     if status and feedback:
-        cursor.execute(format_query("UPDATE applications SET status = ?, feedback = ? WHERE application_id = ?"), 
-                      (status, feedback, application_id))
+        statements.append(("UPDATE applications SET status = ?, feedback = ?, updated_at = ? WHERE application_id = ?", 
+                           (status, feedback, updated_at, application_id)))
     elif status:
-        cursor.execute(format_query("UPDATE applications SET status = ? WHERE application_id = ?"), 
-                      (status, application_id))
+        statements.append(("UPDATE applications SET status = ?, updated_at = ? WHERE application_id = ?", 
+                           (status, updated_at, application_id)))
     elif feedback:
-        cursor.execute(format_query("UPDATE applications SET feedback = ? WHERE application_id = ?"), 
-                      (feedback, application_id))
+        statements.append(("UPDATE applications SET feedback = ?, updated_at = ? WHERE application_id = ?", 
+                           (feedback, updated_at, application_id)))
 
     # If approved, save to issued_documents
     if status in ['approved', 'sent']:
-        issue_id = f"ISS-{uuid.uuid4().hex[:8].upper()}"
-        cursor.execute(format_query("""
+        issue_id = generate_id("ISS")
+        statements.append(("""
             INSERT INTO issued_documents (issue_id, reference_id, citizen_id, document_type, officer_notes, issued_at, file_url)
             VALUES (?, ?, ?, ?, ?, ?, ?)
-        """), (issue_id, application_id, app['citizen_id'], app['document_type'], feedback or app.get('feedback', ''), updated_at, f"/downloads/{application_id}"))
+        """, (issue_id, application_id, app['citizen_id'], app['document_type'], feedback or app.get('feedback', ''), updated_at, f"/downloads/{application_id}")))
 
-    conn.commit()
-    conn.close()
+    if statements:
+        statements.append(application_change(application_id))
+        await execute_write(statements)
+        change_bus.notify()
+
+    if status:
+        applications_queue.set_status(app['document_type'], application_id, app['created_at'], status)
 
     return SuccessResponse(message="Application updated successfully")
 
 @router.post("/applications/{application_id}/forward")
 async def forward_to_irembo(application_id: str, payload: dict):
     """Forward from Cell/District to iRembo Headquarters"""
-    conn = get_db_connection()
-    cursor = get_db_cursor(conn)
-    
     local_feedback = payload.get("feedback", "No local feedback provided")
     
-    cursor.execute(format_query('''
+    await execute_write([('''
         UPDATE applications 
-        SET current_stage = 'irembo', local_feedback = ?, status = 'pending_irembo'
+        SET current_stage = 'irembo', local_feedback = ?, status = 'pending_irembo', updated_at = ?
         WHERE application_id = ?
-    '''), (local_feedback, application_id))
+    ''', (local_feedback, datetime.utcnow().isoformat(), application_id)), application_change(application_id)])
+    applications_queue.discard(application_id)
+    change_bus.notify()
     
-    conn.commit()
-    conn.close()
     return SuccessResponse(message="Application forwarded to iRembo successfully")
 
 @router.post("/applications/{application_id}/analyze")
@@ -837,17 +1038,10 @@ async def prompt_ai_analysis(application_id: str, payload: dict):
     cursor = get_db_cursor(conn)
     cursor.execute(format_query("SELECT document_type FROM applications WHERE application_id = ?"), (application_id,))
     app = cursor.fetchone()
+    conn.close()
     
     # Fetch template for similarity comparison
-    template = None
-    if app:
-        service_type = app["document_type"]
-        cursor.execute(format_query("SELECT * FROM document_templates WHERE document_type = ?"), (service_type,))
-        template_row = cursor.fetchone()
-        if template_row:
-            template = dict(template_row)
-    
-    conn.close()
+    template = template_cache.get(app["document_type"]) if app else None
     
     service_type = app["document_type"] if app else "Unknown"
     prompt_response = f"Based on your request, I have analyzed the document structure and content."
@@ -899,7 +1093,7 @@ async def prompt_ai_analysis(application_id: str, payload: dict):
 
 # ==================== DOCUMENT ENDPOINTS ====================
 
-@router.post("/upload", response_model=SuccessResponse)
+@router.post("/upload", response_model=SuccessResponse, dependencies=[Depends(admission("upload"))])
 async def upload_documents(
     document_type: str = Form(...),
     citizen_name: str = Form(...),
@@ -910,32 +1104,18 @@ async def upload_documents(
     description: Optional[str] = Form(None),
     file: List[UploadFile] = File(...)
 ):
-    """Unified endpoint for citizen upload and AI processing."""
-    results = []
-    stored_documents = []
-    application_id = f"APP-{int(time.time())}"
-    
-    # Check for template and registry
-    conn = get_db_connection()
-    cursor = get_db_cursor(conn)
-
-    cursor.execute(format_query("SELECT required_fields, layout_metadata FROM document_templates WHERE document_type = ?"), (document_type,))
-    template_row = cursor.fetchone()
-    template_info = dict(template_row) if template_row else None
-
-    cursor.execute(format_query("SELECT registry_id FROM document_registry WHERE citizen_id = ? AND document_type = ?"), 
-                   (citizen_id, document_type))
-    registry_record = cursor.fetchone()
-    registry_match_found = True if registry_record else False
-    conn.close()
+    """
+    Store the uploaded documents and queue them for AI verification.
 
-    total_confidence = 0
+    Returns immediately with the application_id; the application moves
+    through queued -> processing -> pending as a worker scores it.
+    """
+    stored_documents = []
+    application_id = generate_id("APP")
     best_encoded = ""
-    combined_authenticity = "authentic"
 
-    # Process files
     for f in file:
-        doc_id = f"DOC-{uuid.uuid4().hex[:8].upper()}"
+        doc_id = generate_id("DOC")
         file_bytes = await f.read()
         
         # Base64 for preview
@@ -944,110 +1124,49 @@ async def upload_documents(
             best_encoded = encoded
             
         mime_type = f.content_type or "application/octet-stream"
-        data_url = f"data:{mime_type};base64,{encoded}"
-        
-        # Real AI Processing 
-        ai_service = get_ai_service()
-        ai_result = ai_service.predict(file_bytes)
-        
-        ai_confidence = ai_result.get("confidence", 0)
-        authenticity = ai_result.get("verdict", ai_result.get("authenticity", "suspicious"))
-        
-        if authenticity != "authentic":
-            combined_authenticity = authenticity
-
-        # Template Alignment Logic
-        template_feedback = ""
-        similarity_metrics = {
-            "layout": f"{random.randint(90, 98)}%",
-            "logo": f"{random.randint(92, 99)}%",
-            "seal": f"{random.randint(88, 96)}%",
-            "fonts": f"{random.randint(85, 95)}%"
-        }
-
-        if template_info:
-            template_feedback = f"Standard {document_type} layout detected. Elements align with template."
-        else:
-            template_feedback = "No standard template available for this document type."
-
-        if registry_match_found and authenticity == "authentic":
-            ai_confidence = min(100, ai_confidence + 5)
-            template_feedback += " Matched with official registry record."
-            similarity_metrics["layout"] = "99%"
-        elif registry_match_found:
-            template_feedback = "Template Mismatch: Record exists in registry but uploaded document has irregularities."
-            similarity_metrics["layout"] = "45%"
-
-        quality_score = ai_result.get("quality_score", int(ai_result.get("ai_forensics", {}).get("noise_integrity", 0) * 10))
-        
-        result = {
-            "doc_id": doc_id,
-            "application_id": application_id,
-            "filename": f.filename,
-            "document_type": document_type,
-            "confidence": ai_confidence,
-            "authenticity": authenticity,
-            "quality_score": quality_score,
-            "similarity_metrics": similarity_metrics,
-            "feedback": [template_feedback, f"Forensic Integrity: {ai_result.get('ai_forensics', {}).get('noise_integrity', 0):.2f}"]
-        }
-
         stored_documents.append({
             "doc_id": doc_id,
             "name": f.filename,
             "type": mime_type,
             "size": len(file_bytes),
-            "data": data_url
+            "data": f"data:{mime_type};base64,{encoded}"
         })
-        results.append(result)
-        total_confidence += ai_confidence
 
-    avg_confidence = total_confidence / len(file) if file else 0
-    
-    # Save to DB
-    feedback_text = f"AI Processing complete: {combined_authenticity.upper()} with {avg_confidence}% average confidence."
     created_at = datetime.utcnow().isoformat()
-    priority = "high" if combined_authenticity != "authentic" else "normal"
+    job_id, job_statements = enqueue_statements(application_id)
     
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute(format_query('''
+    # Application row and job are committed together
+    await execute_write([(f'''
     INSERT INTO applications (
         application_id, citizen_name, citizen_email, citizen_id,
         account_id, citizen_phone, description, document_type, status,
-        created_at, priority, ai_confidence, ai_verdict,
-        ai_results, documents, feedback, document_base64
-    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    '''), (
+        created_at, priority, ai_results, documents, feedback, document_base64, updated_at
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, {json_placeholder()}, {json_placeholder()}, ?, ?, ?)
+    ''', (
         application_id, citizen_name, citizen_email, citizen_id,
-        account_id, citizen_phone, description, document_type, "pending",
-        created_at, priority, avg_confidence, combined_authenticity,
-        json.dumps(results), json.dumps(stored_documents), feedback_text, best_encoded
-    ))
-    conn.commit()
-    conn.close()
+        account_id, citizen_phone, description, document_type, "queued",
+        created_at, "normal", encode_json([]), encode_json(stored_documents),
+        "Queued for AI verification.", best_encoded, created_at
+    ))] + job_statements + [application_change(application_id)])
+    change_bus.notify()
 
     return SuccessResponse(
-        message="Document uploaded and verified by AI engine",
+        message="Documents uploaded and queued for AI verification",
         data={
             "application_id": application_id,
-            "results": results
+            "job_id": job_id,
+            "status": "queued"
         }
     )
 
 @router.post("/document-request", response_model=SuccessResponse)
 async def request_document(request: DocumentRequest):
     """Create a new document request in SQLite"""
-    request_id = f"DOCREQ-{datetime.utcnow().year}-{str(uuid.uuid4().hex[:8]).upper()}"
+    request_id = generate_id(f"DOCREQ-{datetime.utcnow().year}")
     requested_at = request.requested_at or datetime.utcnow().isoformat()
     
-    conn = get_db_connection()
-    cursor = get_db_cursor(conn)
-    
     # Check if document exists in registry
-    cursor.execute(format_query("SELECT registry_id FROM document_registry WHERE citizen_id = ? AND document_type = ?"), 
-                   (request.citizen_id, request.document_type))
-    registry_match = cursor.fetchone()
+    registry_match = registry_cache.get(request.citizen_id, request.document_type)
     
     initial_status = "pending"
     remarks = ""
@@ -1058,19 +1177,19 @@ async def request_document(request: DocumentRequest):
     else:
         remarks = "System: No matching record found in primary registry. Manual search required."
 
-    cursor.execute(format_query('''
+    await execute_write([('''
     INSERT INTO document_requests (
         request_id, document_type, citizen_name, citizen_id, account_id,
         citizen_phone, reason, status, requested_at, updated_at, remarks
     ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    '''), (
+    ''', (
         request_id, request.document_type, request.citizen_name,
         request.citizen_id, request.account_id, request.citizen_phone, 
         request.reason or "No reason specified",
         initial_status, requested_at, requested_at, remarks
-    ))
-    conn.commit()
-    conn.close()
+    )), document_request_change(request_id)])
+    document_requests_queue.set_status(request.document_type, request_id, requested_at, initial_status)
+    change_bus.notify()
     
     return SuccessResponse(
         message="Document request submitted successfully",
@@ -1083,15 +1202,26 @@ async def request_document(request: DocumentRequest):
         }
     )
 
-@router.get("/document-requests", response_model=PaginatedResponse)
+@router.get("/document-requests", response_model=SyncPaginatedResponse)
 async def list_document_requests(
+    request: Request,
     citizen_id: Optional[str] = Query(None),
     account_id: Optional[str] = Query(None),
     status: Optional[str] = Query(None),
+    since_seq: Optional[int] = Query(None, ge=0, description="Only rows changed after this next_seq from a previous response"),
+    updated_since: Optional[str] = Query(None, description="Only rows with updated_at after this ISO timestamp"),
     page: int = Query(1, ge=1),
     per_page: int = Query(10, ge=1, le=100)
 ):
     """List document requests from SQLite"""
+    validators = list_validators("document_request")
+    cached = not_modified(request, validators)
+    if cached:
+        return cached
+
+    refresh_queue_indexes()
+
+    next_seq = start_sync(since_seq, updated_since)
     conn = get_db_connection()
     cursor = get_db_cursor(conn)
     
@@ -1108,6 +1238,10 @@ async def list_document_requests(
     if status:
         conditions.append("status = ?")
         params.append(status)
+    sync, sync_params = sync_condition("document_request", "request_id", since_seq, updated_since)
+    if sync:
+        conditions.append(sync)
+        params.extend(sync_params)
         
     if conditions:
         query += " WHERE " + " AND ".join(conditions)
@@ -1116,33 +1250,30 @@ async def list_document_requests(
     
     cursor.execute(format_query(query), params)
     rows = cursor.fetchall()
+    conn.close()
+    
+    total = len(rows)
+    start = (page - 1) * per_page
+    end = start + per_page
     
     requests_list = []
-    for row in rows:
+    for row in rows[start:end]:
         req = dict(row)
-        # Calculate queue position for pending requests of the same type
+        # Queue position for pending requests of the same type
         if req.get("status") == "pending":
-            doc_type = req.get("document_type")
-            cursor.execute(format_query("SELECT COUNT(*) FROM document_requests WHERE status = 'pending' AND document_type = ? AND requested_at < ?"), (doc_type, req['requested_at']))
-            result = cursor.fetchone()
-            count = result[0] if isinstance(result, (tuple, list, sqlite3.Row)) else list(result.values())[0]
-            req["queue_position"] = count + 1
+            req["queue_position"] = document_requests_queue.position(req.get("document_type"), req['requested_at'])
         else:
             req["queue_position"] = 0
         requests_list.append(req)
-        
-    conn.close()
-    
-    total = len(requests_list)
-    start = (page - 1) * per_page
-    end = start + per_page
     
-    return PaginatedResponse(
+    return with_validators(FastJSONResponse(SyncPaginatedResponse.model_construct(
         total=total,
         page=page,
         per_page=per_page,
-        data=requests_list[start:end]
-    )
+        data=requests_list,
+        next_seq=next_seq,
+        deleted=[]
+    )), validators)
 
 @router.get("/document-requests/{request_id}")
 async def get_document_request(request_id: str):
@@ -1151,21 +1282,18 @@ async def get_document_request(request_id: str):
     cursor = get_db_cursor(conn)
     cursor.execute(format_query("SELECT * FROM document_requests WHERE request_id = ?"), (request_id,))
     row = cursor.fetchone()
+    conn.close()
     
     if not row:
-        conn.close()
         raise HTTPException(status_code=404, detail="Document request not found")
     
     request_data = dict(row)
     
     # Check if official record exists
-    cursor.execute(format_query("SELECT * FROM document_registry WHERE citizen_id = ? AND document_type = ?"), 
-                   (request_data['citizen_id'], request_data['document_type']))
-    registry_row = cursor.fetchone()
+    registry_row = registry_cache.get(request_data['citizen_id'], request_data['document_type'])
     if registry_row:
-        request_data['registry_record'] = dict(registry_row)
+        request_data['registry_record'] = registry_row
         
-    conn.close()
     return SuccessResponse(message="Document request retrieved", data=request_data)
 
 @router.put("/document-requests/{request_id}", response_model=SuccessResponse)
@@ -1181,24 +1309,29 @@ async def update_document_request(request_id: str, status: str = Query(...), rem
         conn.close()
         raise HTTPException(status_code=404, detail="Document request not found")
         
+    req = dict(req)
+    conn.close()
+        
     updated_at = datetime.utcnow().isoformat()
-    cursor.execute(format_query("UPDATE document_requests SET status = ?, remarks = ?, updated_at = ? WHERE request_id = ?"), 
-                   (status, remarks, updated_at, request_id))
+    statements = [("UPDATE document_requests SET status = ?, remarks = ?, updated_at = ? WHERE request_id = ?", 
+                   (status, remarks, updated_at, request_id))]
     
     # If approved, save to issued_documents
     if status in ['approved', 'sent']:
-        issue_id = f"ISS-{uuid.uuid4().hex[:8].upper()}"
-        cursor.execute(format_query("""
+        issue_id = generate_id("ISS")
+        statements.append(("""
             INSERT INTO issued_documents (issue_id, reference_id, citizen_id, document_type, officer_notes, issued_at, file_url)
             VALUES (?, ?, ?, ?, ?, ?, ?)
-        """), (issue_id, request_id, req['citizen_id'], req['document_type'], remarks or req.get('remarks', ''), updated_at, f"/downloads/requests/{request_id}"))
+        """, (issue_id, request_id, req['citizen_id'], req['document_type'], remarks or req.get('remarks', ''), updated_at, f"/downloads/requests/{request_id}")))
 
-    conn.commit()
-    conn.close()
+    statements.append(document_request_change(request_id))
+    await execute_write(statements)
+    document_requests_queue.set_status(req['document_type'], request_id, req['requested_at'], status)
+    change_bus.notify()
     
     return SuccessResponse(message=f"Document request updated to {status}")
 
-@router.get("/document-requests/{request_id}/download")
+@router.get("/document-requests/{request_id}/download", dependencies=[Depends(admission("certificate"))])
 async def download_requested_document(request_id: str):
     """
     Logic: 
@@ -1266,7 +1399,7 @@ async def download_requested_document(request_id: str):
                         "filename": f"{req['document_type']}_{req['citizen_id']}.{ext}"
                     }
         except Exception as e:
-            print(f"File reading error: {e}")
+            logger.error("File reading error: %s", e)
 
     # Fallback Generation: This is the critical fix for the "Not Found" error
     # If we get here, it means the registry search above found nothing OR the file was missing.
@@ -1275,7 +1408,7 @@ async def download_requested_document(request_id: str):
         cert_data_url = await generate_certificate_image(
             req['citizen_name'] or "Citizen", 
             req['document_type'], 
-            f"REG-{request_id[:8].upper()}"
+            f"REG-{request_id[-8:].upper()}"
         )
         return {
             "status": "success",
@@ -1320,15 +1453,17 @@ async def generate_certificate_image(citizen_name, doc_type, registry_id):
     img_str = base64.b64encode(buffered.getvalue()).decode()
     return f"data:image/png;base64,{img_str}"
 
-@router.get("/applications/{application_id}/download")
+@router.get("/applications/{application_id}/download", dependencies=[Depends(admission("certificate"))])
 async def download_application_document(application_id: str):
     """Download the document that was uploaded and verified"""
     conn = get_db_connection()
     cursor = get_db_cursor(conn)
-    cursor.execute(format_query("SELECT citizen_name, document_type, documents, status FROM applications WHERE application_id = ?"), (application_id,))
+    cursor.execute(format_query(f"SELECT citizen_name, document_type, {json_select('documents')}, status FROM applications WHERE application_id = ?"), (application_id,))
     app = cursor.fetchone()
     conn.close()
     
+    if not app:
+        app = await asyncio.to_thread(archived_application, application_id)
     if not app:
         raise HTTPException(status_code=404, detail="Application not found")
         
@@ -1338,7 +1473,7 @@ async def download_application_document(application_id: str):
     docs_json = app['documents']
     if docs_json:
         try:
-            docs = json.loads(docs_json)
+            docs = decode_json(docs_json, [])
             if docs and len(docs) > 0:
                 doc = docs[0]
                 return {
@@ -1354,7 +1489,7 @@ async def download_application_document(application_id: str):
         cert_data_url = await generate_certificate_image(
             app['citizen_name'], 
             f"Verified {app['document_type']}", 
-            f"VER-{application_id[:8].upper()}"
+            f"VER-{application_id[-8:].upper()}"
         )
         return {
             "status": "success",
@@ -1365,18 +1500,22 @@ async def download_application_document(application_id: str):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Generation failed: {str(e)}")
 
-@router.post("/ai-process", response_model=SuccessResponse)
+@router.post("/ai-process", response_model=SuccessResponse, dependencies=[Depends(admission("ai-process"))])
 async def process_with_ai(
     application_id: str = Query(...),
-    file: UploadFile = File(...)
+    file: UploadFile = File(...),
+    document_type: Optional[str] = Query(None, description="Picks the model (see model_router.py) and groups the prediction for drift monitoring")
 ):
     """Process document with AI model"""
-    process_id = f"PROC-{uuid.uuid4().hex[:8].upper()}"
+    process_id = generate_id("PROC")
     file_bytes = await file.read()
     
-    # Real AI Inference
+    # Real AI Inference, off the event loop so admitted requests run side by side
     ai_service = get_ai_service()
-    ai_result = ai_service.predict(file_bytes)
+    ai_result = await asyncio.to_thread(ai_service.predict, file_bytes, None, document_type)
+    drift_monitor.observe(document_type, ai_result)
+    shadow_sample(application_id, document_type, ai_result)
+    record_prediction(application_id, ai_result, document_type)
     
     result = {
         "process_id": process_id,
@@ -1424,6 +1563,114 @@ async def get_appeals_statistics():
         }
     )
 
+@router.get("/statistics/queues")
+async def get_queue_statistics():
+    """Get pending queue lengths per document type from the in-process queue index"""
+    refresh_queue_indexes()
+    return SuccessResponse(
+        message="Queue statistics retrieved",
+        data={
+            "applications": applications_queue.lengths(),
+            "document_requests": document_requests_queue.lengths()
+        }
+    )
+
+# ==================== CHANGE STREAM ====================
+
+@router.get("/events/stream")
+async def stream_events(
+    request: Request,
+    account_id: Optional[str] = Query(None),
+    stage: Optional[str] = Query(None),
+    last_event_id: Optional[int] = Query(None),
+    last_event_id_header: Optional[str] = Header(None, alias="Last-Event-ID")
+):
+    """
+    Server-sent events for application and document request changes.
+
+    Citizens pass account_id and receive their own changes and queue
+    positions; officers pass stage. Reconnecting clients resume after
+    Last-Event-ID.
+    """
+    if last_event_id_header and last_event_id_header.isdigit():
+        last_event_id = int(last_event_id_header)
+    stream = EventStream(request, account_id, stage, last_event_id)
+    return StreamingResponse(
+        stream.messages(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.get("/statistics/jobs")
+async def get_job_statistics():
+    """Get verification job counts per status"""
+    return SuccessResponse(
+        message="Job statistics retrieved",
+        data=job_counts()
+    )
+
+@router.get("/statistics/drift")
+async def get_drift_statistics():
+    """Get PSI/KS drift of live features and confidence against the baseline, per document type"""
+    return SuccessResponse(
+        message="Drift statistics retrieved",
+        data=await asyncio.to_thread(drift_monitor.summary)
+    )
+
+@router.get("/statistics/shadow")
+async def get_shadow_statistics(candidate: Optional[str] = Query(None, description="Candidate model version (default: latest)")):
+    """Get agreement of the shadow candidate model with live verdicts"""
+    return SuccessResponse(
+        message="Shadow evaluation retrieved",
+        data=await asyncio.to_thread(shadow_summary, candidate)
+    )
+
+@router.get("/metrics")
+async def get_metrics():
+    """Get this worker's in-process metrics, cache, admission and SQL statistics"""
+    return SuccessResponse(
+        message="Metrics retrieved",
+        data={
+            "caches": cache_stats(),
+            "admission": admission_stats(),
+            "db": query_stats(),
+            **metrics.snapshot()
+        }
+    )
+
+# ==================== ADMIN ENDPOINTS ====================
+
+def require_profile_token(x_profile_token: Optional[str]):
+    if not token_matches(x_profile_token):
+        raise HTTPException(status_code=403, detail="A valid X-Profile-Token header is required")
+
+@router.get("/admin/profiles")
+async def get_profiles(x_profile_token: Optional[str] = Header(None)):
+    """List request profiles recorded by this host, newest first"""
+    require_profile_token(x_profile_token)
+    profiles = await asyncio.to_thread(list_profiles)
+    return SuccessResponse(message="Profiles retrieved", data={"profiles": profiles})
+
+@router.get("/admin/profiles/{profile_id}")
+async def get_profile(
+    profile_id: str,
+    format: str = Query("collapsed", pattern="^(collapsed|speedscope)$"),
+    x_profile_token: Optional[str] = Header(None)
+):
+    """Download a request profile as collapsed stacks or speedscope JSON"""
+    require_profile_token(x_profile_token)
+    profile = await asyncio.to_thread(load_profile, profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    collapsed, meta = profile
+    if format == "speedscope":
+        return JSONResponse(
+            to_speedscope(profile_id, collapsed, meta.get("interval_ms", settings.profile_interval_ms)),
+            headers={"Content-Disposition": f'attachment; filename="{profile_id}.speedscope.json"'}
+        )
+    return Response(content=collapsed, media_type="text/plain",
+                    headers={"Content-Disposition": f'attachment; filename="{profile_id}.collapsed"'})
+
 @router.get("/statistics/verifications")
 async def get_verification_statistics():
     """Get verification statistics"""
@@ -1437,10 +1684,17 @@ async def get_verification_statistics():
 
 @router.get("/issued-documents", response_model=PaginatedResponse)
 async def list_issued_documents(
+    request: Request,
     page: int = Query(1, ge=1),
     per_page: int = Query(10, ge=1, le=100)
 ):
     """List all documents issued/sent by officers"""
+    # Documents are issued in the same write as an application or request change
+    validators = list_validators("application", "document_request")
+    cached = not_modified(request, validators)
+    if cached:
+        return cached
+
     conn = get_db_connection()
     cursor = get_db_cursor(conn)
     
@@ -1453,12 +1707,12 @@ async def list_issued_documents(
     start = (page - 1) * per_page
     end = start + per_page
     
-    return PaginatedResponse(
+    return with_validators(FastJSONResponse(PaginatedResponse.model_construct(
         total=total,
         page=page,
         per_page=per_page,
         data=data[start:end]
-    )
+    )), validators)
 
 @router.post("/prompt-analysis")
 async def prompt_ai_analysis(data: dict):
@@ -1484,11 +1738,7 @@ async def prompt_ai_analysis(data: dict):
     similarity_metrics = None
     if is_similarity:
         # Fetch template metadata if available
-        conn = get_db_connection()
-        cursor = get_db_cursor(conn)
-        cursor.execute(format_query("SELECT layout_metadata FROM document_templates WHERE document_type = ?"), (service_type,))
-        template = cursor.fetchone()
-        conn.close()
+        template = template_cache.get(service_type)
         
         # Simulated metrics based on template match logic
         similarity_metrics = {
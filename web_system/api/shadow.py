@@ -0,0 +1,206 @@
+"""
+Shadow evaluation of a candidate model on live traffic
+
+With ``SHADOW_MODEL_DIR`` pointing at a model bundle (laid out like the
+per-type bundles of model_router.py), a ``SHADOW_SAMPLE_RATE`` sample of
+the documents scored by verification workers (uploads) and
+``/api/ai-process`` is scored again by the candidate. Citizens only ever
+get the live verdict.
+
+The request path only draws the sample and puts the already extracted
+features on a bounded queue (``SHADOW_QUEUE_SIZE``) without waiting; when
+the queue is full the document is dropped and counted in
+``shadow_dropped``. A background thread loads the candidate on first use,
+scores queued documents in batches of up to ``SHADOW_BATCH_SIZE`` with the
+same blur rule as the live model and ``SHADOW_CONFIDENCE_THRESHOLD``, and
+writes one ``shadow_results`` row per document: both verdicts and
+confidences, the model versions and the candidate's time per document.
+
+``GET /api/statistics/shadow`` reports agreement, verdict confusion,
+confidence shift and candidate latency per document type; live model
+latency is in ``model_predict_seconds`` of ``GET /api/metrics``.
+"""
+
+import logging
+import queue
+import random
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Optional
+
+from config import settings
+from database import get_db_connection, get_db_cursor, format_query, execute_write_sync
+from metrics import metrics
+from model_router import RETRY_FAILED_SECONDS, ModelBundle, load_bundle
+from utils import bypass_blur, model_features
+
+logger = logging.getLogger(__name__)
+
+SHADOW = "shadow"
+
+
+def create_shadow_tables(cursor):
+    """Create the shadow result table (same DDL on both backends)"""
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS shadow_results (
+        application_id TEXT,
+        document_type TEXT,
+        live_model_version TEXT,
+        candidate_version TEXT,
+        live_verdict TEXT,
+        candidate_verdict TEXT,
+        live_confidence FLOAT,
+        candidate_confidence FLOAT,
+        candidate_ms FLOAT,
+        created_at TEXT
+    )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_shadow_results_candidate ON shadow_results (candidate_version, created_at)")
+
+
+class ShadowItem(NamedTuple):
+    application_id: str
+    document_type: Optional[str]
+    features: Dict
+    live_verdict: str
+    live_confidence: Optional[float]
+    live_model_version: Optional[str]
+    submitted_at: float
+
+
+class ShadowEvaluator:
+    """Bounded queue of sampled documents, scored by the candidate on a background thread"""
+
+    def __init__(self, model_dir: str, queue_size: int, batch_size: int):
+        self.model_dir = model_dir
+        self.batch_size = max(1, batch_size)
+        self._queue: "queue.Queue[ShadowItem]" = queue.Queue(maxsize=max(1, queue_size))
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._candidate: Optional[ModelBundle] = None
+        self._failed_at: Optional[float] = None
+
+    def submit(self, item: ShadowItem):
+        """Queue a document for the candidate; drops it rather than wait"""
+        with self._lock:
+            # Started on first use, so forked workers each run their own
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="shadow-evaluator", daemon=True)
+                self._thread.start()
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            metrics.inc("shadow_dropped")
+
+    def _load_candidate(self) -> Optional[ModelBundle]:
+        if self._candidate is None and (
+            self._failed_at is None or time.monotonic() - self._failed_at >= RETRY_FAILED_SECONDS
+        ):
+            try:
+                self._candidate = load_bundle(SHADOW, self.model_dir)
+                logger.info("Shadow candidate %s loaded from %s", self._candidate.version, self.model_dir)
+            except Exception as e:
+                self._failed_at = time.monotonic()
+                metrics.inc("shadow_errors")
+                logger.error("Could not load shadow candidate from %s: %s", self.model_dir, e)
+        return self._candidate
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._evaluate(batch)
+            except Exception as e:
+                metrics.inc("shadow_errors")
+                logger.error("Shadow evaluation of %d documents failed: %s", len(batch), e)
+
+    def _evaluate(self, batch: List[ShadowItem]):
+        candidate = self._load_candidate()
+        if candidate is None:
+            metrics.inc("shadow_dropped", len(batch))
+            return
+        started = time.perf_counter()
+        confidences = candidate.predict(model_features([item.features for item in batch]))
+        candidate_ms = (time.perf_counter() - started) * 1000 / len(batch)
+        metrics.observe("shadow_candidate_ms", candidate_ms)
+
+        now = datetime.utcnow().isoformat()
+        statements = []
+        for item, confidence in zip(batch, confidences):
+            confidence = bypass_blur(float(confidence), item.features)
+            verdict = "authentic" if confidence >= settings.shadow_confidence_threshold else "fraudulent"
+            metrics.inc("shadow_evaluations", agree=str(verdict == item.live_verdict).lower())
+            metrics.observe("shadow_lag_seconds", time.monotonic() - item.submitted_at)
+            statements.append((
+                "INSERT INTO shadow_results (application_id, document_type, live_model_version, candidate_version, "
+                "live_verdict, candidate_verdict, live_confidence, candidate_confidence, candidate_ms, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (item.application_id, item.document_type, item.live_model_version, candidate.version,
+                 item.live_verdict, verdict, item.live_confidence, confidence, candidate_ms, now)
+            ))
+        execute_write_sync(statements)
+
+
+shadow_evaluator = ShadowEvaluator(settings.shadow_model_dir, settings.shadow_queue_size, settings.shadow_batch_size)
+
+
+def shadow_sample(application_id: str, document_type: Optional[str], ai_result: Dict):
+    """Hand a sample of scored documents to the candidate (call before ``record_prediction`` takes the features)"""
+    if not settings.shadow_model_dir or random.random() >= settings.shadow_sample_rate:
+        return
+    features = ai_result.get("features")
+    if not features or "verdict" not in ai_result:
+        return
+    shadow_evaluator.submit(ShadowItem(
+        application_id, document_type, features, ai_result["verdict"], ai_result.get("prediction"),
+        ai_result.get("model_version"), time.monotonic()
+    ))
+
+
+def shadow_summary(candidate_version: Optional[str] = None) -> Dict:
+    """Agreement of a candidate (default: the latest evaluated) with the live verdicts"""
+    conn = get_db_connection()
+    cursor = get_db_cursor(conn)
+    if candidate_version is None:
+        cursor.execute("SELECT candidate_version FROM shadow_results ORDER BY created_at DESC LIMIT 1")
+        row = cursor.fetchone()
+        candidate_version = row["candidate_version"] if row else None
+
+    cursor.execute(format_query(
+        "SELECT document_type, COUNT(*) AS evaluated, "
+        "SUM(CASE WHEN live_verdict = candidate_verdict THEN 1 ELSE 0 END) AS agreed, "
+        "AVG(candidate_confidence - live_confidence) AS confidence_shift, AVG(candidate_ms) AS candidate_ms "
+        "FROM shadow_results WHERE candidate_version = ? GROUP BY document_type"
+    ), (candidate_version,))
+    by_type = {}
+    for row in cursor.fetchall():
+        by_type[row["document_type"] or "unknown"] = {
+            "evaluated": row["evaluated"],
+            "agreement": round(row["agreed"] / row["evaluated"], 4),
+            "confidence_shift": round(float(row["confidence_shift"] or 0), 4),
+            "candidate_ms": round(float(row["candidate_ms"] or 0), 3),
+        }
+    cursor.execute(format_query(
+        "SELECT live_verdict, candidate_verdict, COUNT(*) AS n FROM shadow_results "
+        "WHERE candidate_version = ? GROUP BY live_verdict, candidate_verdict"
+    ), (candidate_version,))
+    confusion = {f"{row['live_verdict']} -> {row['candidate_verdict']}": row["n"] for row in cursor.fetchall()}
+    conn.close()
+
+    evaluated = sum(entry["evaluated"] for entry in by_type.values())
+    agreed = sum(n for key, n in confusion.items() if key.split(" -> ")[0] == key.split(" -> ")[1])
+    return {
+        "candidate_version": candidate_version,
+        "enabled": bool(settings.shadow_model_dir),
+        "sample_rate": settings.shadow_sample_rate,
+        "evaluated": evaluated,
+        "agreement": round(agreed / evaluated, 4) if evaluated else None,
+        "confusion": confusion,
+        "document_types": by_type,
+    }
@@ -0,0 +1,198 @@
+"""
+CPU thread budget for iRembo Backend API
+
+TensorFlow (intra- and inter-op pools), OpenCV and the BLAS behind NumPy each
+size their thread pools to every core of the machine. With several API
+workers, a verification worker and possibly the inference server on one box,
+that is several times more busy threads than cores, and ``AIService.predict``
+latency suffers most at the tail.
+
+``apply_thread_budget()`` runs at the start of every process that scores
+documents (main.py, worker.py, inference_server.py, rescore.py), before NumPy,
+OpenCV or TensorFlow are loaded (rescore.py also wraps its extraction pool
+in ``child_thread_env`` so each pool process gets its share). It splits the usable cores (``CPU_CORES``,
+default: the cores this process may run on) between the processes sharing
+the box (``CPU_PROCESSES``, default: ``API_WORKERS``/``WEB_CONCURRENCY``, plus
+the verification worker when the API starts it, plus the inference server in
+remote mode) and gives each process ``CPU_THREADS_PER_PROCESS`` threads
+(default: its share, at least 1):
+
+- BLAS/OpenMP through ``OMP_NUM_THREADS``, ``OPENBLAS_NUM_THREADS``, ... and,
+  when threadpoolctl is installed, also for a BLAS that is already loaded
+- ``cv2.setNumThreads``
+- TensorFlow through ``TF_NUM_INTRAOP_THREADS`` (inter-op: 1) and
+  ``configure_tensorflow()`` right after TensorFlow is imported
+
+Variables already set in the environment are left alone, so an explicit
+``OMP_NUM_THREADS`` still wins.
+
+With ``CPU_AFFINITY`` on, each process also claims a slot (a lock file in
+``CPU_SLOT_DIR``, released when it exits) and is pinned to that slot's slice
+of the cores. A process that finds every slot taken runs unpinned.
+
+``cpu_thread_budget`` and ``cpu_pinned_cores`` gauges report the outcome.
+``benchmarks/bench_thread_budget.py`` compares prediction latency with and
+without the budget.
+"""
+
+import logging
+import os
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from config import settings
+from metrics import metrics
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+try:
+    from threadpoolctl import threadpool_limits
+except ImportError:  # pragma: no cover - optional dependency
+    threadpool_limits = None
+
+logger = logging.getLogger(__name__)
+
+# Read by OpenBLAS, MKL, BLIS, Accelerate, numexpr and OpenMP when they load
+BLAS_THREAD_VARIABLES = (
+    "OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS",
+    "BLIS_NUM_THREADS", "VECLIB_MAXIMUM_THREADS", "NUMEXPR_NUM_THREADS",
+)
+
+_budget: Optional[Dict] = None
+_slot_file = None
+_tensorflow_configured = False
+
+
+def parse_cores(value: str) -> List[int]:
+    """Core IDs of a list like ``0-3,8,10-11``"""
+    cores = []
+    for part in value.replace(" ", "").split(","):
+        if "-" in part:
+            first, last = part.split("-", 1)
+            cores.extend(range(int(first), int(last) + 1))
+        elif part:
+            cores.append(int(part))
+    return sorted(set(cores))
+
+
+def usable_cores() -> List[int]:
+    if settings.cpu_cores:
+        return parse_cores(settings.cpu_cores)
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))  # pragma: no cover - no affinity API
+
+
+def cpu_processes() -> int:
+    """Processes sharing the cores, from the deployment settings unless ``CPU_PROCESSES`` is set"""
+    if settings.cpu_processes > 0:
+        return settings.cpu_processes
+    processes = max(1, settings.api_workers)
+    if settings.verification_worker_autostart:
+        processes += 1
+    if settings.ai_service_mode == "remote":
+        processes += 1
+    return processes
+
+
+def compute_budget(processes: Optional[int] = None) -> Dict:
+    """Threads per process for this deployment (nothing is applied)"""
+    cores = usable_cores()
+    processes = processes or cpu_processes()
+    threads = settings.cpu_threads_per_process or max(1, len(cores) // processes)
+    return {"cores": cores, "processes": processes, "threads": threads, "pinned": []}
+
+
+def _claim_slot(slots: int) -> Optional[int]:
+    """Lock the first free slot file, held until this process exits"""
+    global _slot_file
+    if fcntl is None:  # pragma: no cover - Windows
+        return None
+    os.makedirs(settings.cpu_slot_dir, exist_ok=True)
+    for slot in range(slots):
+        slot_file = open(os.path.join(settings.cpu_slot_dir, f"slot-{slot}.lock"), "w")
+        try:
+            fcntl.flock(slot_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            slot_file.close()
+            continue
+        _slot_file = slot_file
+        return slot
+    return None
+
+
+def _pin(budget: Dict) -> List[int]:
+    cores, threads = budget["cores"], budget["threads"]
+    slot = _claim_slot(max(1, len(cores) // threads))
+    if slot is None or not hasattr(os, "sched_setaffinity"):
+        logger.warning("No free CPU slot in %s; running unpinned", settings.cpu_slot_dir)
+        return []
+    pinned = cores[slot * threads:(slot + 1) * threads]
+    # Processes started from here (the verification worker) split the whole set, not this slice
+    os.environ.setdefault("CPU_CORES", ",".join(str(core) for core in cores))
+    os.sched_setaffinity(0, pinned)
+    return pinned
+
+
+def apply_thread_budget(processes: Optional[int] = None, pin: Optional[bool] = None) -> Dict:
+    """Size BLAS, OpenCV and TensorFlow thread pools (and pin if configured); once per process"""
+    global _budget
+    if _budget is not None:
+        return _budget
+    budget = compute_budget(processes)
+    threads = str(budget["threads"])
+    for name in BLAS_THREAD_VARIABLES:
+        os.environ.setdefault(name, threads)
+    os.environ.setdefault("TF_NUM_INTRAOP_THREADS", threads)
+    os.environ.setdefault("TF_NUM_INTEROP_THREADS", "1")
+
+    if threadpool_limits is not None:
+        # For a BLAS that was loaded before the variables were set
+        threadpool_limits(limits=budget["threads"], user_api="blas")
+    import cv2
+    cv2.setNumThreads(budget["threads"])
+
+    if settings.cpu_affinity if pin is None else pin:
+        budget["pinned"] = _pin(budget)
+    metrics.set("cpu_thread_budget", budget["threads"])
+    metrics.set("cpu_pinned_cores", len(budget["pinned"]))
+    logger.info(
+        "CPU thread budget: %d threads (%d cores, %d processes)%s", budget["threads"], len(budget["cores"]),
+        budget["processes"], f", pinned to cores {budget['pinned']}" if budget["pinned"] else ""
+    )
+    _budget = budget
+    return budget
+
+
+@contextmanager
+def child_thread_env(threads: int):
+    """BLAS and TensorFlow thread variables for processes started inside the block"""
+    names = BLAS_THREAD_VARIABLES + ("TF_NUM_INTRAOP_THREADS",)
+    saved = {name: os.environ.get(name) for name in names}
+    os.environ.update({name: str(threads) for name in names})
+    try:
+        yield
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+
+def configure_tensorflow(tf):
+    """Apply the budget to TensorFlow's pools; call right after importing it"""
+    global _tensorflow_configured
+    if _tensorflow_configured:
+        return
+    _tensorflow_configured = True
+    budget = _budget or compute_budget()
+    try:
+        tf.config.threading.set_intra_op_parallelism_threads(budget["threads"])
+        tf.config.threading.set_inter_op_parallelism_threads(1)
+    except RuntimeError as e:
+        # TensorFlow was initialized already; the environment variables applied then
+        logger.debug("TensorFlow threading left as initialized: %s", e)
@@ -2,23 +2,22 @@
 Utility functions for iRembo Backend API
 """
 
-import uuid
 import os
 from datetime import datetime, timedelta
 from typing import Dict, Any, List, Optional
 import logging
 import cv2
 import numpy as np
-import tensorflow as tf
 import joblib
 from functools import lru_cache
 from config import settings
+from log_pipeline import configure_logging
+import ids
+from model_router import GENERIC, ModelBundle, ModelRouter
+from thread_budget import configure_tensorflow
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# Configure logging (queued JSON output, see log_pipeline.py)
+configure_logging()
 logger = logging.getLogger(__name__)
 
 def generate_id(prefix: str) -> str:
@@ -29,9 +28,9 @@ def generate_id(prefix: str) -> str:
         prefix: ID prefix (e.g., 'APPEAL', 'APP')
     
     Returns:
-        Formatted ID string (e.g., 'APPEAL-a1b2c3d4')
+        Time-sortable ID string (e.g., 'APPEAL-01JAB3K9Q2N4X7V8M5R6T1W0YZ', see ids.py)
     """
-    return f"{prefix}-{uuid.uuid4().hex[:8].upper()}"
+    return ids.generate_id(prefix)
 
 def get_timestamp() -> str:
     """Get current UTC timestamp in ISO format"""
@@ -57,17 +56,14 @@ def format_response(status: str, message: str, data: Dict[str, Any] = None) -> D
     return response
 
 def log_action(action: str, details: Dict[str, Any] = None):
-    """Log an action"""
-    message = f"Action: {action}"
-    if details:
-        message += f" | Details: {details}"
-    logger.info(message)
+    """Log an action; details become fields of the JSON record"""
+    logger.info("Action: %s", action, extra={"action": action, "details": details or {}})
 
 def ensure_upload_dir(upload_dir: str):
     """Ensure upload directory exists"""
     if not os.path.exists(upload_dir):
         os.makedirs(upload_dir)
-        logger.info(f"Created upload directory: {upload_dir}")
+        logger.info("Created upload directory: %s", upload_dir)
 
 def parse_pagination_params(page: int = 1, per_page: int = 10) -> tuple:
     """Parse and validate pagination parameters"""
@@ -101,6 +97,78 @@ def merge_dicts(*dicts) -> Dict:
         result.update(d)
     return result
 
+# Model inputs, in order; the forensic features only feed the verdict rules
+MODEL_FEATURES = (
+    'mean_brightness', 'std_brightness', 'contrast', 'edge_density',
+    'blur_score', 'text_density', 'hist_entropy', 'aspect_ratio'
+)
+
+
+def model_features(raw_details: List[Dict]) -> np.ndarray:
+    """(documents, 8) float32 model input from extracted feature dicts"""
+    return np.array([[feat[name] for name in MODEL_FEATURES] for feat in raw_details], dtype=np.float32)
+
+
+def bypass_blur(confidence: float, raw_details: Dict) -> float:
+    """Blurry photos of genuine documents keep their sensor noise: don't let blur alone reject them"""
+    is_blurry = raw_details['blur_score'] < 100
+    is_digitally_authentic = raw_details.get('forensic_noise', 0) > 5.0
+    if is_blurry and is_digitally_authentic:
+        return max(confidence, 0.85)
+    return confidence
+
+
+def extract_features(file_path_or_bytes, target_size=(224, 224)) -> Optional[tuple]:
+    """Extract features from image (mirrors notebook implementation)
+
+    Module-level so process pools (see rescore.py) can run it.
+    """
+    try:
+        if isinstance(file_path_or_bytes, str):
+            img = cv2.imread(file_path_or_bytes)
+        else:
+            nparr = np.frombuffer(file_path_or_bytes, np.uint8)
+            img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+
+        if img is None:
+            return None
+
+        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        resized = cv2.resize(gray, target_size)
+
+        feat = {
+            'mean_brightness': float(np.mean(resized)),
+            'std_brightness': float(np.std(resized)),
+            'contrast': float(resized.max() - resized.min())
+        }
+
+        edges = cv2.Canny(resized, 100, 200)
+        feat['edge_density'] = float(np.sum(edges > 0) / (target_size[0] * target_size[1]))
+        feat['blur_score'] = float(cv2.Laplacian(resized, cv2.CV_64F).var())
+
+        binary = cv2.threshold(resized, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)[1]
+        feat['text_density'] = float(np.sum(binary > 0) / (target_size[0] * target_size[1]))
+
+        hist = cv2.calcHist([resized], [0], None, [16], [0, 256]).flatten() / (target_size[0] * target_size[1])
+        feat['hist_entropy'] = float(-np.sum(hist * np.log2(hist + 1e-10)))
+        feat['aspect_ratio'] = float(img.shape[1] / img.shape[0])
+
+        # --- UNIQUE AI FORENSIC FEATURES ---
+        laplacian = cv2.Laplacian(resized, cv2.CV_64F)
+        feat['forensic_noise'] = float(np.std(laplacian))
+
+        _, thresh = cv2.threshold(resized, 240, 255, cv2.THRESH_BINARY)
+        feat['glare_index'] = float(np.sum(thresh > 0) / (target_size[0] * target_size[1]))
+
+        # Prep for model
+        features_array = model_features([feat])
+
+        return features_array, feat
+
+    except Exception as e:
+        logger.error("Feature extraction failed: %s", e)
+        return None
+
 class AIService:
     """Service for AI document verification combining Forensics, OCR, and NLP"""
     
@@ -108,22 +176,31 @@ class AIService:
         self.model = None
         self.poly = None
         self.scaler = None
+        self.model_version = settings.model_version or os.path.basename(settings.model_path)
         self._load_resources()
+        generic = None
+        if self.model is not None and self.poly is not None and self.scaler is not None:
+            generic = ModelBundle(GENERIC, self.model_version, self.model, self.poly, self.scaler)
+        # Specialized per-document-type bundles, falling back to the generic model (see model_router.py)
+        self.router = ModelRouter(generic)
 
     def _load_resources(self):
         """Load model and preprocessing objects"""
         try:
             if not os.path.exists(settings.model_path):
-                logger.error(f"Model file not found at {settings.model_path}")
+                logger.error("Model file not found at %s", settings.model_path)
                 return
             
+            # Imported here so processes that use the inference server never load TensorFlow
+            import tensorflow as tf
+            configure_tensorflow(tf)
             self.model = tf.keras.models.load_model(settings.model_path)
             self.poly = joblib.load(settings.poly_path)
             self.scaler = joblib.load(settings.scaler_path)
-            logger.info(f"AI Model loaded from {settings.model_path}")
+            logger.info("AI Model loaded from %s", settings.model_path)
             logger.info("Preprocessing objects (Poly, Scaler) loaded successfully")
         except Exception as e:
-            logger.error(f"Error loading AI resources: {str(e)}")
+            logger.error("Error loading AI resources: %s", e)
 
     def _perform_ocr(self, img_bytes: bytes) -> Dict[str, str]:
         """
@@ -163,87 +240,85 @@ class AIService:
 
     def extract_features(self, file_path_or_bytes, target_size=(224, 224)) -> Optional[tuple]:
         """Extract features from image (mirrors notebook implementation)"""
-        try:
-            if isinstance(file_path_or_bytes, str):
-                img = cv2.imread(file_path_or_bytes)
-            else:
-                nparr = np.frombuffer(file_path_or_bytes, np.uint8)
-                img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-            
-            if img is None:
-                return None
-            
-            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-            resized = cv2.resize(gray, target_size)
-            
-            feat = {
-                'mean_brightness': float(np.mean(resized)),
-                'std_brightness': float(np.std(resized)),
-                'contrast': float(resized.max() - resized.min())
-            }
-            
-            edges = cv2.Canny(resized, 100, 200)
-            feat['edge_density'] = float(np.sum(edges > 0) / (target_size[0] * target_size[1]))
-            feat['blur_score'] = float(cv2.Laplacian(resized, cv2.CV_64F).var())
-            
-            binary = cv2.threshold(resized, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)[1]
-            feat['text_density'] = float(np.sum(binary > 0) / (target_size[0] * target_size[1]))
-            
-            hist = cv2.calcHist([resized], [0], None, [16], [0, 256]).flatten() / (target_size[0] * target_size[1])
-            feat['hist_entropy'] = float(-np.sum(hist * np.log2(hist + 1e-10)))
-            feat['aspect_ratio'] = float(img.shape[1] / img.shape[0])
-            
-            # --- UNIQUE AI FORENSIC FEATURES ---
-            laplacian = cv2.Laplacian(resized, cv2.CV_64F)
-            feat['forensic_noise'] = float(np.std(laplacian))
-            
-            _, thresh = cv2.threshold(resized, 240, 255, cv2.THRESH_BINARY)
-            feat['glare_index'] = float(np.sum(thresh > 0) / (target_size[0] * target_size[1]))
-
-            # Prep for model
-            features_array = np.array([[
-                feat['mean_brightness'], feat['std_brightness'], feat['contrast'],
-                feat['edge_density'], feat['blur_score'], feat['text_density'],
-                feat['hist_entropy'], feat['aspect_ratio']
-            ]], dtype=np.float32)
-            
-            return features_array, feat
-            
-        except Exception as e:
-            logger.error(f"Feature extraction failed: {str(e)}")
-            return None
+        return extract_features(file_path_or_bytes, target_size)
 
-    def predict(self, file_source, user_data: Dict = None) -> Dict[str, Any]:
+    def predict(self, file_source, user_data: Dict = None, document_type: Optional[str] = None) -> Dict[str, Any]:
         """
         Final Unified Decision Engine: Forensics + OCR + NLP
         """
-        user_data = user_data or {"full_name": "JOHN DOE", "id_number": "ID-884-221"}
-        
+        return self.predict_batch([file_source], [user_data], [document_type])[0]
+
+    def predict_batch(self, file_sources: List, user_data: List[Optional[Dict]] = None,
+                      document_types: List[Optional[str]] = None) -> List[Dict[str, Any]]:
+        """Score several documents with one model call per routed model (used by the inference server)"""
+        user_data = user_data or [None] * len(file_sources)
+        document_types = document_types or [None] * len(file_sources)
+
         if self.model is None or self.poly is None or self.scaler is None:
             logger.warning("AI Model resources missing, using simulation")
-            return self._simulate_prediction()
+            return [self._simulate_prediction() for _ in file_sources]
 
-        extraction_result = self.extract_features(file_source)
-        if extraction_result is None:
-            return {"error": "Failed to process image"}
-            
-        features, raw_details = extraction_result
+        results: List[Optional[Dict[str, Any]]] = [None] * len(file_sources)
+        extracted = []
+        for i, file_source in enumerate(file_sources):
+            extraction_result = self.extract_features(file_source)
+            if extraction_result is None:
+                results[i] = {"error": "Failed to process image"}
+            else:
+                extracted.append((i, extraction_result))
+        if not extracted:
+            return results
 
         try:
             # 1. AI AUTHENTICITY PREDICTION
-            features_poly = self.poly.transform(features)
-            features_scaled = self.scaler.transform(features_poly)
-            prediction = self.model.predict(features_scaled, verbose=0)
-            confidence = float(prediction[0][0])
-            
+            scored = self.score_features(
+                np.concatenate([features for _, (features, _) in extracted]),
+                [raw_details for _, (_, raw_details) in extracted],
+                [file_sources[i] for i, _ in extracted],
+                [user_data[i] for i, _ in extracted],
+                document_types=[document_types[i] for i, _ in extracted]
+            )
+        except Exception as e:
+            logger.error("Unified Inference failed: %s", e)
+            for i, _ in extracted:
+                results[i] = self._simulate_prediction()
+            return results
+
+        for (i, _), result in zip(extracted, scored):
+            results[i] = result
+        return results
+
+    def score_features(self, features: np.ndarray, raw_details: List[Dict], file_sources: List = None,
+                       user_data: List[Optional[Dict]] = None, threshold: Optional[float] = None,
+                       document_types: List[Optional[str]] = None) -> List[Dict[str, Any]]:
+        """Verdicts for already extracted features (a (documents, 8) matrix), with one model call per routed model"""
+        count = len(raw_details)
+        file_sources = file_sources or [b""] * count
+        user_data = user_data or [None] * count
+        groups: Dict[str, tuple] = {}
+        for row, document_type in enumerate(document_types or [None] * count):
+            bundle = self.router.route(document_type)
+            groups.setdefault(bundle.name, (bundle, []))[1].append(row)
+
+        results: List[Optional[Dict[str, Any]]] = [None] * count
+        for bundle, rows in groups.values():
+            prediction = bundle.predict(features[rows])
+            for row, confidence in zip(rows, prediction):
+                result = self._unified_verdict(float(confidence), raw_details[row], file_sources[row], user_data[row], threshold)
+                if "verdict" in result:
+                    result["model_version"] = bundle.version
+                results[row] = result
+        return results
+
+    def _unified_verdict(self, confidence: float, raw_details: Dict, file_source, user_data: Optional[Dict],
+                         threshold: Optional[float] = None) -> Dict[str, Any]:
+        """Combine the model confidence with forensics, OCR and NLP checks"""
+        user_data = user_data or {"full_name": "JOHN DOE", "id_number": "ID-884-221"}
+        try:
             # --- BLUR-BYPASS LOGIC ---
             noise_level = raw_details.get('forensic_noise', 0)
             glare_level = raw_details.get('glare_index', 0)
-            is_blurry = raw_details['blur_score'] < 100
-            is_digitally_authentic = noise_level > 5.0
-            
-            if is_blurry and is_digitally_authentic:
-                confidence = max(confidence, 0.85)
+            confidence = bypass_blur(confidence, raw_details)
 
             # 2. OCR TEXT EXTRACTION (Mock for now)
             ocr_text = self._perform_ocr(b"" if isinstance(file_source, str) else file_source)
@@ -252,7 +327,7 @@ class AIService:
             nlp_results = self._apply_nlp_matching(ocr_text, user_data)
             
             # FINAL UNIFIED VERDICT
-            is_authentic = confidence >= settings.confidence_threshold
+            is_authentic = confidence >= (settings.confidence_threshold if threshold is None else threshold)
             is_consistent = nlp_results["total_match_score"] >= 80
             
             verdict = "authentic" if is_authentic else "fraudulent"
@@ -272,10 +347,12 @@ class AIService:
                     "score": nlp_results["total_match_score"],
                     "details": nlp_results["checks"]["name_match"]
                 },
-                "timestamp": datetime.utcnow().isoformat()
+                "timestamp": datetime.utcnow().isoformat(),
+                # Taken out again by feature_store.record_prediction
+                "features": raw_details
             }
         except Exception as e:
-            logger.error(f"Unified Inference failed: {str(e)}")
+            logger.error("Unified Inference failed: %s", e)
             return self._simulate_prediction()
 
     def _simulate_prediction(self):
@@ -295,7 +372,10 @@ class AIService:
 
 @lru_cache()
 def get_ai_service():
-    """Singleton pattern for AI service"""
+    """Singleton pattern for AI service (in-process, or the shared inference server when AI_SERVICE_MODE=remote)"""
+    if settings.ai_service_mode == "remote":
+        from inference_server import RemoteAIService
+        return RemoteAIService()
     return AIService()
 
 class PaginatedList:
@@ -323,6 +403,6 @@ def handle_errors(func):
         try:
             return await func(*args, **kwargs)
         except Exception as e:
-            logger.error(f"Error in {func.__name__}: {str(e)}")
+            logger.error("Error in %s: %s", func.__name__, e)
             raise
     return wrapper